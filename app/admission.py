@@ -0,0 +1,259 @@
+# admission.py
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from app.logging_utils import get_logger
+from app.driver_pool import DRIVER_POOL_MAX
+from app.metrics import observe_phase, register, Histogram
+from app.tenants import Tenant, DEFAULT_TENANT, current_tenant
+
+logger = get_logger(__name__)
+
+TENANT_QUEUE_WAIT = register(Histogram(
+    "lumen_tenant_queue_wait_seconds", "Time requests waited for a browser slot, per API key.", labels=("tenant",)
+))
+
+# Browser runs allowed at once; defaults to the pool size so a burst waits for
+# a browser instead of each request starting (and failing to start) Chrome.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", str(DRIVER_POOL_MAX)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "8"))
+ADMISSION_QUEUE_TIMEOUT_SECS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECS", "120"))
+
+
+class QueueFullError(Exception):
+    """The request was shed; retry after `retry_after` seconds. `quota` names the limit that was hit."""
+
+    # Shedding applies to the caller that was shed, not to others waiting on the same answer.
+    request_scoped = True
+
+    def __init__(self, retry_after: int, message: str = "Server is at capacity", quota: dict = None):
+        self.retry_after = retry_after
+        self.quota = quota
+        super().__init__(message)
+
+
+class _Waiter:
+    def __init__(self, tenant: Tenant, start_tag: float, seq: int):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+        self.tenant = tenant
+        # Virtual start time for weighted fair queueing; lower is served first.
+        self.start_tag = start_tag
+        self.seq = seq
+
+
+class AdmissionController:
+    """
+    Bounds concurrent browser runs with a bounded wait queue shared fairly
+    between API keys.
+
+    Requests beyond `max_concurrency` (or beyond their key's own
+    max_concurrency) wait; once `max_queue` requests are waiting, or the key's
+    own max_queue, new ones are rejected with QueueFullError carrying a
+    Retry-After estimate derived from the average service time.
+
+    Freed slots go to the highest priority class with a runnable waiter and,
+    within it, by start-time fair queueing: each request is tagged with a
+    virtual start time that advances by 1/weight per request of its key, so
+    under contention keys get slots in proportion to their weight and one
+    key's backlog cannot starve the others.
+
+    Args:
+        max_concurrency: browser runs allowed at once
+        max_queue: requests allowed to wait for a slot
+        queue_timeout: longest a request waits before being shed
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._queues = {}        # tenant name -> deque of _Waiter
+        self._tenants = {}       # tenant name -> per-key active count and counters
+        self._last_finish = {}   # tenant name -> virtual finish time of its latest request
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._avg_service_secs = 0.0
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+        # Requests without an API key (resumed jobs, the benchmark) share one unlimited bucket.
+        self._default_tenant = Tenant(DEFAULT_TENANT)
+
+    def check(self, tenant: Tenant = None):
+        """Raises QueueFullError if a new request would be shed right now."""
+        tenant = tenant or current_tenant() or self._default_tenant
+        with self._lock:
+            if not self._has_room(tenant):
+                error = self._shed_error(tenant)
+                if error is not None:
+                    raise error
+
+    def acquire(self, shed: bool = True, timeout: float = None, tenant: Tenant = None) -> Tenant:
+        """
+        Blocks until a slot is free.
+
+        Args:
+            shed: reject immediately when the queue is full; internal callers
+                (jobs, batch items) pass False to wait regardless of queue length
+            timeout: seconds to wait for a slot, defaults to queue_timeout
+            tenant: the requesting key, defaults to the one bound to this request
+
+        Returns:
+            the Tenant the slot was granted to; pass it to release()
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        tenant = tenant or current_tenant() or self._default_tenant
+        with self._lock:
+            state = self._tenant_state(tenant)
+            # Slots are handed out as soon as they free up, so a free slot means
+            # nobody who could use it is waiting.
+            if self._has_room(tenant):
+                self._grant(tenant)
+                return tenant
+            error = self._shed_error(tenant) if shed else None
+            if error is not None:
+                self._counters["rejected"] += 1
+                state["rejected"] += 1
+                raise error
+            start_tag = max(self._virtual_time, self._last_finish.get(tenant.name, 0.0))
+            self._last_finish[tenant.name] = start_tag + 1.0 / tenant.weight
+            waiter = _Waiter(tenant, start_tag, next(self._seq))
+            self._queues.setdefault(tenant.name, deque()).append(waiter)
+            self._queued += 1
+
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.granted:
+                return tenant
+            self._queues[tenant.name].remove(waiter)
+            self._queued -= 1
+            self._counters["timed_out"] += 1
+            state["timed_out"] += 1
+            raise QueueFullError(self._retry_after(tenant), "Timed out waiting for a free browser",
+                                 self._quota(tenant, "queue_timeout"))
+
+    def release(self, service_secs: float = None, tenant: Tenant = None):
+        tenant = tenant or self._default_tenant
+        with self._lock:
+            if service_secs is not None:
+                self._avg_service_secs = service_secs if not self._avg_service_secs else \
+                    0.8 * self._avg_service_secs + 0.2 * service_secs
+            self._active -= 1
+            self._tenants[tenant.name]["active"] -= 1
+            self._grant_next()
+
+    @contextmanager
+    def slot(self, shed: bool = True, timeout: float = None, tenant: Tenant = None):
+        queued_at = time.monotonic()
+        tenant = self.acquire(shed=shed, timeout=timeout, tenant=tenant)
+        started = time.monotonic()
+        observe_phase("queue_wait", started - queued_at)
+        TENANT_QUEUE_WAIT.observe(started - queued_at, tenant=tenant.name)
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started, tenant)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.max_concurrency,
+                "active": self._active,
+                "free": max(0, self.max_concurrency - self._active),
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "saturated": self._active >= self.max_concurrency and self._queued >= self.max_queue,
+                "avg_service_secs": round(self._avg_service_secs, 3),
+                **self._counters,
+                "tenants": {name: {**state, "queued": len(self._queues.get(name, ()))}
+                            for name, state in self._tenants.items()},
+            }
+
+    def _tenant_state(self, tenant: Tenant) -> dict:
+        state = self._tenants.get(tenant.name)
+        if state is None:
+            state = self._tenants[tenant.name] = {"active": 0, "admitted": 0, "rejected": 0, "timed_out": 0}
+        return state
+
+    def _has_room(self, tenant: Tenant) -> bool:
+        if self._active >= self.max_concurrency:
+            return False
+        limit = tenant.max_concurrency
+        return limit is None or self._tenant_state(tenant)["active"] < limit
+
+    def _grant(self, tenant: Tenant):
+        self._active += 1
+        self._counters["admitted"] += 1
+        state = self._tenant_state(tenant)
+        state["active"] += 1
+        state["admitted"] += 1
+
+    def _shed_error(self, tenant: Tenant):
+        """The QueueFullError for a request that would have to wait, or None if it may queue."""
+        queued = len(self._queues.get(tenant.name, ()))
+        if tenant.max_queue is not None and queued >= tenant.max_queue:
+            return QueueFullError(self._retry_after(tenant), "Too many queued requests for this API key",
+                                  self._quota(tenant, "queue"))
+        if self._queued >= self.max_queue:
+            # Name the key's own limit when that, not the server, is what is full.
+            limit = "capacity" if self._active >= self.max_concurrency else "concurrency"
+            return QueueFullError(self._retry_after(tenant), quota=self._quota(tenant, limit))
+        return None
+
+    def _quota(self, tenant: Tenant, limit: str) -> dict:
+        state = self._tenant_state(tenant)
+        return {"tenant": tenant.name, "limit": limit,
+                "max_concurrency": tenant.max_concurrency, "active": state["active"],
+                "max_queue": tenant.max_queue, "queued": len(self._queues.get(tenant.name, ()))}
+
+    def _grant_next(self):
+        while self._queued and self._active < self.max_concurrency:
+            best = None
+            for queue in self._queues.values():
+                if not queue or not self._has_room(queue[0].tenant):
+                    continue
+                head = queue[0]
+                if best is None or (head.tenant.rank, head.start_tag, head.seq) < \
+                        (best.tenant.rank, best.start_tag, best.seq):
+                    best = head
+            if best is None:
+                # Everyone waiting is held back by their own key's concurrency limit.
+                return
+            self._queues[best.tenant.name].popleft()
+            self._queued -= 1
+            self._virtual_time = best.start_tag
+            self._grant(best.tenant)
+            best.granted = True
+            best.event.set()
+
+    def _retry_after(self, tenant: Tenant = None) -> int:
+        """
+        Seconds until a slot is likely free: the queue ahead drains
+        max_concurrency at a time, or the key's own limit if it has one.
+        """
+        service = self._avg_service_secs or 30.0
+        if tenant is not None and tenant.max_concurrency:
+            ahead = len(self._queues.get(tenant.name, ()))
+            return max(1, math.ceil(service * (ahead + 1) / min(tenant.max_concurrency, self.max_concurrency)))
+        return max(1, math.ceil(service * (self._queued + 1) / self.max_concurrency))
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide admission controller, creating it on first use."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
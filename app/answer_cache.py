@@ -0,0 +1,214 @@
+# answer_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.logging_utils import get_logger
+from app.deadline import remaining_budget, check_deadline
+
+logger = get_logger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_SECS = float(os.getenv("ANSWER_CACHE_TTL_SECS", "3600"))
+# Optional on-disk tier that survives restarts; unset keeps the cache in memory only.
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB")
+# "tenant" keeps each API key's answers to itself; "shared" lets keys reuse each
+# other's answers, at the cost of a hit telling a key that another one asked the same.
+ANSWER_CACHE_SCOPE = os.getenv("ANSWER_CACHE_SCOPE", "tenant").lower()
+
+HIT = "hit"
+MISS = "miss"
+SHARED = "shared"  # waited on an identical request that was already running
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Whitespace-insensitive form of a prompt used for cache keys."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+# Bumped whenever the format of stored answers changes, so older entries (in
+# the on-disk tier too) are never served. 2: answers keep their line breaks.
+ANSWER_FORMAT_VERSION = 2
+
+
+def cache_key(prompt: str, tenant: str = None) -> str:
+    """Key of `prompt` for `tenant`; every tenant's key starts with the prompt's digest."""
+    key = f"v{ANSWER_FORMAT_VERSION}:{normalize_prompt(prompt)}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    if tenant is None or ANSWER_CACHE_SCOPE == "shared":
+        return digest
+    return f"{digest}:{tenant}"
+
+
+class _Flight:
+    """An in-progress computation that identical requests wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AnswerCache:
+    """
+    Prompt -> answer cache with an in-memory LRU/TTL tier, an optional SQLite
+    tier, and single-flight deduplication of concurrent identical prompts.
+
+    Args:
+        max_entries: LRU capacity of the memory tier
+        ttl: seconds an answer stays valid (0 disables expiry)
+        db_path: SQLite file for the persistent tier, or None
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL_SECS,
+                 db_path: str = ANSWER_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._counters = {HIT: 0, MISS: 0, SHARED: 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def get(self, prompt: str, tenant: str = None):
+        """Returns the cached answer for `prompt` (as asked by `tenant`), or None."""
+        key = cache_key(prompt, tenant)
+        with self._lock:
+            return self._get(key)
+
+    def set(self, prompt: str, answer: str, tenant: str = None):
+        key = cache_key(prompt, tenant)
+        with self._lock:
+            self._set(key, answer, time.time())
+
+    def get_or_compute(self, prompt: str, compute, cacheable=lambda answer: True, tenant: str = None):
+        """
+        Returns (answer, status) where status is "hit", "miss" or "shared".
+
+        On a miss `compute(prompt)` runs once; concurrent callers with the same
+        normalized prompt (and, unless ANSWER_CACHE_SCOPE is "shared", the
+        same `tenant`) wait for that run and receive its result or its error. When the run failed for reasons scoped to its own request
+        (deadline, shedding), waiting callers try again, one of them leading.
+        Only results accepted by `cacheable` are stored.
+        """
+        key = cache_key(prompt, tenant)
+        while True:
+            with self._lock:
+                answer = self._get(key)
+                if answer is not None:
+                    self._counters[HIT] += 1
+                    return answer, HIT
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+                    self._counters[MISS] += 1
+                    break
+                self._counters[SHARED] += 1
+
+            # Followers give up when their own request deadline runs out.
+            if not flight.done.wait(remaining_budget()):
+                check_deadline("shared_wait")
+                flight.done.wait()
+            if flight.error is None:
+                return flight.result, SHARED
+            # The leader's deadline or shedding is its own; only answer errors are shared.
+            if not getattr(flight.error, "request_scoped", False):
+                raise flight.error
+            logger.info(f"Shared answer failed with {type(flight.error).__name__}; retrying")
+
+        try:
+            flight.result = compute(prompt)
+            if cacheable(flight.result):
+                with self._lock:
+                    self._set(key, flight.result, time.time())
+            return flight.result, MISS
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, prompt: str = None) -> int:
+        """Drops one prompt's entries (for every tenant), or everything when `prompt` is None. Returns the number removed."""
+        with self._lock:
+            if prompt is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                if self._db is not None:
+                    removed = max(removed, self._db.execute("DELETE FROM answers").rowcount)
+                return removed
+            digest = cache_key(prompt)
+            keys = [key for key in self._entries if key == digest or key.startswith(f"{digest}:")]
+            for key in keys:
+                del self._entries[key]
+            removed = len(keys)
+            if self._db is not None:
+                removed = max(removed, self._db.execute(
+                    "DELETE FROM answers WHERE key = ? OR key LIKE ?", (digest, f"{digest}:%")).rowcount)
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "inflight": len(self._inflight),
+                    "persistent": self._db is not None, **self._counters}
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            answer, stored_at = entry
+            if not self._expired(stored_at):
+                self._entries.move_to_end(key)
+                return answer
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute("SELECT answer, stored_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                answer, stored_at = row
+                if not self._expired(stored_at):
+                    self._remember(key, answer, stored_at)
+                    return answer
+                self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+        return None
+
+    def _set(self, key: str, answer: str, stored_at: float):
+        self._remember(key, answer, stored_at)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, stored_at) VALUES (?, ?, ?)",
+                (key, answer, stored_at),
+            )
+
+    def _remember(self, key: str, answer: str, stored_at: float):
+        self._entries[key] = (answer, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Returns the process-wide answer cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
@@ -0,0 +1,252 @@
+# backends.py
+"""
+Where answers come from.
+
+The HTTP, job, batch and stream layers ask the configured AnswerBackend for
+answers, through admission control and the answer cache. ANSWER_BACKEND
+picks it:
+
+- "selenium" (default): the real browser flow in app.selenium_service
+- "fake": an in-process stand-in with configurable latency, streaming and
+  error injection, for load-testing the service without starting browsers
+  (see app.loadgen)
+- "queue" (default when WORK_QUEUE_URL is set): puts the prompt on the
+  shared work queue and waits for a worker process (app.worker) to answer it
+"""
+import math
+import os
+import random
+import threading
+import time
+from app.logging_utils import get_logger
+from app.answer_cache import get_answer_cache
+from app.admission import get_admission_controller, QueueFullError
+from app.metrics import phase_timer, record_outcome
+from app.tracing import start_trace
+from app.deadline import budget, check_deadline, current_deadline
+from app.job_store import WORK_QUEUE_URL, DONE, FAILED
+from app.tenants import current_tenant_name
+
+logger = get_logger(__name__)
+
+ANSWER_BACKEND = os.getenv("ANSWER_BACKEND", "queue" if WORK_QUEUE_URL else "selenium").lower()
+WORK_QUEUE_POLL_SECS = float(os.getenv("WORK_QUEUE_POLL_SECS", "0.1"))
+
+# Fake backend settings. Distributions are "fixed:S", "uniform:A,B", "exp:MEAN"
+# or "lognormal:MEDIAN,SIGMA", in seconds.
+FAKE_FIRST_TOKEN = os.getenv("FAKE_FIRST_TOKEN", "lognormal:0.4,0.5")
+FAKE_LATENCY = os.getenv("FAKE_LATENCY", "lognormal:1.5,0.5")
+FAKE_STREAM_CHUNKS = int(os.getenv("FAKE_STREAM_CHUNKS", "10"))
+FAKE_ANSWER_WORDS = int(os.getenv("FAKE_ANSWER_WORDS", "60"))
+FAKE_ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+# Injected errors pick one of these codes at random (403 looks like a block, 408 like a timeout).
+FAKE_ERROR_CODES = os.getenv("FAKE_ERROR_CODES", "500")
+FAKE_SEED = os.getenv("FAKE_SEED")
+
+
+def answer_error(answer):
+    """
+    Maps the result of a backend to (message, code) if it is an error,
+    or None for a real answer.
+    """
+    if isinstance(answer, dict):
+        return answer.get("message") or f"Upstream error {answer.get('code')}", answer.get("code") or 500
+    if isinstance(answer, str) and answer.startswith("Error:"):
+        return answer, 500
+    return None
+
+
+def parse_distribution(spec: str):
+    """
+    Returns a sampler for a latency distribution spec such as "lognormal:1.5,0.5".
+
+    Raises:
+        ValueError: for an unknown kind or wrong number of parameters
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Invalid latency distribution {spec!r}")
+
+
+class AnswerBackend:
+    """Produces the answer to one prompt. Admission and caching happen around it."""
+
+    name = "base"
+    # False lets start-up skip browser warm-up and the resource governor.
+    uses_browsers = False
+
+    def answer(self, prompt: str, on_progress=None):
+        """
+        Args:
+            prompt: the prompt to answer
+            on_progress: called with the full text rendered so far while it streams
+
+        Returns:
+            the answer text, or an error (see answer_error)
+
+        Raises:
+            DeadlineExceeded: if the request deadline runs out
+        """
+        raise NotImplementedError
+
+
+class SeleniumBackend(AnswerBackend):
+    name = "selenium"
+    uses_browsers = True
+
+    def answer(self, prompt: str, on_progress=None):
+        from app.selenium_service import get_chatgpt_answer  # heavy; imported on first use
+        return get_chatgpt_answer(prompt, on_progress=on_progress)
+
+
+class FakeBackend(AnswerBackend):
+    """
+    Answers after sampled delays without touching a browser: the first chunk
+    after `first_token`, the rest spread evenly until `latency` has passed.
+    A share of `error_rate` requests returns an error dict like a blocked or
+    failed browser run. Sleeps honour the request deadline.
+    """
+
+    name = "fake"
+
+    def __init__(self, first_token: str = FAKE_FIRST_TOKEN, latency: str = FAKE_LATENCY,
+                 chunks: int = FAKE_STREAM_CHUNKS, words: int = FAKE_ANSWER_WORDS,
+                 error_rate: float = FAKE_ERROR_RATE, error_codes: str = FAKE_ERROR_CODES, seed=FAKE_SEED):
+        self.first_token = parse_distribution(first_token)
+        self.latency = parse_distribution(latency)
+        self.chunks = max(1, chunks)
+        self.words = max(1, words)
+        self.error_rate = error_rate
+        self.error_codes = [int(code) for code in error_codes.split(",") if code.strip()] or [500]
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _sample(self):
+        with self._rng_lock:
+            first = max(0.0, self.first_token(self._rng))
+            total = max(first, self.latency(self._rng))
+            error = self._rng.random() < self.error_rate
+            code = self._rng.choice(self.error_codes)
+        return first, total, error, code
+
+    @staticmethod
+    def _sleep(seconds: float, phase: str):
+        if seconds > 0:
+            time.sleep(budget(seconds, phase))
+        check_deadline(phase)
+
+    def answer(self, prompt: str, on_progress=None):
+        first, total, error, code = self._sample()
+        words = [f"fake{i}" for i in range(self.words)]
+        words[:len(prompt.split()[:5])] = prompt.split()[:5]
+        per_chunk = math.ceil(len(words) / self.chunks)
+        chunks = [" ".join(words[:i + per_chunk]) for i in range(0, len(words), per_chunk)]
+
+        with phase_timer("first_token"):
+            self._sleep(first, "first_token")
+        if error:
+            record_outcome(code)
+            return {"status": "error", "message": f"Injected error {code}", "code": code}
+        if on_progress is not None:
+            on_progress(chunks[0])
+        with phase_timer("completion"):
+            step = (total - first) / max(1, len(chunks) - 1)
+            for text in chunks[1:]:
+                self._sleep(step, "completion")
+                if on_progress is not None:
+                    on_progress(text)
+            if len(chunks) == 1:
+                self._sleep(total - first, "completion")
+        record_outcome("success")
+        return chunks[-1]
+
+
+class WorkQueueBackend(AnswerBackend):
+    """
+    Hands the prompt to the worker tier as a job and polls for its result.
+    The job carries the request deadline, so workers skip it once nobody is
+    waiting. Answers arrive whole: there are no partial updates to stream.
+    """
+
+    name = "queue"
+
+    def answer(self, prompt: str, on_progress=None):
+        from app.job_service import get_job_store  # job_service imports this module
+        store = get_job_store()
+        deadline = current_deadline()
+        deadline_at = time.time() + deadline.remaining() if deadline is not None else None
+        job, _ = store.create(prompt, deadline_at=deadline_at, tenant=current_tenant_name())
+        with phase_timer("worker"):
+            while True:
+                time.sleep(budget(WORK_QUEUE_POLL_SECS, "worker"))
+                job = store.get(job["id"])
+                if job is None:
+                    return {"status": "error", "message": "Job disappeared from the work queue", "code": 500}
+                if job["status"] == DONE:
+                    return job["answer"]
+                if job["status"] == FAILED:
+                    check_deadline("worker")
+                    return {"status": "error", "message": job["error"], "code": job["code"] or 500}
+
+
+BACKENDS = {"selenium": SeleniumBackend, "fake": FakeBackend, "queue": WorkQueueBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> AnswerBackend:
+    """Returns the process-wide backend chosen by ANSWER_BACKEND, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if ANSWER_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown ANSWER_BACKEND {ANSWER_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+            _backend = BACKENDS[ANSWER_BACKEND]()
+            logger.info(f"Answer backend: {_backend.name}")
+        return _backend
+
+
+def get_admitted_answer(prompt: str, on_progress=None, shed: bool = True):
+    """
+    The backend's answer once the AdmissionController grants a slot.
+
+    Raises:
+        QueueFullError: if `shed` is true and the wait queue is full
+        DeadlineExceeded: if the request deadline ran out (in the queue or the backend)
+    """
+    backend = get_backend()
+    admission = get_admission_controller()
+    try:
+        with start_trace("generate"), \
+                admission.slot(shed=shed, timeout=budget(admission.queue_timeout, "queue_wait")):
+            return backend.answer(prompt, on_progress=on_progress)
+    except QueueFullError:
+        # Timed out in the queue because the request deadline ran out, not because of load.
+        check_deadline("queue_wait")
+        raise
+
+
+def get_cached_answer(prompt: str, shed: bool = True):
+    """
+    get_admitted_answer behind the shared AnswerCache: repeated prompts are
+    served from the cache and concurrent identical prompts share one run.
+    Only cache misses go through admission control. Answers are kept per
+    calling tenant unless ANSWER_CACHE_SCOPE is "shared".
+
+    Returns:
+        (answer, cache_status) with cache_status "hit", "miss" or "shared"
+    """
+    return get_answer_cache().get_or_compute(
+        prompt, lambda p: get_admitted_answer(p, shed=shed),
+        cacheable=lambda answer: answer_error(answer) is None, tenant=current_tenant_name()
+    )
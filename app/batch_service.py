@@ -0,0 +1,59 @@
+# batch_service.py
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from app.logging_utils import get_logger, bind_context
+from app.deadline import current_deadline, deadline_scope, REQUEST_DEADLINE_SECS
+from app.admission import get_admission_controller
+from app.backends import get_cached_answer, answer_error
+
+logger = get_logger(__name__)
+
+
+def _run_item(index: int, prompt: str) -> dict:
+    """Runs one batch item; failures become an error object instead of failing the batch."""
+    if not prompt:
+        return {"index": index, "status": "error", "error": {"message": "Prompt is required", "code": 400}}
+    # A deadline the client asked for covers the whole batch; otherwise each item gets the default budget.
+    deadline = current_deadline()
+    seconds = None if deadline is not None and deadline.from_client else REQUEST_DEADLINE_SECS
+    try:
+        # The batch was admitted as a whole; its items wait for browsers.
+        with deadline_scope(seconds):
+            answer, cache_status = get_cached_answer(prompt, shed=False)
+    except Exception as e:
+        logger.exception(f"Batch item {index} failed")
+        return {"index": index, "status": "error", "error": {"message": str(e), "code": getattr(e, "status", 500)}}
+    error = answer_error(answer)
+    if error:
+        return {"index": index, "status": "error", "error": {"message": error[0], "code": error[1]}}
+    return {"index": index, "status": "ok", "answer": answer, "cache": cache_status}
+
+
+def batch_workers(prompt_count: int, concurrency: int) -> int:
+    """Concurrency actually used: never more than admission control lets run at once, whatever the backend."""
+    return max(1, min(concurrency, prompt_count, get_admission_controller().max_concurrency))
+
+
+def run_batch(prompts: list, concurrency: int) -> list:
+    """Answers every prompt, at most `concurrency` at a time, and returns results in input order."""
+    workers = batch_workers(len(prompts), concurrency)
+    logger.info(f"Running batch of {len(prompts)} prompts with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = [executor.submit(bind_context(_run_item), i, p) for i, p in enumerate(prompts)]
+        return [future.result() for future in futures]
+
+
+async def stream_batch_ndjson(prompts: list, concurrency: int):
+    """Yields one NDJSON line per item as soon as it finishes (completion order, with its index)."""
+    workers = batch_workers(len(prompts), concurrency)
+    logger.info(f"Streaming batch of {len(prompts)} prompts with {workers} workers")
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = [loop.run_in_executor(executor, bind_context(_run_item), i, p) for i, p in enumerate(prompts)]
+        for next_done in asyncio.as_completed(futures):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Items still queued when the client disconnects are dropped.
+        executor.shutdown(wait=False, cancel_futures=True)
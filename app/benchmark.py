@@ -0,0 +1,190 @@
+# benchmark.py
+"""
+Offline latency benchmark for the browser flow.
+
+Starts the mock chat server (app.mock_chat_server), points the real service
+code at it through CHATGPT_URL and runs get_chatgpt_answer at several
+concurrency levels. Reports p50/p95/p99 for every phase recorded by
+app.metrics plus end-to-end latency and throughput, and writes the results
+as JSON so runs can be compared.
+
+Usage:
+    python -m app.benchmark --requests 20 --concurrency 1,2,4 --output bench.json
+    python -m app.benchmark --requests 20 --compare bench.json   # print deltas against an earlier run
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.logging_utils import get_logger
+from app.metrics import add_phase_listener, remove_phase_listener
+from app.tracing import start_trace
+from app.mock_chat_server import start_mock_server
+
+logger = get_logger(__name__)
+
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank percentile of `samples` (q in 0..100)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples) -> dict:
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean": round(sum(samples) / len(samples), 4),
+        "p50": round(percentile(samples, 50), 4),
+        "p95": round(percentile(samples, 95), 4),
+        "p99": round(percentile(samples, 99), 4),
+        "max": round(max(samples), 4),
+    }
+
+
+class PhaseRecorder:
+    """Collects raw per-phase samples from app.metrics while a level runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def __call__(self, phase: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(phase, []).append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self.samples = {}
+
+
+def run_level(concurrency: int, requests: int, prompt: str, recorder: PhaseRecorder, warmup: bool = True) -> dict:
+    """Runs `requests` prompts with `concurrency` browsers and summarizes the results."""
+    from app.driver_pool import configure_driver_pool
+    from app.selenium_service import get_chatgpt_answer, answer_error
+
+    pool = configure_driver_pool(min_size=concurrency, max_size=concurrency)
+    if warmup:
+        # Start the browsers up front so cold starts don't skew the steady-state numbers.
+        pool.resize()
+    recorder.clear()
+
+    def one(i: int):
+        started = time.perf_counter()
+        with start_trace(f"benchmark c={concurrency} #{i}"):  # only with TRACE_ENABLED=true
+            answer = get_chatgpt_answer(f"{prompt} #{i}")
+        error = answer_error(answer)
+        return time.perf_counter() - started, (error[1] if error else None)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    rss = pool.memory()
+
+    latencies = [latency for latency, error in results if error is None]
+    errors = {}
+    for _, error in results:
+        if error is not None:
+            errors[str(error)] = errors.get(str(error), 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "wall_secs": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 4) if wall else None,
+        "latency": summarize(latencies),
+        "rss_mb_per_browser": [round(value / 2**20, 1) for value in rss],
+        "phases": {phase: summarize(samples) for phase, samples in sorted(recorder.samples.items())},
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    base_levels = {level["concurrency"]: level for level in (baseline or {}).get("levels", [])}
+    for level in report["levels"]:
+        base = base_levels.get(level["concurrency"])
+        print(f"\nconcurrency={level['concurrency']} requests={level['requests']} "
+              f"ok={level['succeeded']} errors={level['errors']} throughput={level['throughput_rps']} req/s "
+              f"rss/browser={level.get('rss_mb_per_browser')} MB")
+        rows = [("total", level["latency"], base and base["latency"])]
+        rows += [(phase, stats, base and base["phases"].get(phase)) for phase, stats in level["phases"].items()]
+        print(f"  {'phase':<15}{'p50':>10}{'p95':>10}{'p99':>10}" + (f"{'Δp50':>10}{'Δp95':>10}" if base else ""))
+        for name, stats, base_stats in rows:
+            if not stats.get("count"):
+                continue
+            line = f"  {name:<15}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}"
+            if base_stats and base_stats.get("count"):
+                line += f"{stats['p50'] - base_stats['p50']:>+10.3f}{stats['p95'] - base_stats['p95']:>+10.3f}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the browser flow against a local mock chat page.")
+    parser.add_argument("--requests", type=int, default=10, help="requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4", help="comma-separated concurrency levels")
+    parser.add_argument("--prompt", default="Summarize the benefits of unit tests in two sentences.")
+    parser.add_argument("--url", help="use an already running mock page instead of starting one")
+    parser.add_argument("--token-rate", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-warmup", action="store_true", help="include browser cold starts in the numbers")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to print deltas against")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_mock_server(token_rate=args.token_rate, answer_tokens=args.answer_tokens,
+                                        first_token_delay=args.first_token_delay, error_rate=args.error_rate)
+    # Must be set before the service module is imported.
+    os.environ["CHATGPT_URL"] = url
+
+    recorder = PhaseRecorder()
+    add_phase_listener(recorder)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "settings": {"url": url, "requests": args.requests, "token_rate": args.token_rate,
+                     "answer_tokens": args.answer_tokens, "first_token_delay": args.first_token_delay,
+                     "error_rate": args.error_rate, "warmup": not args.no_warmup,
+                     "prompt_insert_mode": os.getenv("PROMPT_INSERT_MODE", "insert"),
+                     "driver_profile": os.getenv("DRIVER_PROFILE", "standard")},
+        "levels": [],
+    }
+    try:
+        for level in levels:
+            logger.info(f"Benchmarking concurrency={level}")
+            report["levels"].append(run_level(level, args.requests, args.prompt, recorder, not args.no_warmup))
+    finally:
+        remove_phase_listener(recorder)
+        from app.driver_pool import shutdown_driver_pool
+        shutdown_driver_pool()
+        if server is not None:
+            server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# browser_governor.py
+"""
+Background watchdog for browser resources.
+
+Every GOVERNOR_INTERVAL_SECS it walks /proc once, sums RSS and CPU over each
+pooled browser's process tree (chromedriver, Chrome and its helpers) and
+retires browsers over the limits through the pool, which starts
+replacements. It also kills orphaned browser processes: ones left behind
+by a crashed or killed process (re-parented to init or to us) that no live
+pooled driver owns. Only browsers started by this service are touched: each
+is launched with BROWSER_OWNER_ARG on its command line, and a tree without
+it is never killed.
+"""
+import os
+import threading
+import time
+from app.logging_utils import get_logger
+from app.driver_pool import get_driver_pool
+from app.process_utils import (parent_pids, process_tree, driver_pids, rss_bytes, cpu_seconds,
+                               process_age, process_name, process_cmdline, is_zombie, kill_tree, in_container,
+                               BROWSER_OWNER_ARG)
+
+logger = get_logger(__name__)
+
+GOVERNOR_INTERVAL_SECS = float(os.getenv("GOVERNOR_INTERVAL_SECS", "15"))
+# Per browser, summed over its process tree; 0 disables the limit.
+BROWSER_MAX_RSS_MB = float(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+BROWSER_MAX_CPU_PERCENT = float(os.getenv("BROWSER_MAX_CPU_PERCENT", "0"))
+# Consecutive samples over the CPU limit before a browser is retired (generation spikes are normal).
+BROWSER_CPU_GRACE_SAMPLES = int(os.getenv("BROWSER_CPU_GRACE_SAMPLES", "4"))
+# "auto" reaps only inside a container, where every browser on the host is ours.
+REAP_ORPHANS = os.getenv("REAP_ORPHANS", "auto").lower()
+# Younger processes may belong to a browser that is still starting.
+ORPHAN_MIN_AGE_SECS = float(os.getenv("ORPHAN_MIN_AGE_SECS", "60"))
+
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "chromium-browse", "chromedriver", "uc_driver", "headless_shell")
+
+
+def is_browser_process(pid: int) -> bool:
+    name = process_name(pid).lower()
+    return any(name.startswith(prefix) for prefix in BROWSER_PROCESS_NAMES)
+
+
+def reap_orphans_enabled(setting: str = REAP_ORPHANS) -> bool:
+    if setting == "auto":
+        return in_container()
+    return setting not in ("false", "0", "no", "off")
+
+
+def started_by_us(tree) -> bool:
+    """True if a process in the tree (the browser under a chromedriver, or the browser itself) carries our marker."""
+    return any(BROWSER_OWNER_ARG in process_cmdline(pid) for pid in tree)
+
+
+class BrowserGovernor:
+    """
+    Args:
+        pool_getter: callable returning the DriverPool to govern
+        interval: seconds between samples
+        max_rss_mb, max_cpu_percent: per-browser limits (0 disables)
+        cpu_grace_samples: consecutive samples over the CPU limit before retiring
+        reap_orphans: kill orphaned browser processes started by this service
+    """
+
+    def __init__(self, pool_getter, interval: float = GOVERNOR_INTERVAL_SECS,
+                 max_rss_mb: float = BROWSER_MAX_RSS_MB, max_cpu_percent: float = BROWSER_MAX_CPU_PERCENT,
+                 cpu_grace_samples: int = BROWSER_CPU_GRACE_SAMPLES, reap_orphans: bool = None):
+        self.pool_getter = pool_getter
+        self.interval = interval
+        self.max_rss_bytes = max_rss_mb * 2**20
+        self.max_cpu_percent = max_cpu_percent
+        self.cpu_grace_samples = cpu_grace_samples
+        self.reap_orphans = reap_orphans_enabled() if reap_orphans is None else reap_orphans
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu = {}           # pid -> (cpu seconds, sampled at)
+        self._over_cpu = {}      # id(root driver) -> consecutive samples over the limit
+        self._last = {"browsers": 0, "processes": 0, "rss_bytes": 0, "cpu_percent": 0.0,
+                      "max_rss_bytes": 0, "sampled_at": None, "sample_secs": None}
+        self._counters = {"evicted_rss": 0, "evicted_cpu": 0, "orphans_reaped": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="browser-governor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._last, **self._counters}
+
+    def _loop(self):
+        # Leftovers from a previous process are reaped before the first browser starts.
+        self._run_once()
+        while not self._stop.wait(self.interval):
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            self.sample()
+        except Exception as e:
+            logger.error(f"Browser governor sample failed: {e}")
+
+    def sample(self):
+        """Measures every pooled browser, retires those over the limits and reaps orphans."""
+        started = time.monotonic()
+        pool = self.pool_getter()
+        parents = parent_pids()
+
+        # Tabs of one browser share its processes: group pool items by their real driver.
+        browsers = {}
+        for item in pool.items():
+            root = getattr(item.driver, "root_driver", item.driver)
+            browsers.setdefault(id(root), (root, []))[1].append(item)
+
+        now = time.monotonic()
+        owned = set()
+        cpu = {}
+        totals = {"rss": 0, "cpu": 0.0, "max_rss": 0, "processes": 0}
+        for key, (root, items) in browsers.items():
+            pids = driver_pids(root, parents)
+            owned.update(pids)
+            rss = sum(rss_bytes(pid) for pid in pids)
+            cpu_percent = 0.0
+            for pid in pids:
+                used = cpu_seconds(pid)
+                previous = self._cpu.get(pid)
+                if previous is not None and now > previous[1]:
+                    cpu_percent += max(0.0, used - previous[0]) / (now - previous[1]) * 100
+                cpu[pid] = (used, now)
+            totals["rss"] += rss
+            totals["cpu"] += cpu_percent
+            totals["max_rss"] = max(totals["max_rss"], rss)
+            totals["processes"] += len(pids)
+            self._enforce(pool, key, items, rss, cpu_percent)
+        self._cpu = cpu
+        self._over_cpu = {key: count for key, count in self._over_cpu.items() if key in browsers}
+
+        if self.reap_orphans:
+            self._reap(parents, owned, pool)
+
+        with self._lock:
+            self._last = {
+                "browsers": len(browsers),
+                "processes": totals["processes"],
+                "rss_bytes": totals["rss"],
+                "cpu_percent": round(totals["cpu"], 1),
+                "max_rss_bytes": totals["max_rss"],
+                "sampled_at": time.time(),
+                "sample_secs": round(time.monotonic() - started, 4),
+            }
+
+    def _enforce(self, pool, key, items, rss: int, cpu_percent: float):
+        # Leased browsers already marked for retirement are left alone until released.
+        items = [item for item in items if not item.broken]
+        if not items:
+            return
+        reason = None
+        if self.max_rss_bytes and rss > self.max_rss_bytes:
+            reason, counter = f"RSS {rss / 2**20:.0f} MB over {self.max_rss_bytes / 2**20:.0f} MB", "evicted_rss"
+        elif self.max_cpu_percent:
+            over = self._over_cpu.get(key, 0) + 1 if cpu_percent > self.max_cpu_percent else 0
+            self._over_cpu[key] = over
+            if over >= self.cpu_grace_samples:
+                reason, counter = f"CPU {cpu_percent:.0f}% over {self.max_cpu_percent:.0f}% " \
+                                  f"for {over} samples", "evicted_cpu"
+        if reason is None:
+            return
+        logger.warning(f"Retiring browser: {reason}")
+        evicted = [pool.evict(item, reason) for item in items]
+        if any(evicted):
+            with self._lock:
+                self._counters[counter] += 1
+            self._over_cpu.pop(key, None)
+            # Start replacements now rather than on the next request.
+            threading.Thread(target=pool.resize, name="governor-resize", daemon=True).start()
+
+    def _reap(self, parents: dict, owned: set, pool):
+        """Kills process trees of browsers this service started that no live pooled driver owns."""
+        me = os.getpid()
+        starting = pool.stats()["starting"] > 0
+        for pid, ppid in parents.items():
+            if pid in owned or pid == me or not is_browser_process(pid) or is_zombie(pid):
+                continue
+            # Only tops of browser trees: re-parented to init, or our own leaked children.
+            if ppid not in (1, me) or (ppid == me and starting):
+                continue
+            age = process_age(pid)
+            if age is None or age < ORPHAN_MIN_AGE_SECS:
+                continue
+            name = process_name(pid)
+            tree = [p for p in process_tree(pid, parents) if p not in owned]
+            if not started_by_us(tree):
+                continue
+            killed = kill_tree(tree)
+            if killed:
+                logger.warning(f"Reaped orphaned {name} process tree "
+                               f"(pid {pid}, {killed} processes)")
+                with self._lock:
+                    self._counters["orphans_reaped"] += killed
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_browser_governor() -> BrowserGovernor:
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = BrowserGovernor(get_driver_pool)
+        return _governor
+
+
+def shutdown_browser_governor():
+    global _governor
+    with _governor_lock:
+        governor, _governor = _governor, None
+    if governor is not None:
+        governor.stop()
@@ -0,0 +1,125 @@
+# deadline.py
+import contextvars
+import os
+import random
+import time
+from contextlib import contextmanager
+
+# Budget for one request when the client does not send X-Request-Timeout.
+REQUEST_DEADLINE_SECS = float(os.getenv("REQUEST_DEADLINE_SECS", "180"))
+MAX_REQUEST_DEADLINE_SECS = float(os.getenv("MAX_REQUEST_DEADLINE_SECS", "600"))
+# Another attempt is only started if at least this much budget is left after the backoff.
+RETRY_MIN_BUDGET_SECS = float(os.getenv("RETRY_MIN_BUDGET_SECS", "20"))
+RETRY_BACKOFF_BASE_SECS = float(os.getenv("RETRY_BACKOFF_BASE_SECS", "1"))
+RETRY_BACKOFF_MAX_SECS = float(os.getenv("RETRY_BACKOFF_MAX_SECS", "8"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget ran out; `phase` names where."""
+
+    status = 504
+    # Says nothing about the answer, so requests sharing the work retry instead of failing too.
+    request_scoped = True
+
+    def __init__(self, phase: str, budget: float):
+        self.phase = phase
+        self.budget = budget
+        super().__init__(f"Request deadline of {budget:.0f}s exceeded during {phase}")
+
+
+class Deadline:
+    def __init__(self, seconds: float, from_client: bool = False):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+        # True when the client asked for it (X-Request-Timeout) rather than the default applying.
+        self.from_client = from_client
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def parse_timeout_header(value) -> float:
+    """Seconds from an X-Request-Timeout header, clamped; None if absent or invalid."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    if seconds <= 0:
+        return None
+    return min(seconds, MAX_REQUEST_DEADLINE_SECS)
+
+
+@contextmanager
+def deadline_scope(seconds: float = None):
+    """
+    Runs the block under a deadline. Without `seconds` an enclosing deadline is
+    kept (or REQUEST_DEADLINE_SECS started); with `seconds` a new one replaces it.
+    """
+    if seconds is None and _current.get() is not None:
+        yield _current.get()
+        return
+    deadline = Deadline(REQUEST_DEADLINE_SECS if seconds is None else seconds, from_client=seconds is not None)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def remaining_budget(default: float = None) -> float:
+    """Seconds left on the current deadline, or `default` if there is none."""
+    deadline = _current.get()
+    return default if deadline is None else deadline.remaining()
+
+
+def budget(default: float, phase: str) -> float:
+    """
+    Timeout for one wait: `default` capped by the time left on the deadline.
+
+    Raises:
+        DeadlineExceeded: if no time is left
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(phase, deadline.budget)
+    return min(default, remaining)
+
+
+def expired_error(phase: str):
+    """A DeadlineExceeded naming `phase` if the deadline has passed, else None."""
+    deadline = _current.get()
+    if deadline is not None and deadline.expired:
+        return DeadlineExceeded(phase, deadline.budget)
+    return None
+
+
+def check_deadline(phase: str):
+    """Raises DeadlineExceeded naming `phase` if the deadline has passed."""
+    error = expired_error(phase)
+    if error is not None:
+        raise error
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before attempt `attempt + 1`."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX_SECS, RETRY_BACKOFF_BASE_SECS * 2 ** (attempt - 1)))
+
+
+def can_retry(delay: float) -> bool:
+    """True if, after sleeping `delay`, enough budget is left for another attempt."""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() - delay >= RETRY_MIN_BUDGET_SECS
@@ -0,0 +1,438 @@
+# driver_pool.py
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from app.logging_utils import get_logger
+from app.metrics import observe_phase
+from app.process_utils import parent_pids, driver_rss_bytes
+
+logger = get_logger(__name__)
+
+# Browsers started (and pointed at the chat page) in the background at startup (see app.warmup).
+DRIVER_PREWARM = int(os.getenv("DRIVER_PREWARM", "1"))
+# Defaults to the pre-warmed count, so idle shrinking never quits the browsers warm-up paid for.
+DRIVER_POOL_MIN = int(os.getenv("DRIVER_POOL_MIN", str(DRIVER_PREWARM)))
+DRIVER_POOL_MAX = int(os.getenv("DRIVER_POOL_MAX", "2"))
+DRIVER_MAX_USES = int(os.getenv("DRIVER_MAX_USES", "25"))
+DRIVER_MAX_AGE_SECS = float(os.getenv("DRIVER_MAX_AGE_SECS", "1800"))
+DRIVER_LEASE_TIMEOUT_SECS = float(os.getenv("DRIVER_LEASE_TIMEOUT_SECS", "120"))
+DRIVER_IDLE_GRACE_SECS = float(os.getenv("DRIVER_IDLE_GRACE_SECS", "120"))
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no driver could be leased before the lease timeout."""
+
+
+class PoolClosedError(Exception):
+    """Raised when leasing from a pool that has been shut down."""
+
+
+def _default_factory():
+    # Imported lazily so that importing the pool does not pull in seleniumbase.
+    from app.driver_utils import TABS_PER_BROWSER, get_basic_driver
+    if TABS_PER_BROWSER > 1:
+        from app.tab_driver import get_tab_factory
+        return get_tab_factory()()
+    return get_basic_driver()
+
+
+def _default_probe(driver) -> bool:
+    """Cheap liveness check: one WebDriver round-trip that needs a live renderer."""
+    try:
+        driver.execute_script("return document.readyState")
+        return True
+    except Exception:
+        return False
+
+
+class PooledDriver:
+    """A driver owned by the pool together with its usage bookkeeping."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.leased_at = None
+        self.uses = 0
+        # Callers set this when the browser is in an unknown state (errors, blocks)
+        # so that it is quit instead of being handed to the next request.
+        self.broken = False
+        # Set by the service while the browser shows a usable chat page, so the
+        # next lease can start a new conversation in-page instead of reloading.
+        self.page_loaded = False
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def is_expired(self, max_uses: int, max_age: float) -> bool:
+        return (max_uses > 0 and self.uses >= max_uses) or (max_age > 0 and self.age >= max_age)
+
+
+class DriverPool:
+    """
+    Keeps a set of warm browsers and hands them out one request at a time.
+
+    Drivers are probed before every lease, recycled after `max_uses` leases or
+    `max_age` seconds, and quit when evicted. The pool size follows the recent
+    request rate (Little's law: busy drivers = arrival rate * lease duration),
+    clamped to [min_size, max_size].
+
+    Args:
+        factory: callable returning a new driver
+        min_size, max_size: bounds for the number of live drivers
+        max_uses: leases before a driver is recycled (0 disables)
+        max_age: seconds before a driver is recycled (0 disables)
+        lease_timeout: default seconds to wait for a free driver
+        probe: callable(driver) -> bool run before each lease
+        rate_window: seconds of lease history used for the request rate
+    """
+
+    def __init__(self, factory=_default_factory, min_size: int = DRIVER_POOL_MIN,
+                 max_size: int = DRIVER_POOL_MAX, max_uses: int = DRIVER_MAX_USES,
+                 max_age: float = DRIVER_MAX_AGE_SECS, lease_timeout: float = DRIVER_LEASE_TIMEOUT_SECS,
+                 probe=_default_probe, rate_window: float = 60.0, idle_grace: float = DRIVER_IDLE_GRACE_SECS):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.factory = factory
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.lease_timeout = lease_timeout
+        self.probe = probe
+        self.rate_window = rate_window
+        self.idle_grace = idle_grace
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._leased = set()
+        self._creating = 0
+        self._closed = False
+        self._target = self.min_size
+        self._lease_history = deque()
+        self._avg_lease_secs = 0.0
+        self._maintenance_thread = None
+        self._stop = threading.Event()
+        self._counters = {"created": 0, "recycled": 0, "probe_failures": 0, "create_failures": 0, "evicted": 0}
+
+    # ------------------------------------------------------------------ leasing
+
+    def lease(self, timeout: float = None) -> PooledDriver:
+        """
+        Returns a healthy driver, creating one if the pool has room.
+
+        Raises:
+            PoolExhaustedError: if none became free within `timeout` seconds
+            PoolClosedError: if the pool has been shut down
+        """
+        timeout = self.lease_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._lease_history.append(time.monotonic())
+
+        while True:
+            item, stale = self._take_or_reserve(deadline)
+            for old in stale:
+                self._quit(old, "expired while idle")
+
+            created = item is None
+            if created:
+                item = self._create()
+            elif not self.probe(item.driver):
+                self._count("probe_failures")
+                self._quit(item, "failed health probe")
+                with self._cond:
+                    self._cond.notify()
+                continue
+
+            with self._cond:
+                if created:
+                    self._creating -= 1
+                item.uses += 1
+                item.leased_at = time.monotonic()
+                self._leased.add(item)
+            return item
+
+    def release(self, item: PooledDriver, broken: bool = False):
+        """Returns a leased driver; broken or worn-out drivers are quit instead."""
+        broken = broken or item.broken
+        reason = None
+        with self._cond:
+            self._leased.discard(item)
+            now = time.monotonic()
+            if item.leased_at is not None:
+                duration = now - item.leased_at
+                self._avg_lease_secs = duration if not self._avg_lease_secs else \
+                    0.8 * self._avg_lease_secs + 0.2 * duration
+            item.last_used_at = now
+            item.leased_at = None
+
+            if self._closed:
+                reason = "pool closed"
+            elif broken:
+                reason = "marked broken"
+            elif item.is_expired(self.max_uses, self.max_age):
+                reason = f"recycled after {item.uses} uses / {item.age:.0f}s"
+                self._counters["recycled"] += 1
+            else:
+                self._idle.append(item)
+            self._cond.notify()
+
+        if reason:
+            self._quit(item, reason)
+
+    def evict(self, item: PooledDriver, reason: str) -> bool:
+        """
+        Retires a driver from outside the request flow (e.g. over resource limits):
+        an idle one is quit now, a leased one is marked broken and quit on release.
+        Returns False if the driver is no longer in the pool.
+        """
+        with self._cond:
+            if item in self._idle:
+                self._idle.remove(item)
+                quit_now = True
+            elif item in self._leased:
+                item.broken = True
+                quit_now = False
+            else:
+                return False
+            self._counters["evicted"] += 1
+        if quit_now:
+            self._quit(item, reason)
+        else:
+            logger.info(f"Pooled browser will be retired on release ({reason})")
+        return True
+
+    @contextmanager
+    def leased(self, timeout: float = None):
+        """Context manager around lease()/release(); exceptions mark the driver broken."""
+        item = self.lease(timeout)
+        try:
+            yield item
+        except BaseException:
+            item.broken = True
+            raise
+        finally:
+            self.release(item)
+
+    # ------------------------------------------------------------------ sizing
+
+    def request_rate(self) -> float:
+        """Leases per second over the last `rate_window` seconds."""
+        with self._cond:
+            self._trim_history(time.monotonic())
+            return len(self._lease_history) / self.rate_window
+
+    def resize(self):
+        """
+        Recomputes the target size from the recent request rate, quits surplus
+        idle drivers and starts new ones up to the target.
+        """
+        surplus = []
+        with self._cond:
+            if self._closed:
+                return
+            now = time.monotonic()
+            self._trim_history(now)
+            rate = len(self._lease_history) / self.rate_window
+            busy = rate * self._avg_lease_secs
+            self._target = max(self.min_size, min(self.max_size, math.ceil(busy)))
+
+            kept = deque()
+            for item in self._idle:
+                too_many = self._size() - len(surplus) > self._target
+                idle_long = now - item.last_used_at >= self.idle_grace
+                if item.is_expired(self.max_uses, self.max_age) or (too_many and idle_long):
+                    surplus.append(item)
+                else:
+                    kept.append(item)
+            self._idle = kept
+            missing = self._target - self._size()
+
+        for item in surplus:
+            self._quit(item, "pool shrink")
+
+        for _ in range(max(0, missing)):
+            with self._cond:
+                if self._closed or self._size() >= self._target:
+                    break
+                self._creating += 1
+            try:
+                item = self._create()
+            except Exception:
+                break
+            with self._cond:
+                self._creating -= 1
+                closed = self._closed
+                if not closed:
+                    self._idle.append(item)
+                    self._cond.notify()
+            if closed:
+                self._quit(item, "pool closed")
+
+    def start(self, interval: float = 10.0):
+        """Starts the background thread that keeps the pool sized to demand."""
+        with self._cond:
+            if self._maintenance_thread is not None:
+                return
+            self._maintenance_thread = threading.Thread(
+                target=self._maintenance_loop, args=(interval,), name="driver-pool", daemon=True
+            )
+        self._maintenance_thread.start()
+
+    def close(self):
+        """Stops maintenance and quits every idle driver; leased ones are quit on release."""
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for item in idle:
+            self._quit(item, "pool closed")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "idle": len(self._idle),
+                "leased": len(self._leased),
+                "starting": self._creating,
+                "target": self._target,
+                "min": self.min_size,
+                "max": self.max_size,
+                "avg_lease_secs": round(self._avg_lease_secs, 3),
+                "request_rate": round(len(self._lease_history) / self.rate_window, 4),
+                **self._counters,
+            }
+
+    def items(self) -> list:
+        """Snapshot of every live pooled driver (idle and leased)."""
+        with self._cond:
+            return list(self._idle) + list(self._leased)
+
+    def memory(self) -> list:
+        """Measured RSS in bytes of every live pooled browser (idle and leased)."""
+        with self._cond:
+            drivers = {}
+            for item in list(self._idle) + list(self._leased):
+                # Tabs of one browser share its processes; count each browser once.
+                root = getattr(item.driver, "root_driver", item.driver)
+                drivers[id(root)] = root
+            drivers = list(drivers.values())
+        parents = parent_pids()
+        return [driver_rss_bytes(driver, parents) for driver in drivers]
+
+    # ------------------------------------------------------------------ internals
+
+    def _count(self, name: str):
+        # Counters are bumped from request and maintenance threads alike.
+        with self._cond:
+            self._counters[name] += 1
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._leased) + self._creating
+
+    def _trim_history(self, now: float):
+        while self._lease_history and now - self._lease_history[0] > self.rate_window:
+            self._lease_history.popleft()
+
+    def _take_or_reserve(self, deadline: float):
+        """
+        Under the lock: pops an idle driver, or reserves a slot to create one.
+        Returns (item_or_None, stale_items_to_quit).
+        """
+        stale = []
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolClosedError("Driver pool is closed")
+                while self._idle:
+                    # LIFO keeps the most recently used browsers hot and lets
+                    # the rest age out when demand drops.
+                    item = self._idle.pop()
+                    if item.is_expired(self.max_uses, self.max_age):
+                        stale.append(item)
+                        continue
+                    return item, stale
+                if self._size() < self.max_size:
+                    self._creating += 1
+                    return None, stale
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(f"No browser available within the lease timeout "
+                                             f"({len(self._leased)} leased, max {self.max_size})")
+                self._cond.wait(remaining)
+
+    def _create(self) -> PooledDriver:
+        """
+        Creates a driver for a slot already reserved via `_creating`. On success
+        the caller releases the reservation when it stores the driver.
+        """
+        try:
+            started = time.monotonic()
+            driver = self.factory()
+            if driver is None:
+                raise RuntimeError("Driver factory returned None")
+            elapsed = time.monotonic() - started
+            observe_phase("driver_start", elapsed)
+            logger.info(f"Started pooled browser in {elapsed:.1f}s")
+            self._count("created")
+            return PooledDriver(driver)
+        except Exception as e:
+            self._count("create_failures")
+            logger.error(f"Failed to start pooled browser: {e}")
+            with self._cond:
+                self._creating -= 1
+                self._cond.notify()
+            raise
+
+    def _quit(self, item: PooledDriver, reason: str):
+        logger.info(f"Quitting pooled browser ({reason})")
+        try:
+            item.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error while quitting browser: {e}")
+
+    def _maintenance_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.resize()
+            except Exception as e:
+                logger.error(f"Driver pool maintenance failed: {e}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """Returns the process-wide driver pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            _pool.start()
+        return _pool
+
+
+def configure_driver_pool(**options) -> DriverPool:
+    """Replaces the process-wide pool with one built from `options` (DriverPool arguments)."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, DriverPool(**options)
+        _pool.start()
+    if old is not None:
+        old.close()
+    return _pool
+
+
+def shutdown_driver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
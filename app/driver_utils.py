@@ -4,32 +4,89 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
+import os
 import time
 import random
 from app.logging_utils import get_logger
-from selenium.webdriver import DesiredCapabilities
+from app.process_utils import driver_rss_bytes, BROWSER_OWNER_ARG
+from app.tracing import instrument_driver
 
 logger = get_logger(__name__)
 
+# "standard" keeps Chrome's defaults; "lean" trades page fidelity for memory
+# and load time (see DRIVER_PROFILES).
+DRIVER_PROFILE = os.getenv("DRIVER_PROFILE", "standard")
 
-def get_basic_driver(headless=True):
-    """Minimal undetectable Chrome driver"""
-    caps = DesiredCapabilities.CHROME.copy()
-    caps["goog:loggingPrefs"] = {"performance": "ALL"} #type: ignore
+# Chat tabs per Chrome process (see app.tab_driver); 1 keeps one browser per request.
+TABS_PER_BROWSER = max(1, int(os.getenv("TABS_PER_BROWSER", "1")))
+# Without these, Chrome throttles timers and rendering in every tab but the
+# focused one, which stalls the in-page answer waits of the other tabs.
+BACKGROUND_TAB_ARGS = ("--disable-background-timer-throttling,--disable-backgrounding-occluded-windows,"
+                       "--disable-renderer-backgrounding")
 
+# Resources the chat UI works without: images, media, fonts and third-party analytics.
+LEAN_BLOCKED_URLS = [
+    pattern.strip() for pattern in os.getenv(
+        "LEAN_BLOCKED_URLS",
+        "*.png,*.jpg,*.jpeg,*.gif,*.webp,*.avif,*.ico,*.svg,*.mp4,*.webm,*.mp3,*.wav,"
+        "*.woff,*.woff2,*.ttf,*.otf,"
+        "*google-analytics.com*,*googletagmanager.com*,*doubleclick.net*,*segment.io*,"
+        "*segment.com*,*intercom.io*,*intercomcdn.com*,*hotjar.com*,*browser-intake-datadoghq*",
+    ).split(",") if pattern.strip()
+]
+
+DRIVER_PROFILES = {
+    "standard": {
+        "window_size": "1920, 1080",
+        "driver_options": {},
+        # CDP Network buffers left at Chrome's defaults.
+        "network_buffers": {},
+        "blocked_urls": [],
+    },
+    "lean": {
+        "window_size": "1280, 800",
+        "driver_options": {
+            "block_images": True,
+            "disable_features": "Translate,MediaRouter,OptimizationHints,AutofillServerCommunication,"
+                                "InterestFeedContentSuggestions,CalculateNativeWinOcclusion",
+            "chromium_arg": "--disable-extensions,--disable-background-networking,--disable-component-update,"
+                            "--disable-default-apps,--disable-sync,--mute-audio,--no-first-run,"
+                            "--disable-dev-shm-usage,--renderer-process-limit=2,--disk-cache-size=33554432",
+        },
+        "network_buffers": {"maxTotalBufferSize": 2 * 1024 * 1024, "maxResourceBufferSize": 512 * 1024},
+        "blocked_urls": LEAN_BLOCKED_URLS,
+    },
+}
+
+
+def get_basic_driver(headless=True, profile=None):
+    """
+    Minimal undetectable Chrome driver
+
+    Args:
+        headless: run without a visible window
+        profile: key of DRIVER_PROFILES; defaults to DRIVER_PROFILE
+    """
+    profile_name = profile or DRIVER_PROFILE
+    settings = DRIVER_PROFILES[profile_name]
+    driver_options = dict(settings["driver_options"])
+    # The owner marker lets the governor tell our orphaned browsers from anyone else's.
+    extra_args = [BROWSER_OWNER_ARG] + ([BACKGROUND_TAB_ARGS] if TABS_PER_BROWSER > 1 else [])
+    driver_options["chromium_arg"] = ",".join(
+        arg for arg in (driver_options.get("chromium_arg"), *extra_args) if arg
+    )
     driver = Driver(
         browser="chrome",
         headless=headless,
         uc=True,           # Undetected Chrome
         uc_cdp=True,       # helps to access performance logs
         undetectable=True, # SeleniumBase stealth
-        window_size="1920, 1080"
+        log_cdp_events=True, # goog:loggingPrefs performance log, read by NetworkMonitor
+        window_size=settings["window_size"],
+        **driver_options,
     )
-
-    try:
-        driver.execute_cdp_cmd("Network.enable", {})
-    except Exception as e:
-        print(f"Could not enable network CDP: {e}")
+    instrument_driver(driver)
+    configure_tab(driver, profile_name)
 
     navigator_js = """
     // Remove webdriver property
@@ -42,13 +99,33 @@ def get_basic_driver(headless=True):
     try:
         driver.execute_script(navigator_js)
     except Exception as e:
-        print(f"Could not execute navigator JS: {e}")
+        logger.warning(f"Could not execute navigator JS: {e}")
+
+    logger.info(f"Browser started (profile={profile_name}, rss={driver_rss_bytes(driver) / 2**20:.0f} MB)")
     return driver
 
-def handle_cloudflare_challenge(driver):
+def configure_tab(driver, profile=None):
+    """
+    Per-tab CDP setup for the current window: network events for the
+    performance log and the profile's blocked URLs. Needed again for every
+    tab opened later, since CDP domains are enabled per target.
+    """
+    settings = DRIVER_PROFILES[profile or DRIVER_PROFILE]
+    try:
+        driver.execute_cdp_cmd("Network.enable", settings["network_buffers"])
+        if settings["blocked_urls"]:
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": settings["blocked_urls"]})
+    except Exception as e:
+        logger.warning(f"Could not enable network CDP: {e}")
+
+def handle_cloudflare_challenge(driver, timeout: float = 60):
     """
     Waits for the chat UI to be ready, implicitly handling Cloudflare challenges.
     This version includes logic to dismiss common pop-ups and modals.
+
+    Args:
+        driver: Selenium WebDriver instance
+        timeout: seconds to wait for the chat input
     """
     logger.info("Checking for Cloudflare challenge...")
     try:
@@ -66,7 +143,7 @@ def handle_cloudflare_challenge(driver):
                 # We can assume the first button is the correct one.
                 cookie_buttons[0].click()
                 # Wait for the pop-up to disappear
-                WebDriverWait(driver, 10).until(
+                WebDriverWait(driver, min(10, timeout)).until(
                     EC.invisibility_of_element_located((By.CSS_SELECTOR, cookie_accept_selector))
                 )
         except Exception:
@@ -74,7 +151,7 @@ def handle_cloudflare_challenge(driver):
             pass
 
         # Now, wait for the chat input to be present and visible.
-        WebDriverWait(driver, 60).until(
+        WebDriverWait(driver, timeout).until(
             EC.visibility_of_element_located((By.CSS_SELECTOR, chat_input_selector))
         )
         
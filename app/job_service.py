@@ -0,0 +1,114 @@
+# job_service.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.logging_utils import get_logger, bind_context
+from app.deadline import deadline_scope, REQUEST_DEADLINE_SECS
+from app.job_store import JobStore, DONE, FAILED, WORK_QUEUE_URL, open_job_store
+from app.driver_pool import DRIVER_POOL_MAX
+from app.backends import get_cached_answer, answer_error
+from app.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(DRIVER_POOL_MAX)))
+JOB_POLL_INTERVAL_SECS = 0.5
+
+_store = None
+_executor = None
+_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = open_job_store()
+        return _store
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def _run_job(job_id: str):
+    store = get_job_store()
+    prompt = store.get_prompt(job_id)
+    if prompt is None:
+        return
+    store.mark_running(job_id)
+    logger.info(f"Job {job_id} started")
+    try:
+        # Jobs are already persisted, so they wait for a browser instead of being shed.
+        # Nobody is waiting on the HTTP request any more, so the job gets its own budget.
+        with deadline_scope(REQUEST_DEADLINE_SECS):
+            answer, _ = get_cached_answer(prompt, shed=False)
+        error = answer_error(answer)
+        if error:
+            store.fail(job_id, *error)
+            logger.warning(f"Job {job_id} failed: {error[0]}")
+        else:
+            store.complete(job_id, answer)
+            logger.info(f"Job {job_id} finished")
+    except Exception as e:
+        logger.exception(f"Job {job_id} crashed")
+        store.fail(job_id, str(e), getattr(e, "status", 500))
+
+
+def submit_job(prompt: str, idempotency_key: str = None, tenant: str = DEFAULT_TENANT):
+    """
+    Stores a new job for `tenant` and schedules it on the job executor (or
+    leaves it on the shared work queue for app.worker).
+
+    Returns:
+        (job dict, created bool) - `created` is False when the idempotency key
+        matched an earlier job of the tenant, in which case nothing new is scheduled.
+    """
+    job, created = get_job_store().create(prompt, idempotency_key, tenant=tenant)
+    # With a shared work queue, worker processes pick the job up instead.
+    if created and not WORK_QUEUE_URL:
+        _get_executor().submit(bind_context(_run_job), job["id"])
+    return job, created
+
+
+def resume_unfinished_jobs():
+    """Re-schedules jobs left queued or running by a previous process."""
+    if WORK_QUEUE_URL:
+        # Workers redeliver jobs whose lease ran out.
+        return
+    job_ids = get_job_store().unfinished()
+    for job_id in job_ids:
+        _get_executor().submit(_run_job, job_id)
+    if job_ids:
+        logger.info(f"Resumed {len(job_ids)} unfinished jobs")
+
+
+async def wait_for_job(job_id: str, timeout: float, tenant: str = None):
+    """
+    Long-poll helper: returns the job once it is finished or `timeout` seconds
+    have passed (None if it does not exist or belongs to another tenant),
+    without holding a worker thread while waiting. Store reads are blocking,
+    so each one runs in a thread rather than on the event loop.
+    """
+    store = get_job_store()
+    deadline = time.monotonic() + timeout
+    job = await asyncio.to_thread(store.get, job_id, tenant)
+    while job is not None and job["status"] not in (DONE, FAILED) and time.monotonic() < deadline:
+        await asyncio.sleep(min(JOB_POLL_INTERVAL_SECS, max(0.0, deadline - time.monotonic())))
+        job = await asyncio.to_thread(store.get, job_id, tenant)
+    return job
+
+
+def shutdown_jobs():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # Running jobs stay "running" in the store and are resumed on next start.
+        executor.shutdown(wait=False, cancel_futures=True)
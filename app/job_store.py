@@ -0,0 +1,248 @@
+# job_store.py
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from app.logging_utils import get_logger
+from app.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+# Shared queue for separate worker processes (app.worker): sqlite:///path or redis://host:6379/0.
+# Unset, jobs run in the API process as before.
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL")
+# A claimed job whose worker stops extending its lease for this long is handed to another worker.
+JOB_VISIBILITY_TIMEOUT_SECS = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECS", "60"))
+# Deliveries before a job that keeps killing its workers is failed instead of redelivered.
+JOB_MAX_DELIVERIES = int(os.getenv("JOB_MAX_DELIVERIES", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL,
+    answer TEXT,
+    error TEXT,
+    code INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    deadline_at REAL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    tenant TEXT NOT NULL DEFAULT '%s'
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+""" % DEFAULT_TENANT
+
+# Columns added after the first release; older databases are migrated on open.
+# Jobs from before API keys had tenants belong to the single default key.
+_ADDED_COLUMNS = {"deadline_at": "REAL", "lease_owner": "TEXT", "lease_expires_at": "REAL",
+                  "tenant": f"TEXT NOT NULL DEFAULT '{DEFAULT_TENANT}'"}
+
+_PUBLIC_FIELDS = ("id", "status", "answer", "error", "code", "attempts", "created_at", "updated_at")
+
+
+class Claim:
+    """A job handed to one worker until it acks it or its lease runs out."""
+
+    def __init__(self, job_id: str, prompt: str, attempts: int, deadline_at=None):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.attempts = attempts
+        self.deadline_at = deadline_at
+
+
+class JobStore:
+    """
+    SQLite-backed store for asynchronous generation jobs.
+
+    Each job belongs to the tenant (API key) that created it: idempotency
+    keys are only matched within a tenant, and `get` with a tenant hides
+    other tenants' jobs.
+
+    A single connection is shared between threads and guarded by a lock; WAL
+    mode lets readers (polling clients) proceed while a job is being written.
+
+    The table doubles as a work queue for separate worker processes on the
+    same host (app.worker): `claim` leases the oldest queued job to a worker,
+    `extend` keeps the lease alive, and `complete`/`fail` with the owner act
+    as the acknowledgement. Jobs whose lease ran out are claimed again.
+
+    Args:
+        path: database file, or ":memory:" for a throwaway store
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # Other processes (API and workers) write to the same file.
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in _ADDED_COLUMNS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def create(self, prompt: str, idempotency_key: str = None, deadline_at: float = None,
+               tenant: str = DEFAULT_TENANT):
+        """
+        Inserts a queued job for `tenant`. If the tenant already used `idempotency_key`,
+        the existing job is returned instead so client retries never start a second run.
+        Workers fail a job still queued after `deadline_at` (epoch seconds) instead of running it.
+
+        Returns:
+            (job dict, created bool)
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        # The column is unique across tenants, so keys are stored scoped by tenant name.
+        scoped_key = f"{tenant}:{idempotency_key}" if idempotency_key else None
+        with self._lock:
+            # Another process may insert the same key concurrently: the conflict
+            # clause turns that into a no-op and the SELECT returns whichever job won.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                created = self._conn.execute(
+                    "INSERT INTO jobs (id, idempotency_key, prompt, status, created_at, updated_at, deadline_at, tenant) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(idempotency_key) DO NOTHING",
+                    (job_id, scoped_key, prompt, QUEUED, now, now, deadline_at, tenant),
+                ).rowcount == 1
+                if created:
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                else:
+                    row = self._conn.execute(
+                        "SELECT * FROM jobs WHERE idempotency_key = ? AND tenant = ?", (scoped_key, tenant)
+                    ).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row), created
+
+    def get(self, job_id: str, tenant: str = None):
+        """The job, or None if it does not exist or (with `tenant`) belongs to another tenant."""
+        with self._lock:
+            if tenant is None:
+                row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE id = ? AND tenant = ?", (job_id, tenant)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def get_prompt(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT prompt FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["prompt"] if row is not None else None
+
+    def mark_running(self, job_id: str):
+        self._update(job_id, "status = ?, attempts = attempts + 1", (RUNNING,))
+
+    def complete(self, job_id: str, answer: str, owner: str = None) -> bool:
+        """Stores the answer. With `owner`, only if that worker still holds the lease (returns False otherwise)."""
+        return self._update(job_id, "status = ?, answer = ?, error = NULL, code = NULL", (DONE, answer), owner)
+
+    def fail(self, job_id: str, error: str, code: int = 500, owner: str = None) -> bool:
+        return self._update(job_id, "status = ?, error = ?, code = ?", (FAILED, error, code), owner)
+
+    def claim(self, owner: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT_SECS,
+              max_deliveries: int = JOB_MAX_DELIVERIES):
+        """
+        Leases the oldest runnable job to `owner`: a queued one, or a running one
+        whose worker let its lease expire. Jobs past their deadline, and jobs
+        delivered `max_deliveries` times already, are failed on the way.
+
+        Returns:
+            a Claim, or None if nothing is runnable
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers never claim the same row.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, code = 500, lease_owner = NULL, updated_at = ? "
+                    "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                    (FAILED, f"Abandoned after {max_deliveries} deliveries", now, RUNNING, now, max_deliveries))
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, code = 504, updated_at = ? "
+                    "WHERE status = ? AND deadline_at < ?",
+                    (FAILED, "Request deadline passed before a worker was free", now, QUEUED, now))
+                row = self._conn.execute(
+                    "SELECT id, prompt, attempts, deadline_at FROM jobs "
+                    "WHERE status = ? OR (status = ? AND lease_expires_at < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                        "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, owner, now + visibility_timeout, now, row["id"]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Claim(row["id"], row["prompt"], row["attempts"] + 1, row["deadline_at"])
+
+    def extend(self, job_id: str, owner: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT_SECS) -> bool:
+        """Pushes out `owner`'s lease; False if the job was meanwhile redelivered or finished."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + visibility_timeout, job_id, RUNNING, owner))
+        return cursor.rowcount > 0
+
+    def unfinished(self):
+        """Ids of jobs that were queued or running, oldest first (used to resume after a restart)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _update(self, job_id: str, assignments: str, params: tuple, owner: str = None) -> bool:
+        condition = "id = ?"
+        if owner is not None:
+            condition += " AND status = ? AND lease_owner = ?"
+            params = (*params, time.time(), job_id, RUNNING, owner)
+        else:
+            params = (*params, time.time(), job_id)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE {condition}", params)
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        return {field: row[field] for field in _PUBLIC_FIELDS}
+
+
+def open_job_store(url: str = WORK_QUEUE_URL):
+    """The store for WORK_QUEUE_URL, or the local JOB_DB_PATH database when it is unset."""
+    if not url:
+        return JobStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from app.redis_job_store import RedisJobStore
+        return RedisJobStore(url)
+    if url.startswith("sqlite:///"):
+        return JobStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported WORK_QUEUE_URL {url!r}; use sqlite:///path or redis://host:port/db")
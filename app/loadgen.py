@@ -0,0 +1,263 @@
+# loadgen.py
+"""
+HTTP load generator for the service itself.
+
+Sends POST /generate at fixed arrival rates (open loop: requests start on
+schedule whether or not earlier ones have finished, and latency is measured
+from the scheduled start, so a slow server cannot hide its queueing) and
+reports achieved throughput, latency percentiles and status codes per rate.
+Run it against a service started with ANSWER_BACKEND=fake to find where the
+HTTP, admission and cache layers saturate without paying for browsers.
+
+Usage:
+    python -m app.loadgen --spawn --rates 50,100,200,400 --duration 10 --output load.json
+    python -m app.loadgen --url http://127.0.0.1:8000 --api-key $API_KEY --rates 100
+    python -m app.loadgen --spawn --rates 100 --compare load.json
+
+--spawn starts uvicorn with the fake backend on a free port; backend and
+service settings (FAKE_LATENCY, ADMISSION_MAX_CONCURRENCY, ...) are taken
+from the environment.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+from app.logging_utils import get_logger
+from app.benchmark import summarize
+
+logger = get_logger(__name__)
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; enough of the protocol for the service's JSON responses."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes, headers: dict):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Length: {len(body)}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        self.writer.write(head.encode() + b"\r\n" + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            payload = b""
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                payload += chunk[:-2]
+        else:
+            payload = await self.reader.readexactly(int(response_headers.get("content-length", "0")))
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class ConnectionPool:
+    def __init__(self, host: str, port: int, size: int):
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(Connection(host, port))
+
+    async def request(self, *args):
+        conn = await self._idle.get()
+        try:
+            return await conn.request(*args)
+        except BaseException:
+            # Includes cancellation by a client timeout: a half-read response must not be reused.
+            conn.close()
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+async def run_rate(url: str, api_key: str, rate: float, duration: float, connections: int,
+                   hit_ratio: float, timeout: float) -> dict:
+    """Offers `rate` requests per second for `duration` seconds and summarizes the responses."""
+    parts = urlsplit(url)
+    pool = ConnectionPool(parts.hostname, parts.port or 80, connections)
+    headers = {"Content-Type": "application/json", "x-api-key": api_key}
+    results = []
+
+    async def one(i: int, scheduled: float):
+        # A share of prompts repeats so cache hits can be mixed in.
+        prompt = "loadgen warm prompt" if i % 100 < hit_ratio * 100 else f"loadgen prompt {rate} #{i}"
+        body = json.dumps({"prompt": prompt}).encode()
+        try:
+            status, response_headers, payload = await asyncio.wait_for(
+                pool.request("POST", "/generate", body, headers), timeout)
+            if status == 200:
+                data = json.loads(payload)
+                # Upstream errors (blocked, timed out) come back as 200 with an error object as the answer.
+                if data.get("status") == "error" or isinstance(data.get("answer"), dict):
+                    status = "app_error"
+            cache = response_headers.get("x-cache")
+        except asyncio.TimeoutError:
+            status, cache = "timeout", None
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            status, cache = type(e).__name__, None
+        results.append((str(status), time.perf_counter() - scheduled, cache))
+
+    loop_started = time.perf_counter()
+    total = int(rate * duration)
+    tasks = []
+    for i in range(total):
+        scheduled = loop_started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, scheduled)))
+    # How far the sender itself fell behind: if large, the generator, not the service, is the limit.
+    send_lag = time.perf_counter() - (loop_started + (total - 1) / rate) if total else 0.0
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - loop_started
+    pool.close()
+
+    ok = [latency for status, latency, _ in results if status == "200"]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "rate": rate,
+        "requests": total,
+        "succeeded": len(ok),
+        "statuses": statuses,
+        "cache_hits": sum(1 for _, _, cache in results if cache == "hit"),
+        "wall_secs": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "send_lag_secs": round(send_lag, 3),
+        "latency": summarize(ok),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_service(api_key: str):
+    """Starts the service with the fake backend; returns (process, base URL)."""
+    port = _free_port()
+    env = {**os.environ, "ANSWER_BACKEND": "fake", "API_KEY": os.environ.get("API_KEY") or api_key}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Service did not start within 30s")
+
+
+def print_report(report: dict, baseline: dict = None):
+    base_levels = {level["rate"]: level for level in (baseline or {}).get("levels", [])}
+    print(f"\n{'rate':>8}{'achieved':>10}{'ok':>7}{'p50':>9}{'p95':>9}{'p99':>9}"
+          + (f"{'Δp50':>9}{'Δp99':>9}" if base_levels else "") + "  statuses")
+    for level in report["levels"]:
+        latency = level["latency"]
+        line = f"{level['rate']:>8g}{level['throughput_rps'] or 0:>10.1f}{level['succeeded']:>7}"
+        if latency.get("count"):
+            line += f"{latency['p50']:>9.3f}{latency['p95']:>9.3f}{latency['p99']:>9.3f}"
+        else:
+            line += f"{'-':>9}{'-':>9}{'-':>9}"
+        base = base_levels.get(level["rate"])
+        if base_levels:
+            if base and base["latency"].get("count") and latency.get("count"):
+                line += f"{latency['p50'] - base['latency']['p50']:>+9.3f}" \
+                        f"{latency['p99'] - base['latency']['p99']:>+9.3f}"
+            else:
+                line += f"{'-':>9}{'-':>9}"
+        print(f"{line}  {level['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the HTTP service (best with ANSWER_BACKEND=fake).")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", "loadgen"))
+    parser.add_argument("--spawn", action="store_true", help="start the service with the fake backend")
+    parser.add_argument("--rates", default="25,50,100,200", help="comma-separated requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per rate")
+    parser.add_argument("--connections", type=int, default=256, help="keep-alive connections")
+    parser.add_argument("--hit-ratio", type=float, default=0.0, help="share of requests for one repeated prompt")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to print deltas against")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process, url = spawn_service(args.api_key)
+    rates = [float(rate) for rate in args.rates.split(",") if rate.strip()]
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "settings": {"url": url, "duration": args.duration, "connections": args.connections,
+                     "hit_ratio": args.hit_ratio, "spawned": args.spawn,
+                     **{name: os.environ[name] for name in sorted(os.environ)
+                        if name.startswith(("FAKE_", "ADMISSION_", "ANSWER_CACHE_"))}},
+        "levels": [],
+    }
+    try:
+        for rate in rates:
+            logger.info(f"Offering {rate:g} req/s for {args.duration:g}s")
+            report["levels"].append(asyncio.run(run_rate(url, args.api_key, rate, args.duration,
+                                                         args.connections, args.hit_ratio, args.timeout)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
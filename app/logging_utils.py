@@ -1,29 +1,162 @@
 # logging_utils.py
+import atexit
+import contextvars
+import functools
 import logging
-import json
-from datetime import datetime
+import logging.handlers
+import os
+import queue
+import threading
+import time
 import traceback
+import uuid
+from datetime import datetime, timezone
+
+try:
+    import orjson
+except ImportError:  # optional: faster serializer
+    orjson = None
+import json
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Correlation id of the request being handled by the current thread/task.
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def bind_context(fn):
+    """
+    Wraps `fn` to run in a copy of the caller's context, so the request id
+    follows work handed to executor threads. Bind once per submitted call.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _dumps(payload: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode("utf-8")
+    return json.dumps(payload, default=str, separators=(",", ":"))
+
 
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         log_record = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # record.created, not "now": records are formatted later on the listener thread.
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
         }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            log_record["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            log_record["suppressed"] = suppressed
 
         # Include exception info if present
         if record.exc_info:
             log_record["exception"] = "".join(traceback.format_exception(*record.exc_info))
 
-        return json.dumps(log_record)
+        return _dumps(log_record)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the background listener without formatting them.
+
+    The stock QueueHandler renders the message and traceback on the calling
+    thread; here only the message arguments are merged and the correlation id
+    attached, everything else (traceback, JSON) happens on the listener thread.
+    Records are dropped, not blocked on, if the queue is full.
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_queue_handler = _QueueHandler(_log_queue)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler()
+        output.setFormatter(JSONFormatter())
+        _listener = logging.handlers.QueueListener(_log_queue, output, respect_handler_level=False)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
 
 def get_logger(name: str):
     logger = logging.getLogger(name)
     if not logger.handlers:  # prevent duplicate handlers
-        handler = logging.StreamHandler()
-        handler.setFormatter(JSONFormatter())
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
+        _start_listener()
+        logger.addHandler(_queue_handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
     return logger
+
+
+class _Sample:
+    __slots__ = ("last", "suppressed")
+
+    def __init__(self):
+        self.last = 0.0
+        self.suppressed = 0
+
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+def log_sampled(logger, level: int, key: str, message: str, interval: float = 5.0):
+    """
+    Logs `message` at most once per `interval` seconds for each (request, key);
+    the emitted record carries how many were suppressed in between. Meant for
+    per-poll messages in hot loops.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    sample_key = (request_id_var.get(), key)
+    now = time.monotonic()
+    with _samples_lock:
+        sample = _samples.get(sample_key)
+        if sample is None:
+            if len(_samples) > 10000:
+                _samples.clear()
+            sample = _samples[sample_key] = _Sample()
+        if now - sample.last < interval:
+            sample.suppressed += 1
+            return
+        suppressed, sample.suppressed, sample.last = sample.suppressed, 0, now
+    logger.log(level, message, extra={"suppressed": suppressed} if suppressed else None)
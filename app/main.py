@@ -1,22 +1,112 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Header
-from pydantic import BaseModel
-from app.logging_utils import get_logger
-from app.selenium_service import get_chatgpt_answer
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Response, Query
+from pydantic import BaseModel, Field
+from app.logging_utils import get_logger, request_id_var, new_request_id
+from app.answer_cache import get_answer_cache
+from app.job_service import submit_job, wait_for_job, resume_unfinished_jobs, shutdown_jobs
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from app.admission import get_admission_controller, QueueFullError
+from app.driver_pool import get_driver_pool, shutdown_driver_pool
+from app.metrics import register_gauge, render_metrics
+from app.stream_service import stream_answer_events
+from app.batch_service import run_batch, stream_batch_ndjson
+from app.warmup import get_warmup, WARMING
+from app.tracing import trace_requested_var, get_trace, list_traces
+from app.deadline import deadline_scope, parse_timeout_header, DeadlineExceeded
+from app.browser_governor import get_browser_governor, shutdown_browser_governor
+from app.backends import get_backend, get_cached_answer
+from app.tenants import API_KEY, QuotaExceededError, current_tenant_var, resolve_tenant, get_tenants
 
 import os
 
-API_KEY = os.getenv("API_KEY")
+# Key for admin endpoints (cache invalidation); falls back to API_KEY.
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY") or API_KEY
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Everything here must return quickly: browsers start on the warm-up thread.
+    get_tenants()  # a malformed API_KEYS fails startup rather than the first request
+    backend = get_backend()
+    resume_unfinished_jobs()
+    if backend.uses_browsers:
+        # Reaps orphaned Chrome processes first, then watches pooled browsers' RSS/CPU.
+        get_browser_governor().start()
+        get_warmup().start()
+    yield
+    shutdown_browser_governor()
+    shutdown_jobs()
+    if backend.uses_browsers:
+        # Quit pooled browsers so Chrome processes don't outlive the server.
+        shutdown_driver_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 
 logger = get_logger(__name__)
 
+def _pool_stats():
+    """Pool state, or None when the backend runs no browsers in this process (no pool is created then)."""
+    return get_driver_pool().stats() if get_backend().uses_browsers else None
+
+def _pool_browsers():
+    stats = _pool_stats()
+    return {(state,): stats[state] for state in ("idle", "leased", "starting")} if stats else {}
+
+def _pool_target():
+    stats = _pool_stats()
+    return stats["target"] if stats else {}
+
+register_gauge("lumen_pool_browsers", "Pooled browsers by state.", _pool_browsers, labels=("state",))
+register_gauge("lumen_pool_target_browsers", "Pool size the autoscaler is aiming for.", _pool_target)
+def _pool_rss():
+    sample = get_browser_governor().stats()
+    return {("total",): sample["rss_bytes"], ("max",): sample["max_rss_bytes"]}
+
+register_gauge("lumen_pool_rss_bytes", "Resident memory of pooled browsers (chromedriver + Chrome process trees), "
+               "as of the last governor sample.", _pool_rss, labels=("aggregate",))
+register_gauge("lumen_browser_cpu_percent", "CPU use of all pooled browsers' process trees (100 = one core).",
+               lambda: get_browser_governor().stats()["cpu_percent"])
+register_gauge("lumen_browser_processes", "Processes in pooled browsers' process trees.",
+               lambda: get_browser_governor().stats()["processes"])
+register_gauge("lumen_governor_actions", "Browsers retired over limits and orphaned processes killed since start.",
+               lambda: {(action,): get_browser_governor().stats()[action]
+                        for action in ("evicted_rss", "evicted_cpu", "orphans_reaped")},
+               labels=("action",))
+register_gauge("lumen_admission_requests", "Admitted and queued browser runs.",
+               lambda: {(state,): get_admission_controller().stats()[state] for state in ("active", "queued")},
+               labels=("state",))
+register_gauge("lumen_admission_capacity", "Browser runs allowed at once.",
+               lambda: get_admission_controller().stats()["capacity"])
+register_gauge("lumen_admission_shed", "Requests shed with 429 since start, by reason.",
+               lambda: {(reason,): get_admission_controller().stats()[reason] for reason in ("rejected", "timed_out")},
+               labels=("reason",))
+register_gauge("lumen_tenant_requests", "Admitted and queued browser runs per API key.",
+               lambda: {(name, state): tenant[state]
+                        for name, tenant in get_admission_controller().stats()["tenants"].items()
+                        for state in ("active", "queued")},
+               labels=("tenant", "state"))
+register_gauge("lumen_tenant_shed", "Requests per API key shed with 429 since start, by reason.",
+               lambda: {(name, reason): tenant[reason]
+                        for name, tenant in get_admission_controller().stats()["tenants"].items()
+                        for reason in ("rejected", "timed_out")},
+               labels=("tenant", "reason"))
+register_gauge("lumen_cache_entries", "Answers held in the in-memory cache.",
+               lambda: get_answer_cache().stats()["entries"])
+register_gauge("lumen_cache_lookups", "Answer cache lookups by result since start.",
+               lambda: {(result,): get_answer_cache().stats()[result] for result in ("hit", "miss", "shared")},
+               labels=("result",))
+
 class PromptRequest(BaseModel):
     prompt: str
 
+class BatchRequest(BaseModel):
+    prompts: list[str] = Field(..., min_length=1, max_length=100)
+    concurrency: int = Field(2, ge=1, le=32)
+    stream: bool = False
+
 @app.get("/")
 def read_root():
     return {"status": "ok",
@@ -24,24 +114,195 @@ def read_root():
             "instruction": "/docs for API swagger UI",
            }
 
+@app.exception_handler(QueueFullError)
+def queue_full_handler(request, exc: QueueFullError):
+    content = {"status": "error", "message": str(exc), "retry_after": exc.retry_after}
+    if exc.quota is not None:
+        content["quota"] = exc.quota
+    return JSONResponse(status_code=429, content=content, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(QuotaExceededError)
+def quota_exceeded_handler(request, exc: QuotaExceededError):
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "message": str(exc), "retry_after": exc.retry_after, "quota": exc.quota},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    return JSONResponse(
+        status_code=504,
+        content={"status": "error", "message": str(exc), "phase": exc.phase},
+    )
+
+@app.middleware("http")
+async def correlate_request(request, call_next):
+    """Tags every log line of a request with X-Request-ID (generated if absent) and echoes it back."""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id[:64])
+    # "X-Trace: 1" records this request's WebDriver commands (see /debug/traces).
+    trace_token = trace_requested_var.set(request.headers.get("X-Trace", "").lower() in ("1", "true"))
+    # Admission control schedules by API key; unknown keys are rejected by the endpoint itself.
+    tenant_token = current_tenant_var.set(resolve_tenant(request.headers.get("X-API-Key")))
+    try:
+        # Every wait in the flow draws from this budget (X-Request-Timeout or REQUEST_DEADLINE_SECS).
+        with deadline_scope(parse_timeout_header(request.headers.get("X-Request-Timeout"))):
+            response = await call_next(request)
+    finally:
+        current_tenant_var.reset(tenant_token)
+        trace_requested_var.reset(trace_token)
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id[:64]
+    return response
+
 @app.get("/health")
 def health_check():
     logger.info("Health check called")
     return {"status": "ok"}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness for the load balancer: 503 while start-up browsers are still
+    warming, and while every browser is busy and the queue is full.
+    """
+    admission = get_admission_controller().stats()
+    warmup = get_warmup().stats()
+    if warmup["state"] == WARMING:
+        status = "warming"
+    else:
+        status = "saturated" if admission["saturated"] else "ready"
+    body = {"status": status,
+            "backend": get_backend().name,
+            "warmup": warmup,
+            "admission": admission}
+    if get_backend().uses_browsers:
+        body["pool"] = _pool_stats()
+        body["resources"] = get_browser_governor().stats()
+    return JSONResponse(status_code=200 if status == "ready" else 503, content=body)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: per-phase latency histograms, run outcomes, pool/queue/cache gauges."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/generate")
-def generate(req: PromptRequest, x_api_key: str = Header(...)):
+def generate(req: PromptRequest, response: Response, x_api_key: str = Header(...)):
     check_api_key(x_api_key)
 
     if not req.prompt:
         raise HTTPException(400, "Prompt is required")
     try:
-        answer = get_chatgpt_answer(req.prompt)
-        return {"status": "ok", "answer": answer}
+        answer, cache_status = get_cached_answer(req.prompt)
+        response.headers["X-Cache"] = cache_status
+        return {"status": "ok", "answer": answer, "cache": cache_status}
+    except (QueueFullError, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.exception("Error generating response")
         return {"status": "error", "message": str(e)}
-    
-def check_api_key(x_api_key: str = Header(...)):
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Unauthorized")
\ No newline at end of file
+
+@app.post("/generate/stream")
+def generate_stream(req: PromptRequest, x_api_key: str = Header(...)):
+    """Streams the answer as Server-Sent Events while it renders (delta, reset, done/error)."""
+    check_api_key(x_api_key)
+
+    if not req.prompt:
+        raise HTTPException(400, "Prompt is required")
+    get_admission_controller().check()
+    return StreamingResponse(
+        stream_answer_events(req.prompt),
+        media_type="text/event-stream",
+        # Disable proxy buffering so deltas reach the client as they are produced.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/generate/batch")
+def generate_batch(req: BatchRequest, x_api_key: str = Header(...)):
+    """
+    Answers a list of prompts across the browser pool. Returns results in input
+    order, or NDJSON lines as items finish when `stream` is true.
+    """
+    check_api_key(x_api_key, cost=len(req.prompts))
+
+    get_admission_controller().check()
+    if req.stream:
+        return StreamingResponse(stream_batch_ndjson(req.prompts, req.concurrency),
+                                 media_type="application/x-ndjson")
+    return {"status": "ok", "results": run_batch(req.prompts, req.concurrency)}
+
+@app.post("/jobs", status_code=202)
+def create_job(req: PromptRequest, response: Response, x_api_key: str = Header(...),
+               idempotency_key: str | None = Header(None)):
+    """Queues a prompt and returns immediately; poll GET /jobs/{id} for the answer."""
+    tenant = check_api_key(x_api_key)
+
+    if not req.prompt:
+        raise HTTPException(400, "Prompt is required")
+    job, created = submit_job(req.prompt, idempotency_key, tenant=tenant.name)
+    if not created:
+        # Retried request: hand back the original job instead of running the flow again.
+        response.status_code = 200
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, x_api_key: str = Header(...),
+                  wait: float = Query(0, ge=0, le=60, description="Long-poll for up to this many seconds")):
+    tenant = check_api_key(x_api_key, cost=0)
+
+    # Other keys' jobs are reported as missing rather than forbidden, so ids cannot be probed.
+    job = await wait_for_job(job_id, wait, tenant=tenant.name)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
+
+@app.delete("/cache")
+def invalidate_cache(prompt: str | None = Query(None, description="Prompt to drop; omit to clear the whole cache"),
+                     x_api_key: str = Header(...)):
+    check_admin_key(x_api_key)
+
+    removed = get_answer_cache().invalidate(prompt)
+    logger.info(f"Answer cache invalidated ({removed} entries)")
+    return {"status": "ok", "removed": removed}
+
+@app.get("/cache")
+def cache_stats(x_api_key: str = Header(...)):
+    check_admin_key(x_api_key)
+    return get_answer_cache().stats()
+
+@app.get("/debug/traces")
+def traces(request_id: str = Query(None), x_api_key: str = Header(...)):
+    """Summaries of recent WebDriver command traces (round-trips and time per phase), newest first."""
+    check_admin_key(x_api_key)
+    return {"traces": list_traces(request_id)}
+
+@app.get("/debug/traces/{trace_id}")
+def trace_events(trace_id: str, x_api_key: str = Header(...)):
+    """One trace in Chrome trace-event JSON; save it and open it in Perfetto."""
+    check_admin_key(x_api_key)
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return JSONResponse(trace.to_chrome(), headers={
+        "Content-Disposition": f'attachment; filename="{trace_id}.json"'})
+
+def check_admin_key(x_api_key: str = Header(...)):
+    if x_api_key != ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+def check_api_key(x_api_key: str = Header(...), cost: int = 1):
+    """
+    Accepts any configured key and charges `cost` requests to its rate limit
+    (polling endpoints pass 0).
+
+    Raises:
+        HTTPException: 401 for an unknown key
+        QuotaExceededError: if the key is over its rate limit
+    """
+    tenant = resolve_tenant(x_api_key)
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    tenant.take(cost)
+    return tenant
\ No newline at end of file
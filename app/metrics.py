@@ -0,0 +1,161 @@
+# metrics.py
+import threading
+import time
+from contextlib import contextmanager
+from app.tracing import set_phase, reset_phase, record_phase
+
+# Seconds; spans a cheap WebDriver call up to the longest browser flow.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    yield f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {count}"
+                yield f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {series['count']}"
+                yield f"{self.name}_sum{_format_labels(self.labels, key)} {series['sum']}"
+                yield f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}"
+
+
+class Gauge:
+    """
+    Gauge read from a callback at scrape time. The callback returns a number,
+    or a dict mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, help_text: str, callback, labels=()):
+        self.name, self.help, self.labels, self.callback = name, help_text, tuple(labels), callback
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            values = self.callback()
+        except Exception:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def register_gauge(name: str, help_text: str, callback, labels=()):
+    return register(Gauge(name, help_text, callback, labels))
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition format (version 0.0.4) for every registered metric."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+PHASE_SECONDS = register(Histogram(
+    "lumen_phase_seconds", "Time spent in each phase of the browser flow.", labels=("phase",)
+))
+RUN_OUTCOMES = register(Counter(
+    "lumen_browser_runs_total", "Browser flow runs by outcome (success or error code).", labels=("outcome",)
+))
+
+
+_phase_listeners = []
+
+
+def add_phase_listener(callback):
+    """Registers callback(phase, seconds) for every phase observation (used by the benchmark for raw samples)."""
+    _phase_listeners.append(callback)
+
+
+def remove_phase_listener(callback):
+    if callback in _phase_listeners:
+        _phase_listeners.remove(callback)
+
+
+@contextmanager
+def phase_timer(phase: str):
+    """
+    Records the duration of the enclosed block under lumen_phase_seconds{phase=...}.
+    WebDriver commands made inside it are traced under this phase.
+    """
+    started = time.perf_counter()
+    token = set_phase(phase)
+    try:
+        yield
+    finally:
+        reset_phase(token)
+        observe_phase(phase, time.perf_counter() - started)
+
+
+def observe_phase(phase: str, seconds: float):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    record_phase(phase, seconds)
+    for callback in list(_phase_listeners):
+        callback(phase, seconds)
+
+
+def record_outcome(outcome):
+    RUN_OUTCOMES.inc(outcome=outcome)
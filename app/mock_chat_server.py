@@ -0,0 +1,257 @@
+# mock_chat_server.py
+"""
+Local stand-in for the chat site, used by the benchmark and for offline testing.
+
+Serves a page with the same selectors the service relies on
+(`div.ProseMirror[contenteditable='true']` for input, `div.markdown.prose`
+for answers, a stop button while streaming) and a
+`/backend-api/conversation` endpoint that streams the answer as SSE at a
+configurable token rate.
+
+Every setting can be overridden per page load through the query string, e.g.
+`http://127.0.0.1:8765/?token_rate=20&status=403`.
+
+Usage:
+    python -m app.mock_chat_server --port 8765 --token-rate 40 --answer-tokens 120
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from app.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SETTINGS = {
+    "token_rate": 40.0,        # tokens per second while streaming
+    "answer_tokens": 120,      # tokens per answer
+    "first_token_delay": 0.5,  # seconds before the first token
+    "page_delay": 0.0,         # seconds before the page HTML is served
+    "editor_delay": 0.0,       # seconds before the editor appears (simulates app bootstrap)
+    "status": 200,             # HTTP status of the conversation endpoint
+    "error_rate": 0.0,         # probability of answering with `error_status` instead
+    "error_status": 500,
+}
+
+_PAGE = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mock Chat</title>
+<style>
+  body { font-family: sans-serif; margin: 0; }
+  #thread { padding: 1rem; }
+  .ProseMirror { border: 1px solid #888; min-height: 2rem; margin: 1rem; padding: .5rem; }
+</style>
+</head>
+<body>
+<nav><a href="/" data-testid="create-new-chat-button">New chat</a></nav>
+<main id="thread"></main>
+<div id="composer"></div>
+<script>
+const query = window.location.search;
+
+function mountEditor() {
+  const editor = document.createElement("div");
+  editor.className = "ProseMirror";
+  editor.setAttribute("contenteditable", "true");
+  editor.addEventListener("keydown", (event) => {
+    if (event.key === "Enter" && !event.shiftKey) {
+      event.preventDefault();
+      const prompt = editor.innerText.trim();
+      if (prompt) {
+        editor.innerHTML = "";
+        send(prompt);
+      }
+    }
+  });
+  document.getElementById("composer").appendChild(editor);
+}
+
+function turn(role) {
+  const wrapper = document.createElement("div");
+  wrapper.setAttribute("data-message-author-role", role);
+  document.getElementById("thread").appendChild(wrapper);
+  return wrapper;
+}
+
+async function send(prompt) {
+  turn("user").textContent = prompt;
+  const answer = document.createElement("div");
+  answer.className = "markdown prose result-streaming";
+  turn("assistant").appendChild(answer);
+  const stop = document.createElement("button");
+  stop.setAttribute("data-testid", "stop-button");
+  stop.textContent = "Stop";
+  document.getElementById("composer").appendChild(stop);
+  try {
+    const response = await fetch("/backend-api/conversation" + query, {
+      method: "POST",
+      headers: {"Content-Type": "application/json"},
+      body: JSON.stringify({prompt: prompt}),
+    });
+    if (!response.ok) {
+      answer.textContent = "Something went wrong. Status " + response.status;
+      return;
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const {value, done} = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, {stream: true});
+      let boundary;
+      while ((boundary = buffer.indexOf("\\n\\n")) >= 0) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const data = frame.split("\\n").filter(l => l.startsWith("data: ")).map(l => l.slice(6)).join("");
+        if (!data || data === "[DONE]") continue;
+        const parts = JSON.parse(data).message.content.parts;
+        answer.textContent = parts[0];
+      }
+    }
+  } finally {
+    answer.classList.remove("result-streaming");
+    stop.remove();
+  }
+}
+
+// In-app "New chat": clears the conversation without reloading, like the real SPA router.
+document.querySelector("[data-testid=create-new-chat-button]").addEventListener("click", (event) => {
+  event.preventDefault();
+  document.getElementById("thread").innerHTML = "";
+  const editor = document.querySelector(".ProseMirror");
+  if (editor) editor.innerHTML = "";
+});
+
+const editorDelay = Number(new URLSearchParams(query).get("editor_delay") || "__EDITOR_DELAY__");
+setTimeout(mountEditor, editorDelay * 1000);
+</script>
+</body>
+</html>
+"""
+
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+          "incididunt ut labore et dolore magna aliqua").split()
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    server_version = "MockChat/1.0"
+    settings = DEFAULT_SETTINGS
+
+    def log_message(self, format, *args):
+        logger.debug(f"mock chat: {format % args}")
+
+    def _settings(self) -> dict:
+        settings = dict(self.settings)
+        for key, values in parse_qs(urlparse(self.path).query).items():
+            if key in settings:
+                settings[key] = type(settings[key])(values[0])
+        return settings
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path != "/":
+            self.send_error(404)
+            return
+        settings = self._settings()
+        time.sleep(settings["page_delay"])
+        body = _PAGE.replace("__EDITOR_DELAY__", str(settings["editor_delay"])).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/backend-api/conversation":
+            self.send_error(404)
+            return
+        settings = self._settings()
+        length = int(self.headers.get("Content-Length") or 0)
+        prompt = json.loads(self.rfile.read(length) or b"{}").get("prompt", "")
+
+        status = settings["status"]
+        if status == 200 and random.random() < settings["error_rate"]:
+            status = settings["error_status"]
+        if status != 200:
+            body = json.dumps({"detail": f"mock error {status}"}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        message_id = uuid.uuid4().hex
+        words = [f"Answer to: {prompt[:40]}."] + [random.choice(_WORDS) for _ in range(settings["answer_tokens"])]
+        interval = 1.0 / settings["token_rate"] if settings["token_rate"] > 0 else 0.0
+        time.sleep(settings["first_token_delay"])
+        try:
+            for i in range(1, len(words) + 1):
+                finished = i == len(words)
+                self._event({
+                    "message": {
+                        "id": message_id,
+                        "author": {"role": "assistant"},
+                        "content": {"content_type": "text", "parts": [" ".join(words[:i])]},
+                        "status": "finished_successfully" if finished else "in_progress",
+                    }
+                })
+                if not finished:
+                    time.sleep(interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _event(self, payload: dict):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **settings):
+    """
+    Starts the mock chat server on a background thread.
+
+    Returns:
+        (server, base_url); call server.shutdown() to stop it
+    """
+    handler = type("ConfiguredMockChatHandler", (MockChatHandler,),
+                   {"settings": {**DEFAULT_SETTINGS, **settings}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-chat", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/"
+    logger.info(f"Mock chat server listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local mock of the chat page.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, default in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+    server, _ = start_mock_server(args.host, args.port, **settings)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# network_monitor.py
+import json
+import os
+import re
+from app.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Requests whose failure means the chat flow cannot succeed: the conversation
+# endpoints and the anti-bot "chat requirements" check. Other backend calls
+# (feature flags, profile, ...) fail routinely for anonymous sessions, and the
+# page document itself is skipped because Cloudflare serves its interstitial
+# challenge with a 403 that resolves on its own.
+CHAT_BACKEND_URL_PATTERN = os.getenv(
+    "CHAT_BACKEND_URL_PATTERN",
+    r"/backend-(?:api|anon)/(?:f/)?conversation|/sentinel/chat-requirements",
+)
+
+
+class BlockedError(Exception):
+    """The chat backend answered with an HTTP error or the request failed."""
+
+    def __init__(self, status: int, url: str, reason: str = ""):
+        self.status = status
+        self.url = url
+        self.reason = reason
+        super().__init__(f"Chat backend returned {status} for {url}" + (f" ({reason})" if reason else ""))
+
+
+class NetworkMonitor:
+    """
+    Incremental consumer of Chrome's performance log (CDP Network events).
+
+    Each `poll()` drains only the events buffered since the previous call, so
+    a check costs one WebDriver round-trip and never touches the page DOM.
+    Requires the driver to be started with performance logging enabled
+    (see get_basic_driver).
+
+    Other consumers of the same events (the performance log can only be
+    drained once) register with `add_listener`.
+
+    Args:
+        driver: Selenium WebDriver instance
+        url_pattern: regex selecting the requests whose failure is fatal
+    """
+
+    def __init__(self, driver, url_pattern: str = CHAT_BACKEND_URL_PATTERN):
+        self.driver = driver
+        self.url_pattern = re.compile(url_pattern)
+        self.failure = None
+        self.responses_seen = 0
+        self._urls = {}
+        self._available = True
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registers callback(method, params) for every Network event drained from now on."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @property
+    def available(self) -> bool:
+        """False once the driver turned out to have no performance log."""
+        return self._available
+
+    def reset(self):
+        """Discards events buffered before this point (e.g. from the previous request)."""
+        self._drain()
+        self.failure = None
+        self._urls.clear()
+
+    def poll(self):
+        """
+        Processes new network events.
+
+        Returns:
+            BlockedError for the first fatal response seen so far, or None
+        """
+        if self.failure is None:
+            for method, params in self._drain():
+                self._handle(method, params)
+                for listener in list(self._listeners):
+                    listener(method, params)
+                if self.failure is not None:
+                    break
+        return self.failure
+
+    def raise_for_status(self):
+        """Raises BlockedError as soon as a tracked request has failed."""
+        failure = self.poll()
+        if failure is not None:
+            raise failure
+
+    def _drain(self):
+        if not self._available:
+            return []
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception as e:
+            # Driver started without performance logging: nothing to consume.
+            logger.warning(f"Performance log unavailable, network checks disabled: {e}")
+            self._available = False
+            return []
+        events = []
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            method = message.get("method", "")
+            if method.startswith("Network."):
+                events.append((method, message.get("params", {})))
+        return events
+
+    def _tracked(self, url: str) -> bool:
+        return bool(self.url_pattern.search(url or ""))
+
+    def _handle(self, method: str, params: dict):
+        if method == "Network.requestWillBeSent":
+            request = params.get("request", {})
+            if self._tracked(request.get("url")):
+                self._urls[params.get("requestId")] = request.get("url")
+
+        elif method == "Network.responseReceived":
+            response = params.get("response", {})
+            url = response.get("url", "")
+            if not self._tracked(url):
+                return
+            self.responses_seen += 1
+            status = int(response.get("status") or 0)
+            if status >= 400:
+                self.failure = BlockedError(status, url, response.get("statusText", ""))
+                logger.warning(str(self.failure))
+
+        elif method == "Network.loadingFailed":
+            url = self._urls.get(params.get("requestId"))
+            # Cancelled requests and ones we block on purpose are not failures.
+            if url is None or params.get("canceled") or params.get("blockedReason"):
+                return
+            self.failure = BlockedError(502, url, params.get("errorText", "loading failed"))
+            logger.warning(str(self.failure))
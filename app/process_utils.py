@@ -0,0 +1,167 @@
+# process_utils.py
+import hashlib
+import os
+import signal
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _default_owner_tag() -> str:
+    # Same install and user: same tag across restarts, so a restarted service
+    # still recognizes the browsers a crashed run left behind.
+    install_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return hashlib.sha256(f"{install_dir}:{uid}".encode()).hexdigest()[:12]
+
+
+# Marks the browsers this deployment starts; Chrome ignores the unknown switch.
+# Deployments sharing a host get different tags unless they set the same one.
+BROWSER_OWNER_TAG = os.getenv("BROWSER_OWNER_TAG") or _default_owner_tag()
+BROWSER_OWNER_ARG = f"--lumen-owner={BROWSER_OWNER_TAG}"
+
+
+def _read(path: str):
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", "replace")
+    except OSError:
+        return None
+
+
+def parent_pids() -> dict:
+    """Maps every visible pid to its parent pid, read from /proc/<pid>/stat."""
+    parents = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return parents
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        stat = _read(f"/proc/{entry}/stat")
+        if not stat:
+            continue
+        # The command name may contain spaces and parentheses; fields resume after the last ")".
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1:
+            parents[int(entry)] = int(fields[1])
+    return parents
+
+
+def process_tree(root_pid: int, parents: dict = None) -> list:
+    """`root_pid` plus all of its descendants."""
+    parents = parent_pids() if parents is None else parents
+    children = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in tree:
+            continue
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of one process, 0 if it is gone."""
+    statm = _read(f"/proc/{pid}/statm")
+    if not statm:
+        return 0
+    return int(statm.split()[1]) * _PAGE_SIZE
+
+
+def driver_root_pids(driver) -> list:
+    """Top-level processes started for a driver: chromedriver and, in UC mode, the browser."""
+    pids = []
+    service = getattr(driver, "service", None)
+    process = getattr(service, "process", None)
+    if process is not None and getattr(process, "pid", None):
+        pids.append(process.pid)
+    browser_pid = getattr(driver, "browser_pid", None)
+    if browser_pid and browser_pid not in pids:
+        pids.append(browser_pid)
+    return pids
+
+
+def driver_pids(driver, parents: dict = None) -> list:
+    """Every live process belonging to a driver (chromedriver, browser, renderers, helpers)."""
+    parents = parent_pids() if parents is None else parents
+    pids = []
+    for root in driver_root_pids(driver):
+        for pid in process_tree(root, parents):
+            if pid not in pids:
+                pids.append(pid)
+    return pids
+
+
+def driver_rss_bytes(driver, parents: dict = None) -> int:
+    """Total RSS of a driver's process tree. Shared pages are counted once per process."""
+    return sum(rss_bytes(pid) for pid in driver_pids(driver, parents))
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _stat_fields(pid: int):
+    stat = _read(f"/proc/{pid}/stat")
+    if not stat:
+        return None
+    # Fields after the command name, starting with field 3 (state).
+    return stat[stat.rfind(")") + 2:].split()
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time consumed by a process so far, 0 if it is gone."""
+    fields = _stat_fields(pid)
+    if not fields or len(fields) < 13:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def process_age(pid: int) -> float:
+    """Seconds since a process started, None if it is gone."""
+    fields = _stat_fields(pid)
+    uptime = _read("/proc/uptime")
+    if not fields or len(fields) < 20 or not uptime:
+        return None
+    return float(uptime.split()[0]) - int(fields[19]) / CLOCK_TICKS
+
+
+def is_zombie(pid: int) -> bool:
+    """True for an exited process that its parent has not reaped yet."""
+    fields = _stat_fields(pid)
+    return bool(fields) and fields[0] == "Z"
+
+
+def process_cmdline(pid: int) -> list:
+    """Command-line arguments of a process, empty if it is gone or not ours to read."""
+    cmdline = _read(f"/proc/{pid}/cmdline")
+    return [arg for arg in cmdline.split("\0") if arg] if cmdline else []
+
+
+def in_container() -> bool:
+    """Best guess whether this process runs in a container (Docker, Podman, Kubernetes)."""
+    if os.path.exists("/.dockerenv") or os.path.exists("/run/.containerenv") or os.getenv("KUBERNETES_SERVICE_HOST"):
+        return True
+    cgroup = _read("/proc/1/cgroup") or ""
+    return any(marker in cgroup for marker in ("docker", "kubepods", "containerd", "libpod"))
+
+
+def process_name(pid: int) -> str:
+    """Command name (/proc/<pid>/comm), empty if the process is gone."""
+    return (_read(f"/proc/{pid}/comm") or "").strip()
+
+
+def kill_tree(pids, sig=None) -> int:
+    """Sends `sig` (default SIGKILL) to every pid, children first. Returns how many were signalled."""
+    sig = signal.SIGKILL if sig is None else sig
+    killed = 0
+    for pid in reversed(list(pids)):
+        try:
+            os.kill(pid, sig)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
@@ -0,0 +1,190 @@
+# redis_job_store.py
+"""
+Job store and work queue on Redis, for API and worker processes on several hosts.
+
+Each job is a hash `{<prefix>}:job:<id>`. Queued job ids wait in the list
+`{<prefix>}:queue`; claimed ones sit in the sorted set `{<prefix>}:inflight`
+scored by lease expiry. Creation, claims, lease extensions and
+acknowledgements are Lua scripts, so each is atomic across all processes.
+Needs the optional `redis` package.
+
+Single-node Redis (optionally with replicas) is supported, not Redis
+Cluster. The scripts build job keys from ids they read, which Cluster does
+not allow. Every key carries the `{<prefix>}` hash tag, so all of them
+would at least share one slot.
+"""
+import os
+import time
+import uuid
+from app.logging_utils import get_logger
+from app.tenants import DEFAULT_TENANT
+from app.job_store import (QUEUED, DONE, FAILED, JOB_VISIBILITY_TIMEOUT_SECS, JOB_MAX_DELIVERIES,
+                           Claim)
+
+logger = get_logger(__name__)
+
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "lumen")
+# Finished jobs are kept this long for polling clients.
+REDIS_JOB_TTL_SECS = int(os.getenv("REDIS_JOB_TTL_SECS", "86400"))
+
+# KEYS: queue, job[, idempotency]. ARGV: job id, ttl, job key prefix, then field/value pairs.
+# Returns the id of the new job, or of the job the idempotency key already points at.
+_CREATE_LUA = """
+if #KEYS == 3 then
+    local existing = redis.call('GET', KEYS[3])
+    if existing and redis.call('EXISTS', ARGV[3] .. existing) == 1 then
+        return existing
+    end
+    redis.call('SET', KEYS[3], ARGV[1], 'EX', tonumber(ARGV[2]))
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 4))
+redis.call('LPUSH', KEYS[1], ARGV[1])
+return ARGV[1]
+"""
+
+# KEYS: queue, inflight. ARGV: now, visibility timeout, owner, max deliveries, job key prefix, ttl.
+_CLAIM_LUA = """
+local now = tonumber(ARGV[1])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = ARGV[5] .. id
+    if redis.call('HGET', key, 'status') == 'running' then
+        local attempts = tonumber(redis.call('HGET', key, 'attempts') or '0')
+        if attempts >= tonumber(ARGV[4]) then
+            redis.call('HSET', key, 'status', 'failed', 'error', 'Abandoned after ' .. attempts .. ' deliveries',
+                       'code', 500, 'lease_owner', '', 'updated_at', now)
+            redis.call('EXPIRE', key, tonumber(ARGV[6]))
+        else
+            -- Redelivered jobs go to the consuming end so they run next.
+            redis.call('HSET', key, 'status', 'queued', 'lease_owner', '', 'updated_at', now)
+            redis.call('RPUSH', KEYS[1], id)
+        end
+    end
+end
+while true do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        return false
+    end
+    local key = ARGV[5] .. id
+    if redis.call('HGET', key, 'status') == 'queued' then
+        local deadline = tonumber(redis.call('HGET', key, 'deadline_at') or '0') or 0
+        if deadline > 0 and deadline < now then
+            redis.call('HSET', key, 'status', 'failed', 'error', 'Request deadline passed before a worker was free',
+                       'code', 504, 'updated_at', now)
+            redis.call('EXPIRE', key, tonumber(ARGV[6]))
+        else
+            local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+            redis.call('HSET', key, 'status', 'running', 'lease_owner', ARGV[3], 'updated_at', now)
+            redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), id)
+            return {id, redis.call('HGET', key, 'prompt'), attempts, tostring(deadline)}
+        end
+    end
+end
+"""
+
+# KEYS: inflight, job. ARGV: now, visibility timeout, owner, job id.
+_EXTEND_LUA = """
+if redis.call('HGET', KEYS[2], 'status') ~= 'running' or redis.call('HGET', KEYS[2], 'lease_owner') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', tonumber(ARGV[1]) + tonumber(ARGV[2]), ARGV[4])
+return 1
+"""
+
+# KEYS: inflight, job. ARGV: owner ('' for any), job id, ttl, then field/value pairs.
+_FINISH_LUA = """
+if ARGV[1] ~= '' and (redis.call('HGET', KEYS[2], 'status') ~= 'running'
+                      or redis.call('HGET', KEYS[2], 'lease_owner') ~= ARGV[1]) then
+    return 0
+end
+redis.call('HDEL', KEYS[2], 'answer', 'error', 'code')
+redis.call('HSET', KEYS[2], unpack(ARGV, 4))
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+return 1
+"""
+
+
+class RedisJobStore:
+    """
+    JobStore with the same interface, backed by Redis.
+
+    Args:
+        url: redis:// URL
+        prefix: key prefix, so several deployments can share one Redis
+    """
+
+    def __init__(self, url: str, prefix: str = REDIS_KEY_PREFIX):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("WORK_QUEUE_URL=redis://... needs the redis package (pip install redis)") from e
+        self.url = url
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        tag = f"{{{prefix}}}"
+        self._queue = f"{tag}:queue"
+        self._inflight = f"{tag}:inflight"
+        self._job_prefix = f"{tag}:job:"
+        self._idempotency_prefix = f"{tag}:idempotency:"
+        self._create = self._redis.register_script(_CREATE_LUA)
+        self._claim = self._redis.register_script(_CLAIM_LUA)
+        self._extend = self._redis.register_script(_EXTEND_LUA)
+        self._finish = self._redis.register_script(_FINISH_LUA)
+
+    def create(self, prompt: str, idempotency_key: str = None, deadline_at: float = None,
+               tenant: str = DEFAULT_TENANT):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        keys = [self._queue, self._job_prefix + job_id]
+        if idempotency_key:
+            keys.append(f"{self._idempotency_prefix}{tenant}:{idempotency_key}")
+        fields = {"id": job_id, "prompt": prompt, "status": QUEUED, "attempts": 0,
+                  "created_at": now, "updated_at": now, "deadline_at": deadline_at or 0, "tenant": tenant}
+        # Checking the idempotency key and queueing the job in one script: concurrent retries create one job.
+        result = self._create(keys=keys, args=[job_id, REDIS_JOB_TTL_SECS, self._job_prefix,
+                                               *(item for pair in fields.items() for item in pair)])
+        return self.get(result), result == job_id
+
+    def get(self, job_id: str, tenant: str = None):
+        fields = self._redis.hgetall(self._job_prefix + job_id)
+        if not fields or (tenant is not None and fields.get("tenant", DEFAULT_TENANT) != tenant):
+            return None
+        return {
+            "id": fields["id"],
+            "status": fields["status"],
+            "answer": fields.get("answer"),
+            "error": fields.get("error"),
+            "code": int(fields["code"]) if fields.get("code") else None,
+            "attempts": int(fields.get("attempts", 0)),
+            "created_at": float(fields["created_at"]),
+            "updated_at": float(fields["updated_at"]),
+        }
+
+    def complete(self, job_id: str, answer: str, owner: str = None) -> bool:
+        return self._finish_job(job_id, owner, "status", DONE, "answer", answer)
+
+    def fail(self, job_id: str, error: str, code: int = 500, owner: str = None) -> bool:
+        return self._finish_job(job_id, owner, "status", FAILED, "error", error, "code", code)
+
+    def claim(self, owner: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT_SECS,
+              max_deliveries: int = JOB_MAX_DELIVERIES):
+        result = self._claim(keys=[self._queue, self._inflight],
+                             args=[time.time(), visibility_timeout, owner, max_deliveries, self._job_prefix,
+                                   REDIS_JOB_TTL_SECS])
+        if not result:
+            return None
+        job_id, prompt, attempts, deadline_at = result
+        return Claim(job_id, prompt, int(attempts), float(deadline_at) or None)
+
+    def extend(self, job_id: str, owner: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT_SECS) -> bool:
+        return bool(self._extend(keys=[self._inflight, self._job_prefix + job_id],
+                                 args=[time.time(), visibility_timeout, owner, job_id]))
+
+    def close(self):
+        self._redis.close()
+
+    def _finish_job(self, job_id: str, owner, *fields) -> bool:
+        return bool(self._finish(keys=[self._inflight, self._job_prefix + job_id],
+                                 args=[owner or "", job_id, REDIS_JOB_TTL_SECS,
+                                       *fields, "lease_owner", "", "updated_at", time.time()]))
@@ -1,4 +1,6 @@
 #selenium_service.py
+import os
+import logging
 import time
 import re
 import random
@@ -8,33 +10,52 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, ElementNotInteractableException, NoSuchElementException, WebDriverException
 from selenium.webdriver.common.action_chains import ActionChains
-from app.logging_utils import get_logger
-from app.driver_utils import handle_cloudflare_challenge, get_basic_driver
+from app.logging_utils import get_logger, log_sampled
+from app.driver_utils import handle_cloudflare_challenge
+from app.driver_pool import get_driver_pool, PoolExhaustedError, PoolClosedError
+from app.network_monitor import NetworkMonitor, BlockedError, CHAT_BACKEND_URL_PATTERN
+from app.stream_capture import (ConversationCapture, ANSWER_EXTRACTION, ANSWER_STREAM_URL_PATTERN,
+                                ANSWER_STREAM_POLL_SECS, ANSWER_STREAM_SETTLE_SECS)
+from app.backends import answer_error
+from app.metrics import phase_timer, observe_phase, record_outcome
+from app.tracing import set_phase, reset_phase
+from app.deadline import (DeadlineExceeded, budget, check_deadline, expired_error, backoff_delay, can_retry,
+                          remaining_budget)
 import json
 logger = get_logger(__name__)
 
-CHATGPT_URL = "https://chat.openai.com/"
+CHATGPT_URL = os.getenv("CHATGPT_URL", "https://chat.openai.com/")
 
 
-def submit_prompt(driver, prompt: str, wait_secs: int = 45, min_delay: float = 0.05, max_delay: float = 0.15):
-    """
-    Submit a prompt into ChatGPT's contenteditable ProseMirror div using Selenium,
-    simulating human-like typing.
+# Attempts per request; retries only start if enough of the deadline is left.
+FLOW_MAX_ATTEMPTS = int(os.getenv("FLOW_MAX_ATTEMPTS", "2"))
 
-    Args:
-        driver: Selenium WebDriver instance
-        prompt: string to submit
-        wait_secs: maximum wait for input box to appear
-        min_delay, max_delay: per-character typing delay range
-    """
-    try:
-        logger.info(f"Submitting prompt: '{prompt[:50]}...'")
+PROMPT_INSERT_MODE = os.getenv("PROMPT_INSERT_MODE", "insert")
+# Tried in this order when the editor content does not match after insertion.
+PROMPT_INSERT_FALLBACKS = {"insert": "script", "script": "type"}
 
-        # Wait for the input area to be visible
-        input_box = WebDriverWait(driver, wait_secs).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, "div.ProseMirror[contenteditable='true']"))
-        )
+_FOCUS_AND_CLEAR_JS = """
+const editor = arguments[0];
+editor.focus();
+const selection = window.getSelection();
+selection.selectAllChildren(editor);
+document.execCommand('delete');
+"""
+
+_EXEC_INSERT_JS = """
+const editor = arguments[0];
+editor.focus();
+document.execCommand('insertText', false, arguments[1]);
+"""
 
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def _insert_prompt(driver, input_box, prompt: str, mode: str, min_delay: float, max_delay: float):
+    """Places `prompt` into the editor using one strategy; see submit_prompt."""
+    if mode == "type":
         # Scroll into view
         driver.execute_script("arguments[0].scrollIntoView(true);", input_box)
         time.sleep(random.uniform(0.05, 0.15))
@@ -51,9 +72,62 @@ def submit_prompt(driver, prompt: str, wait_secs: int = 45, min_delay: float = 0
         for ch in prompt:
             input_box.send_keys(ch)
             time.sleep(random.uniform(min_delay, max_delay))
+        return
+
+    driver.execute_script(_FOCUS_AND_CLEAR_JS, input_box)
+    if mode == "insert":
+        # A single trusted input event; ProseMirror handles it like a paste.
+        driver.execute_cdp_cmd("Input.insertText", {"text": prompt})
+    elif mode == "script":
+        driver.execute_script(_EXEC_INSERT_JS, input_box, prompt)
+    else:
+        raise ValueError(f"Unknown prompt insert mode: {mode}")
+
+
+def submit_prompt(driver, prompt: str, wait_secs: int = 45, min_delay: float = 0.05, max_delay: float = 0.15,
+                  insert_mode: str = None):
+    """
+    Submit a prompt into ChatGPT's contenteditable ProseMirror div using Selenium.
+
+    Insert modes:
+        "insert": whole prompt in one CDP Input.insertText command (default)
+        "script": whole prompt via document.execCommand('insertText')
+        "type":   human-like typing, one send_keys per character
+
+    After a bulk insert the editor content is compared with the prompt; on a
+    mismatch the next mode in PROMPT_INSERT_FALLBACKS is tried.
+
+    Args:
+        driver: Selenium WebDriver instance
+        prompt: string to submit
+        wait_secs: maximum wait for input box to appear
+        min_delay, max_delay: per-character typing delay range ("type" mode)
+        insert_mode: one of the modes above; defaults to PROMPT_INSERT_MODE
+    """
+    mode = insert_mode or PROMPT_INSERT_MODE
+    try:
+        logger.info(f"Submitting prompt: '{prompt[:50]}...' (mode={mode})")
+
+        # Wait for the input area to be visible
+        input_box = WebDriverWait(driver, wait_secs).until(
+            EC.visibility_of_element_located((By.CSS_SELECTOR, "div.ProseMirror[contenteditable='true']"))
+        )
+
+        while True:
+            _insert_prompt(driver, input_box, prompt, mode, min_delay, max_delay)
+            if mode == "type":
+                break
+            entered = driver.execute_script("return arguments[0].innerText;", input_box)
+            if _normalize_text(entered) == _normalize_text(prompt):
+                break
+            fallback = PROMPT_INSERT_FALLBACKS.get(mode)
+            logger.warning(f"Editor content mismatch after '{mode}' insert "
+                           f"({len(entered or '')} vs {len(prompt)} chars), falling back to '{fallback}'")
+            mode = fallback
 
         # Small pause before pressing Enter (human hesitation)
-        time.sleep(random.uniform(0.2, 0.5))
+        if mode == "type":
+            time.sleep(random.uniform(0.2, 0.5))
         input_box.send_keys(Keys.RETURN)
 
         logger.info("Prompt submitted successfully")
@@ -70,141 +144,373 @@ def submit_prompt(driver, prompt: str, wait_secs: int = 45, min_delay: float = 0
         raise
 
 def clean_answer(answer: str) -> str:
-    """Clean up the answer text."""
-    text = re.sub(r"\s*\n\s*", " ", answer)
-    text = re.sub(r"\s+", " ", text)
+    """
+    Clean up the answer text, the same way whether it was read from the
+    network stream or the page: line breaks and indentation are kept,
+    trailing spaces and runs of blank lines are dropped.
+    """
+    lines = [line.rstrip() for line in answer.replace("\r\n", "\n").split("\n")]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
     return text.strip()
 
-def check_for_block(driver, timeout=5):
+def check_for_block(driver, monitor=None):
     """
-    Uses Chrome DevTools Protocol (CDP) to detect 403 Forbidden responses.
+    Detects a blocked or failed chat backend request from CDP network events.
     Returns True if a block is detected, otherwise False.
 
     Args:
         driver: SeleniumBase driver instance
-        timeout: How many seconds to poll for responses
+        monitor: NetworkMonitor tracking this page; a fresh one is created if omitted
 
     Returns:
         bool
     """
-    import time
+    monitor = monitor or NetworkMonitor(driver)
+    return monitor.poll() is not None
+
+# Resolves from inside the page instead of being polled from Python. A
+# MutationObserver watches the last assistant message; the script calls back
+# as soon as the answer is finished (text present, no streaming indicator and
+# no DOM mutation for `quietMs`), or, when `knownText` is given, as soon as the
+# rendered text differs from it. A PerformanceObserver also calls back early
+# when a chat backend request fails, so the caller can read the real status
+# from the network log, and, given `streamPattern`, once the response of a
+# request matching it has been read to the end. A separate timer that
+# mutations never push back makes it call back by `maxWaitMs` even while the
+# answer keeps streaming.
+_WAIT_FOR_ANSWER_JS = """
+const [selector, busySelector, knownText, quietMs, maxWaitMs, failurePattern, streamPattern] = arguments;
+const callback = arguments[arguments.length - 1];
+const started = Date.now();
+let lastMutation = Date.now();
+let finished = false;
+let observer = null;
+let perfObserver = null;
+let failedStatus = null;
+let streamEnded = false;
+let timer = null;
+let deadlineTimer = null;
+
+function snapshot() {
+    const nodes = document.querySelectorAll(selector);
+    const last = nodes.length ? nodes[nodes.length - 1] : null;
+    return {
+        present: last !== null,
+        text: last ? last.innerText.trim() : "",
+        busy: busySelector ? document.querySelector(busySelector) !== null : false,
+    };
+}
+
+function finish(state, done, timedOut) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    if (perfObserver) perfObserver.disconnect();
+    clearTimeout(timer);
+    clearTimeout(deadlineTimer);
+    callback({present: state.present, text: state.text, done: done, timed_out: timedOut,
+              failed_status: failedStatus, stream_ended: streamEnded});
+}
+
+function check() {
+    const state = snapshot();
+    const now = Date.now();
+    const quiet = now - lastMutation >= quietMs;
+    if (failedStatus !== null || streamEnded) {
+        return finish(state, false, false);
+    }
+    if (state.present && state.text && !state.busy && quiet) {
+        return finish(state, true, false);
+    }
+    if (knownText !== null && state.present && state.text !== knownText) {
+        return finish(state, false, false);
+    }
+    if (now - started >= maxWaitMs) {
+        return finish(state, false, true);
+    }
+    timer = setTimeout(check, Math.min(quietMs, Math.max(0, maxWaitMs - (now - started))));
+}
+
+observer = new MutationObserver(() => {
+    lastMutation = Date.now();
+    clearTimeout(timer);
+    timer = setTimeout(check, knownText !== null ? 150 : quietMs);
+});
+observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+if ((failurePattern || streamPattern) && window.PerformanceObserver) {
+    const failureRe = failurePattern ? new RegExp(failurePattern) : null;
+    const streamRe = streamPattern ? new RegExp(streamPattern) : null;
+    perfObserver = new PerformanceObserver((list) => {
+        for (const entry of list.getEntries()) {
+            if (failureRe && entry.responseStatus >= 400 && failureRe.test(entry.name)) {
+                failedStatus = entry.responseStatus;
+            } else if (streamRe && streamRe.test(entry.name)) {
+                streamEnded = true;
+            } else {
+                continue;
+            }
+            clearTimeout(timer);
+            timer = setTimeout(check, 0);
+        }
+    });
+    perfObserver.observe({type: "resource"});
+}
+deadlineTimer = setTimeout(() => {
+    check();
+    finish(snapshot(), false, true);
+}, maxWaitMs);
+check();
+"""
+
+ANSWER_SELECTOR = "div.markdown.prose"
+# Present while the assistant message is still being generated.
+ANSWER_BUSY_SELECTOR = "button[data-testid='stop-button'], .result-streaming"
+# Kept below chromedriver's default 30s script timeout. Drivers that share a
+# browser (app.tab_driver) set a shorter `wait_slice_secs`.
+ANSWER_WAIT_SLICE_SECS = 25
+
+
+def wait_for_answer_event(driver, timeout: float, known_text=None, quiet_ms: int = 750, stream_pattern=None):
+    """
+    Blocks inside the page (one WebDriver round-trip) until the assistant
+    answer is finished, or - if `known_text` is given - until its text changes.
 
-    try:
-        # Enable network tracking via CDP
-        driver.execute_cdp_cmd("Network.enable", {})
-
-        # Poll for a few seconds to catch any immediate 403 responses
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            # Get all current requests/responses from the browser
-            # Note: responseReceived events contain status codes
-            # SeleniumBase does not provide a direct API for CDP event stream,
-            # so we use execute_cdp_cmd with "Network.getResponseBody" for each request if needed.
-            # Here, we can inspect the page for a Cloudflare block element as a fallback
-            page_text = driver.find_element("tag name", "body").text
-            if "403" in page_text or "access denied" in page_text.lower():
-                return True
-            time.sleep(0.2)
+    Args:
+        driver: Selenium WebDriver instance
+        timeout: seconds to wait before returning the current state
+            (capped at the driver's wait slice)
+        known_text: last text seen by the caller, or None to wait for completion only
+        quiet_ms: how long the message must stay unchanged to count as finished
+        stream_pattern: regex of a request URL; also return once its response has ended
 
-        return False
+    Returns:
+        dict with keys present, text, done, timed_out, failed_status, stream_ended
+    """
+    wait_slice = getattr(driver, "wait_slice_secs", ANSWER_WAIT_SLICE_SECS)
+    max_wait_ms = int(max(0.0, min(timeout, wait_slice)) * 1000)
+    return driver.execute_async_script(
+        _WAIT_FOR_ANSWER_JS, ANSWER_SELECTOR, ANSWER_BUSY_SELECTOR, known_text, quiet_ms, max_wait_ms,
+        CHAT_BACKEND_URL_PATTERN, stream_pattern,
+    )
+
+def _raise_for_failure(monitor, result=None):
+    """Raises BlockedError if the network log (or the in-page wait) saw a failed backend request."""
+    monitor.raise_for_status()
+    if result and result.get("failed_status"):
+        raise BlockedError(result["failed_status"], "chat backend (resource timing)")
+
+def _wait_for_stream_end(monitor, capture):
+    """The response or the page says the answer is over, so the end of the stream is in the log or about to be."""
+    settle_deadline = time.monotonic() + ANSWER_STREAM_SETTLE_SECS
+    while not capture.finished and time.monotonic() < settle_deadline:
+        time.sleep(ANSWER_STREAM_POLL_SECS)
+        _raise_for_failure(monitor)
+    if not capture.finished:
+        logger.debug("Stream end not seen; taking the streamed text as the page finished rendering")
+
+def _read_response_from_network(driver, monitor, on_progress=None):
+    """
+    Takes the answer from the conversation request's SSE stream in the
+    network log (see app.stream_capture) instead of the rendered page.
 
-    except Exception as e:
-        print(f"Warning: Could not check for block via CDP ({e})")
-        return False
+    The page still paces the reads: the same blocking in-page wait as the
+    DOM path returns when answer text renders and, for streaming callers,
+    whenever it changes. It also returns as soon as the conversation
+    response has been read to the end, so the answer is complete at the end
+    of the stream instead of after the page's quiet window. The log is read
+    once after each return. When Chrome cannot stream the body, progress
+    comes from the rendered page and the answer from the full body.
+
+    Returns:
+        the cleaned answer text, an error dict if no answer started in time,
+        or None if the stream cannot be followed and the caller should read
+        the page instead
+    """
+    if not monitor.available:
+        return None
+    capture = ConversationCapture(driver)
+    monitor.add_listener(capture)
+    try:
+        phase = "first_token"
+        phase_started = time.monotonic()
+        deadline = phase_started + budget(30, phase)
+        rendered = ""
+        text = ""
+        while not capture.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                check_deadline(phase)
+                if phase == "first_token":
+                    logger.warning("Timeout while waiting for the answer stream to start.")
+                    return {"status": "error",
+                            "message": "Timeout occurred while waiting for the answer stream.",
+                            "code": 408}
+                raise TimeoutException("Answer stream did not end within 90 seconds")
+
+            # Until the first text, and for streaming callers, wake on every rendered change.
+            known_text = rendered if on_progress or phase == "first_token" else None
+            result = wait_for_answer_event(driver, timeout=remaining, known_text=known_text,
+                                           stream_pattern=ANSWER_STREAM_URL_PATTERN)
+            _raise_for_failure(monitor, result)
+            rendered = result["text"]
+
+            if not monitor.available:
+                return None
+            if rendered and capture.request_id is None:
+                logger.info("Answer rendered but its conversation request was not in the network log")
+                return None
+
+            # Without streaming the body only arrives at the end; until then the page shows progress.
+            streamed = capture.text if capture.streaming else rendered
+            if phase == "first_token" and streamed:
+                observe_phase(phase, time.monotonic() - phase_started)
+                phase = "completion"
+                phase_started = time.monotonic()
+                deadline = phase_started + budget(90, phase)
+                set_phase(phase)
+            if on_progress and streamed and streamed != text:
+                on_progress(streamed)
+                text = streamed
+            log_sampled(logger, logging.DEBUG, "answer_stream", f"Streamed length={len(capture.text)}")
+            if result["stream_ended"] or result["done"]:
+                _wait_for_stream_end(monitor, capture)
+                break
+
+        if not capture.text.strip():
+            # The stream carried nothing we could parse; the rendered page may still have the answer.
+            logger.info("Conversation stream ended without answer text")
+            return None
+        if on_progress and capture.text != text:
+            on_progress(capture.text)
+        observe_phase(phase, time.monotonic() - phase_started)
+        return clean_answer(capture.text)
+    finally:
+        monitor.remove_listener(capture)
+
+def _read_response_from_dom(driver, on_progress=None, monitor=None):
+    """
+    Reads the answer from the last assistant message on the page, waiting on
+    in-page completion signals.
 
-def get_response(driver):
+    Returns:
+        the cleaned answer text, or an error dict if no message appeared
+    """
+    # --- Check for a blocked or failed backend request immediately ---
+    _raise_for_failure(monitor)
+
+    # --- Phase 1: Wait for the assistant message container and its first text ---
+    phase_started = time.monotonic()
+    container_deadline = phase_started + budget(30, "first_token")
+    while True:
+        result = wait_for_answer_event(driver, timeout=container_deadline - time.monotonic(),
+                                       known_text="")
+        _raise_for_failure(monitor, result)
+        if result["present"] or time.monotonic() >= container_deadline:
+            break
+    if not result["present"]:
+        check_deadline("first_token")
+        logger.warning("Timeout while waiting for message container.")
+        return {"status": "error",
+                "message": "Timeout occurred while waiting for message container.",
+                "code": 408}
+
+    logger.debug("Assistant message container found.")
+    observe_phase("first_token", time.monotonic() - phase_started)
+    phase_started = time.monotonic()
+    set_phase("completion")
+
+    # --- Phase 2: Wait for the in-page completion signal ---
+    # Each call is a single WebDriver round-trip that resolves when the page
+    # reports the answer finished (or, when streaming, when the text changed).
+    deadline = time.monotonic() + budget(90, "completion")
+    text = result["text"]
+    if on_progress and text:
+        on_progress(text)
+    while not result["done"]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            check_deadline("completion")
+            raise TimeoutException("Answer did not finish within 90 seconds")
+        result = wait_for_answer_event(driver, timeout=remaining,
+                                       known_text=text if on_progress else None)
+        _raise_for_failure(monitor, result)
+        if on_progress and result["text"] and result["text"] != text:
+            on_progress(result["text"])
+        text = result["text"]
+        log_sampled(logger, logging.DEBUG, "answer_poll", f"Current length={len(text)} | Done={result['done']}")
+
+    observe_phase("completion", time.monotonic() - phase_started)
+    return clean_answer(text)
+
+def get_response(driver, on_progress=None, monitor=None):
     """
-    Waits for the full response to appear and retrieves the text.
-    Uses robust polling to monitor text stability, and checks for Cloudflare 403 blocks.
+    Waits for the full response and retrieves its text.
+    With ANSWER_EXTRACTION=network (the default) the answer is read from the
+    chat backend's response stream, keeping its line breaks; otherwise, or
+    when the stream cannot be followed, from the page. Fails fast on blocked
+    backend requests seen in the CDP network log.
 
     Args:   
         driver (selenium.webdriver): The WebDriver instance.
+        on_progress (callable, optional): Called with the raw text received so far
+            every time it changes while the answer is streaming.
+        monitor (NetworkMonitor, optional): Network event consumer for this page;
+            a fresh one is created if omitted.
 
     Returns:
         str or dict: The complete text of the chatbot's response,
                      or a structured error if blocked or failed.
     """
-    import time
+    monitor = monitor or NetworkMonitor(driver)
+    # Commands below are traced under the phase they are waiting for.
+    phase_token = set_phase("first_token")
     try:
-        print("Waiting for response to start streaming...")
-
-        # --- Check for Cloudflare block or 403 page immediately ---
-        if check_for_block(driver):
-            return {"status": "error", "code": 403}
-
-        # --- Phase 1: Wait for the assistant message container ---
-        try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.markdown.prose"))
-            )
-        except TimeoutException:
-            print("Timeout while waiting for message container.")
-            return {"status": "error",
-                    "message": "Timeout occurred while waiting for message container.",
-                    "code": 408}
-
-        print("Assistant message container found.")
-
-        # --- Phase 2: Poll text for stabilization ---
-        state = {
-            "last_text_length": 0,
-            "stabilization_count": 0
-        }
-
-        def stable_text_poll(d):
-            """Internal polling function for WebDriverWait."""
-            # Optional: early check for block mid-stream
-            if check_for_block(d):
-                raise Exception("Blocked by 403 during streaming")
-
-            last_message_elements = d.find_elements(By.CSS_SELECTOR, "div.markdown.prose")
-            if not last_message_elements:
-                return False
-
-            current_text = last_message_elements[-1].text.strip()
-            print(f"Current length={len(current_text)} | StableCount={state['stabilization_count']}")
-
-            if len(current_text) > 0 and len(current_text) == state['last_text_length']:
-                state['stabilization_count'] += 1
-                if state['stabilization_count'] >= 2:
-                    return True
-            else:
-                state['stabilization_count'] = 0
-
-            state['last_text_length'] = len(current_text)
-            return False
-
-        # Poll until text stabilizes (or max 90 seconds)
-        WebDriverWait(driver, 90, 0.5).until(stable_text_poll)
+        logger.debug("Waiting for response to start streaming...")
+
+        # Events are drained once, so the stream reader checks for blocked
+        # requests itself rather than letting an earlier check consume them.
+        answer = None
+        if ANSWER_EXTRACTION == "network":
+            answer = _read_response_from_network(driver, monitor, on_progress)
+            if answer is None:
+                logger.info("Falling back to reading the answer from the page")
+                set_phase("first_token")
+        if answer is None:
+            answer = _read_response_from_dom(driver, on_progress, monitor)
+        if isinstance(answer, str):
+            logger.info(f"Response completed and retrieved ({len(answer)} chars).")
+        return answer
+
+    except DeadlineExceeded:
+        raise
 
-        # --- Phase 3: Return final stabilized text ---
-        final_message_element = driver.find_elements(By.CSS_SELECTOR, "div.markdown.prose")[-1]
-        raw_text = final_message_element.text.strip()
-        cleaned_text = clean_answer(raw_text)
-        print("Response stabilized and retrieved.")
-        return cleaned_text
+    except BlockedError as e:
+        logger.warning(f"Blocked: {e}")
+        return {"status": "error",
+                "message": str(e),
+                "code": e.status}
 
     except TimeoutException:
-        print("Timeout: The chatbot took too long to respond.")
+        logger.warning("Timeout: The chatbot took too long to respond.")
         return {"status": "error",
                 "message": "Timeout waiting for response.",
                 "code": 504}
     
     except NoSuchElementException:
-        print("Error: Could not find a required element on the page.")
+        logger.error("Could not find a required element on the page.")
         return {"status": "error", 
                 "message": "Element not found.",
                 "code": 404}
     
     except Exception as e:
-        # Check if it was a 403 detected mid-stream
-        if str(e).lower().startswith("blocked by 403"):
-            return {"status": "error", "code": 403}
-        print(f"Error: An unexpected error occurred: {e}")
+        logger.exception(f"An unexpected error occurred: {e}")
         return {"status": "error", 
                 "message": f"Unexpected error: {e}",
                 "code": 500}
 
+    finally:
+        reset_phase(phase_token)
+
 def check_text_stabilization(driver, state):
     """
     Checks if the text of the last assistant message has stabilized.
@@ -216,7 +522,7 @@ def check_text_stabilization(driver, state):
             return False
 
         current_text = last_message_elements[-1].text.strip()
-        print(f"Current length={len(current_text)} | StableCount={state['stabilization_count']}")
+        log_sampled(logger, logging.DEBUG, "stabilization_poll", f"Current length={len(current_text)} | StableCount={state['stabilization_count']}")
         
         # Check if the text is present and its length has stabilized.
         if len(current_text) > 0 and len(current_text) == state['last_text_length']:
@@ -263,49 +569,176 @@ def wait_for_page_load(driver, timeout_sec: int = 60):
         logger.error("Page failed to load within the given timeout.")
         raise
 
-def get_chatgpt_answer(prompt: str) -> str:
+SESSION_REUSE = os.getenv("SESSION_REUSE", "true").lower() != "false"
+NEW_CHAT_SELECTOR = ("a[data-testid='create-new-chat-button'], button[data-testid='create-new-chat-button'], "
+                     "[aria-label='New chat']")
+CHAT_INPUT_SELECTOR = "div.ProseMirror[contenteditable='true']"
+MESSAGE_SELECTOR = "[data-message-author-role]"
+NEW_CHAT_TIMEOUT_SECS = 10
+
+# Clicks the in-app "New chat" control (if `click`) and resolves once the SPA
+# shows an empty editor, no messages and nothing generating (or after maxWaitMs).
+_NEW_CHAT_JS = """
+const [newChatSelector, editorSelector, messageSelector, busySelector, click, maxWaitMs] = arguments;
+const done = arguments[arguments.length - 1];
+if (click) {
+  const controls = Array.from(document.querySelectorAll(newChatSelector));
+  const control = controls.find(el => el.offsetParent !== null) || controls[0];
+  if (!control) {
+    done({clicked: false, ready: false, messages: null});
+    return;
+  }
+  control.click();
+}
+const started = Date.now();
+const check = () => {
+  const editor = document.querySelector(editorSelector);
+  const messages = document.querySelectorAll(messageSelector).length;
+  const ready = !!editor && editor.innerText.trim() === "" && messages === 0 &&
+                !document.querySelector(busySelector);
+  if (ready || Date.now() - started >= maxWaitMs) {
+    done({clicked: true, ready: ready, messages: messages});
+    return;
+  }
+  setTimeout(check, 50);
+};
+setTimeout(check, 0);
+"""
+
+
+def start_new_chat(driver, timeout: float = NEW_CHAT_TIMEOUT_SECS) -> bool:
+    """
+    Resets an already loaded chat page to a fresh conversation through in-app
+    navigation instead of reloading it.
+
+    Args:
+        driver: Selenium WebDriver instance showing the chat page
+        timeout: seconds to wait for the empty conversation
+
+    Returns:
+        bool: True if the editor is ready and the message list is empty;
+              False if the caller should fall back to a full page load
     """
-    High-level function: open browser -> send prompt -> get response -> quit.
+    wait_slice = getattr(driver, "wait_slice_secs", ANSWER_WAIT_SLICE_SECS)
+    deadline = time.monotonic() + timeout
+    click = True
+    while True:
+        remaining = max(0.0, deadline - time.monotonic())
+        try:
+            result = driver.execute_async_script(
+                _NEW_CHAT_JS, NEW_CHAT_SELECTOR, CHAT_INPUT_SELECTOR, MESSAGE_SELECTOR, ANSWER_BUSY_SELECTOR,
+                click, int(min(remaining, wait_slice) * 1000),
+            )
+        except WebDriverException as e:
+            # e.g. the control triggered a real navigation and unloaded the script
+            logger.warning(f"New chat failed: {e.msg}")
+            return False
+        if result and result.get("ready"):
+            return True
+        if not result or not result.get("clicked", True) or time.monotonic() >= deadline:
+            logger.warning(f"New chat not ready: {result}")
+            return False
+        click = False
+
+def get_chatgpt_answer(prompt: str, on_progress=None) -> str:
+    """
+    High-level function: lease browser -> send prompt -> get response -> return browser.
+    Browsers come from the shared DriverPool, so warm instances are reused and
+    broken or worn-out ones are quit by the pool instead of leaking.
     Includes a retry mechanism for robust operation.
+
+    `on_progress` is passed to get_response to observe the answer while it streams.
+
+    Every wait draws from the request deadline (app.deadline) when one is set.
+
+    Raises:
+        DeadlineExceeded: naming the phase in which the deadline ran out
     """
-    # Change 1: Increased max_retries to a sensible value for robustness.
-    max_retries = 1
-    for attempt in range(1, max_retries + 1):
-        driver = None
+    max_attempts = FLOW_MAX_ATTEMPTS
+    pool = get_driver_pool()
+    for attempt in range(1, max_attempts + 1):
+        lease = None
+        phase = "lease"
         try:
-            logger.info(f"Starting ChatGPT automation flow (Attempt {attempt} of {max_retries})")
+            logger.info(f"Starting ChatGPT automation flow (Attempt {attempt} of {max_attempts})")
             
-            # STEP 1: Initialize the undetectable browser
-            driver = get_basic_driver()
-            if driver is None:
-                logger.error(f"Failed to initialize driver on attempt {attempt}.")
-                continue # Skip to the next attempt in the loop
+            # STEP 1: Lease a warm undetectable browser from the pool
+            with phase_timer("lease"):
+                lease = pool.lease(timeout=budget(pool.lease_timeout, "lease"))
+            driver = lease.driver
+            # Only network events from this request count towards block detection.
+            monitor = NetworkMonitor(driver)
+            monitor.reset()
             
-            # STEP 2: Navigate and handle page modals/challenges
-            driver.get(CHATGPT_URL)
-            # Handle the Cloudflare challenge immediately upon navigation.
-            handle_cloudflare_challenge(driver)
+            # STEP 2: Reuse the loaded page for a fresh conversation if possible,
+            # otherwise navigate and handle page modals/challenges.
+            # Every wait is capped by what is left of the request deadline.
+            reused = False
+            if SESSION_REUSE and lease.page_loaded:
+                phase = "new_chat"
+                with phase_timer("new_chat"):
+                    reused = start_new_chat(driver, timeout=budget(NEW_CHAT_TIMEOUT_SECS, phase))
+                if not reused:
+                    logger.info("Falling back to a full page load")
+            if not reused:
+                lease.page_loaded = False
+                phase = "navigate"
+                check_deadline(phase)
+                with phase_timer("navigate"):
+                    driver.get(CHATGPT_URL)
+                # Handle the Cloudflare challenge immediately upon navigation.
+                phase = "cloudflare"
+                with phase_timer("cloudflare"):
+                    handle_cloudflare_challenge(driver, timeout=budget(60, phase))
+                lease.page_loaded = True
             # Then, perform human-like behavior on the main chat page.
             # STEP 3: Submit the prompt and get the answer
-            submit_prompt(driver, prompt)
+            phase = "submit_prompt"
+            with phase_timer("submit_prompt"):
+                submit_prompt(driver, prompt, wait_secs=budget(45, phase))
+            check_deadline(phase)
     
-            # get_response now raises an exception on failure, which is caught below.
-            answer = get_response(driver)
+            phase = "response"
+            answer = get_response(driver, on_progress=on_progress, monitor=monitor)
+            if isinstance(answer, dict):
+                # Blocked or timed out: the page state is unknown, don't reuse the browser.
+                lease.broken = True
+            error = answer_error(answer)
+            record_outcome(error[1] if error else "success")
             # If we reach this point, the response was successful.
             logger.info("Received valid response from ChatGPT")
             return answer
-            
+
         except Exception as e:
-            # The get_response function now raises an exception for failures.
-            # This is a cleaner way to handle retries.
-            logger.error(f"Error in ChatGPT flow on attempt {attempt}: {e}")
-            
+            if lease:
+                lease.broken = not isinstance(e, (PoolExhaustedError, PoolClosedError))
+            # Out of time: the client has given up, so neither retry nor keep waiting.
+            expired = e if isinstance(e, DeadlineExceeded) else expired_error(phase)
+            if expired is not None:
+                logger.warning(f"{expired} (attempt {attempt})")
+                record_outcome(504)
+                if lease:
+                    lease.broken = True
+                raise expired from (None if expired is e else e)
+            if isinstance(e, (PoolExhaustedError, PoolClosedError)):
+                logger.error(f"No browser available on attempt {attempt}: {e}")
+                record_outcome(503)
+            else:
+                logger.error(f"Error in ChatGPT flow on attempt {attempt}: {e}")
+                record_outcome(500)
+
         finally:
-            if driver:
-                #driver.quit()
-                logger.info("Browser closed")
-        
-        time.sleep(2) # Wait 2 seconds before the next retry
+            if lease:
+                pool.release(lease)
+                logger.info("Browser returned to pool")
+
+        if attempt < max_attempts:
+            # Jittered exponential backoff, only if the deadline leaves room for another attempt.
+            delay = backoff_delay(attempt)
+            if not can_retry(delay):
+                logger.warning(f"Not retrying: {remaining_budget():.1f}s left of the request deadline")
+                break
+            time.sleep(delay)
         
-    logger.error(f"Failed to get a response after {max_retries} attempts.")
-    return "Error: Failed to get response after multiple attempts"
\ No newline at end of file
+    logger.error(f"Failed to get a response after {attempt} attempts.")
+    return "Error: Failed to get response after multiple attempts"
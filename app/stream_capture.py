@@ -0,0 +1,213 @@
+# stream_capture.py
+"""
+Reads the answer from the chat backend's streaming response instead of the DOM.
+
+The conversation request is an SSE stream. When the NetworkMonitor sees it
+start, ConversationCapture asks Chrome to stream its body into the
+performance log (CDP `Network.streamResourceContent`), so every
+`Network.dataReceived` event carries the bytes received. The frames are
+parsed as they arrive; the answer is complete at the stream's `[DONE]`
+marker or when the request finishes loading, whose full body
+(`Network.getResponseBody`) is then taken as the final word.
+
+Two payload shapes are understood: whole-message events
+(`{"message": {"content": {"parts": [...]}}}`) and the newer JSON-patch
+deltas (`{"p": "/message/content/parts/0", "o": "append", "v": "..."}`).
+"""
+import base64
+import codecs
+import json
+import os
+import re
+from app.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# "network" reads the stream and falls back to the DOM when it cannot; "dom" only reads the page.
+ANSWER_EXTRACTION = os.getenv("ANSWER_EXTRACTION", "network").lower()
+ANSWER_STREAM_URL_PATTERN = os.getenv(
+    "ANSWER_STREAM_URL_PATTERN", r"/backend-(?:api|anon)/(?:f/)?conversation(?:\?|$)"
+)
+# Once the page or the response says the answer is over, the log is read this
+# often, for up to ANSWER_STREAM_SETTLE_SECS, until the end of the stream turns up.
+ANSWER_STREAM_POLL_SECS = float(os.getenv("ANSWER_STREAM_POLL_SECS", "0.1"))
+ANSWER_STREAM_SETTLE_SECS = float(os.getenv("ANSWER_STREAM_SETTLE_SECS", "2"))
+
+_PARTS_PATH = "/message/content/parts/0"
+_STATUS_PATH = "/message/status"
+
+
+class SSEParser:
+    """Splits text into Server-Sent Events frames, keeping an incomplete trailing frame for the next feed."""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> list:
+        """Returns the (event, data) pairs completed by `text`."""
+        self._buffer += text.replace("\r\n", "\n")
+        frames = []
+        while "\n\n" in self._buffer:
+            frame, self._buffer = self._buffer.split("\n\n", 1)
+            event, data = "message", []
+            for line in frame.split("\n"):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:][1:] if line[5:6] == " " else line[5:])
+            if data:
+                frames.append((event, "\n".join(data)))
+        return frames
+
+
+class ConversationState:
+    """The assistant answer as rebuilt from the stream's events."""
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self.message_done = False
+        self._tracking = False
+        self._path = ""
+        self._op = "add"
+
+    def apply(self, event: str, data: str):
+        if data.strip() == "[DONE]":
+            self.done = True
+            return
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(payload, dict):
+            return
+        if payload.get("type") == "message_stream_complete":
+            self.done = True
+        elif isinstance(payload.get("message"), dict):
+            self._apply_message(payload["message"])
+        elif "v" in payload or "o" in payload:
+            self._apply_delta(payload)
+
+    def _apply_message(self, message: dict):
+        """A whole-message event: the text so far of one message."""
+        content = message.get("content") or {}
+        if (message.get("author") or {}).get("role") != "assistant" or content.get("content_type", "text") != "text":
+            # Tool calls, reasoning and the echoed user message are not the answer.
+            self._tracking = False
+            return
+        self._tracking = True
+        self.text = "".join(part for part in content.get("parts") or [] if isinstance(part, str))
+        self.message_done = message.get("status") == "finished_successfully"
+
+    def _apply_delta(self, op: dict):
+        """One JSON-patch delta; a bare {"v": ...} repeats the previous path and operation."""
+        value = op.get("v")
+        if op.get("o") == "patch" and isinstance(value, list):
+            # A batch of deltas. Bare deltas after it continue its last append
+            # (usually to the answer text), or whatever was current before it.
+            before = (self._path, self._op)
+            last_append = None
+            for sub in value:
+                if isinstance(sub, dict):
+                    self._apply_delta(sub)
+                    if self._op == "append":
+                        last_append = (self._path, self._op)
+            self._path, self._op = last_append or before
+            return
+        if "p" in op:
+            self._path = op["p"]
+        if "o" in op:
+            self._op = op["o"]
+        if self._path == "" and self._op == "add" and isinstance(value, dict):
+            if isinstance(value.get("message"), dict):
+                self._apply_message(value["message"])
+        elif not self._tracking:
+            return
+        elif self._path == _PARTS_PATH and isinstance(value, str):
+            self.text = self.text + value if self._op == "append" else value
+        elif self._path == _STATUS_PATH and value == "finished_successfully":
+            self.message_done = True
+
+
+class ConversationCapture:
+    """
+    NetworkMonitor listener that follows the latest conversation request.
+
+    Attributes:
+        request_id: CDP id of the conversation request, once seen
+        streaming: Chrome agreed to stream the body into the performance log
+        stream_error: why streaming could not be enabled, if it failed
+        finished: the stream ended; `text` is final
+    """
+
+    def __init__(self, driver, url_pattern: str = ANSWER_STREAM_URL_PATTERN):
+        self.driver = driver
+        self.url_pattern = re.compile(url_pattern)
+        self.request_id = None
+        self.streaming = False
+        self.stream_error = None
+        self.finished = False
+        self._start()
+
+    def _start(self):
+        self.state = ConversationState()
+        self._parser = SSEParser()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def text(self) -> str:
+        return self.state.text
+
+    def __call__(self, method: str, params: dict):
+        request_id = params.get("requestId")
+        if method == "Network.requestWillBeSent":
+            request = params.get("request", {})
+            if request.get("method") == "POST" and self.url_pattern.search(request.get("url") or ""):
+                self._follow(request_id)
+        elif request_id is None or request_id != self.request_id or self.finished:
+            return
+        elif method == "Network.dataReceived" and params.get("data"):
+            self._feed(base64.b64decode(params["data"]))
+        elif method == "Network.loadingFinished":
+            self._finish()
+
+    def _follow(self, request_id):
+        # A later conversation request (e.g. a retried send) replaces the earlier one.
+        self.request_id = request_id
+        self.streaming = False
+        self.stream_error = None
+        self.finished = False
+        self._start()
+        try:
+            result = self.driver.execute_cdp_cmd("Network.streamResourceContent", {"requestId": request_id})
+        except Exception as e:
+            # Older Chrome, or the response already finished: the body is read on loadingFinished.
+            self.stream_error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            logger.debug(f"Could not stream the conversation response: {self.stream_error}")
+            return
+        self.streaming = True
+        if result and result.get("bufferedData"):
+            self._feed(base64.b64decode(result["bufferedData"]))
+
+    def _feed(self, data: bytes):
+        for event, payload in self._parser.feed(self._decoder.decode(data)):
+            self.state.apply(event, payload)
+        if self.state.done:
+            self.finished = True
+
+    def _finish(self):
+        """The request finished loading: the full body, when Chrome still has it, is authoritative."""
+        try:
+            body = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": self.request_id})
+        except Exception as e:
+            logger.debug(f"Conversation response body unavailable: {e}")
+            body = None
+        if body and body.get("body") is not None:
+            raw = base64.b64decode(body["body"]) if body.get("base64Encoded") else body["body"].encode("utf-8")
+            state = ConversationState()
+            for event, payload in SSEParser().feed(raw.decode("utf-8", errors="replace") + "\n\n"):
+                state.apply(event, payload)
+            # A body Chrome evicted from its buffers parses to nothing; keep what was streamed then.
+            if state.text:
+                self.state = state
+        self.finished = True
@@ -0,0 +1,83 @@
+# stream_service.py
+import asyncio
+import json
+import time
+from app.logging_utils import get_logger, bind_context
+from app.answer_cache import get_answer_cache, HIT, MISS
+from app.backends import get_admitted_answer, answer_error
+from app.tenants import current_tenant_name
+
+logger = get_logger(__name__)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_answer_events(prompt: str):
+    """
+    Runs the answer backend in a worker thread and yields SSE frames as the
+    answer renders:
+
+        event: delta  {"text": "<new text>"}
+        event: reset  {"text": "<full text>"}   (rendered text was rewritten, not appended)
+        event: done   {"answer": "<cleaned answer>", "cache": "hit|miss", "timing": {...}}
+        event: error  {"message": "...", "code": 403, "timing": {...}}
+
+    Cached answers are sent as a single done event without starting a browser.
+    """
+    started = time.monotonic()
+    cache = get_answer_cache()
+    tenant = current_tenant_name()
+    cached = cache.get(prompt, tenant)
+    if cached is not None:
+        yield sse_event("done", {"answer": cached, "cache": HIT,
+                                 "timing": {"total_secs": round(time.monotonic() - started, 3),
+                                            "first_token_secs": None}})
+        return
+
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+
+    def on_progress(text: str):
+        loop.call_soon_threadsafe(updates.put_nowait, text)
+
+    # Admission was checked before the response started, so wait for a slot here.
+    flow = loop.run_in_executor(
+        None, bind_context(lambda: get_admitted_answer(prompt, on_progress, shed=False)))
+    flow.add_done_callback(lambda _: loop.call_soon_threadsafe(updates.put_nowait, None))
+
+    sent = ""
+    first_token_at = None
+    while True:
+        text = await updates.get()
+        if text is None:
+            break
+        if first_token_at is None:
+            first_token_at = time.monotonic()
+        if text.startswith(sent):
+            delta = text[len(sent):]
+            if delta:
+                yield sse_event("delta", {"text": delta})
+        else:
+            yield sse_event("reset", {"text": text})
+        sent = text
+
+    timing = {
+        "total_secs": round(time.monotonic() - started, 3),
+        "first_token_secs": round(first_token_at - started, 3) if first_token_at else None,
+    }
+    try:
+        answer = flow.result()
+    except Exception as e:
+        logger.exception("Error streaming response")
+        yield sse_event("error", {"message": str(e), "code": getattr(e, "status", 500), "timing": timing})
+        return
+
+    error = answer_error(answer)
+    if error:
+        yield sse_event("error", {"message": error[0], "code": error[1], "timing": timing})
+    else:
+        cache.set(prompt, answer, tenant)
+        yield sse_event("done", {"answer": answer, "cache": MISS, "timing": timing})
@@ -0,0 +1,226 @@
+# tab_driver.py
+"""
+Several chat tabs inside one Chrome process.
+
+ChromeDriver has one "current window" per session and runs one command at a
+time, so a SharedBrowser wraps the real driver's `execute`: every command is
+serialized under a lock and preceded by a switch to the calling tab's window
+handle. A TabDriver is a proxy that binds its handle (per thread) whenever it
+is used, so WebElements it returns keep talking to the right tab.
+
+Because commands are serialized, long in-page waits would starve the other
+tabs; TabDriver advertises a short `wait_slice_secs` that the answer waits use
+instead of their usual slice.
+"""
+import json
+import os
+import threading
+from selenium.webdriver.remote.command import Command
+from app.logging_utils import get_logger
+from app.driver_utils import TABS_PER_BROWSER, get_basic_driver, configure_tab
+
+logger = get_logger(__name__)
+
+# Longest single in-page wait while other tabs share the browser. Must stay
+# above the answer "quiet" window (750 ms).
+TAB_WAIT_SLICE_SECS = float(os.getenv("TAB_WAIT_SLICE_SECS", "1.5"))
+
+
+class SharedBrowser:
+    """
+    One real driver serving up to `capacity` tabs.
+
+    Args:
+        driver: a started WebDriver; its initial window becomes the first tab
+        capacity: maximum number of tabs
+    """
+
+    def __init__(self, driver, capacity: int = TABS_PER_BROWSER):
+        self.driver = driver
+        self.capacity = capacity
+        self.closed = False
+        self.tabs = set()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._raw_execute = driver.execute
+        self._initial_handle = driver.current_window_handle
+        self._current = self._initial_handle
+        self._perf = {}
+        driver.execute = self._execute
+
+    # ------------------------------------------------------------------ routing
+
+    def bind(self, handle):
+        """Routes this thread's commands to `handle` (None: no switching)."""
+        self._local.handle = handle
+
+    def _execute(self, driver_command, params=None):
+        handle = getattr(self._local, "handle", None)
+        with self._lock:
+            if handle is not None and handle != self._current:
+                self._raw_execute(Command.SWITCH_TO_WINDOW, {"handle": handle})
+                self._current = handle
+            try:
+                return self._raw_execute(driver_command, params)
+            finally:
+                if handle is None:
+                    # Unbound commands may switch windows themselves.
+                    self._current = None
+
+    def _switch(self, handle):
+        self._raw_execute(Command.SWITCH_TO_WINDOW, {"handle": handle})
+        self._current = handle
+
+    # ------------------------------------------------------------------ tabs
+
+    def open_tab(self):
+        """Adds a tab (the initial window first) and returns its TabDriver."""
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("Browser is closed")
+            if self._initial_handle is not None:
+                handle, self._initial_handle = self._initial_handle, None
+            else:
+                handle = self._raw_execute(Command.NEW_WINDOW, {"type": "tab"})["value"]["handle"]
+                self._switch(handle)
+                self.bind(None)
+                configure_tab(self.driver)
+            self.tabs.add(handle)
+        logger.info(f"Opened tab {handle[-8:]} ({len(self.tabs)}/{self.capacity} in browser)")
+        return TabDriver(self, handle)
+
+    def navigate(self, tab, url: str):
+        """
+        driver.get for one tab, holding the browser for the whole navigation:
+        in UC mode it may reconnect chromedriver or replace the tab with a new
+        window, so the tab's handle is re-read afterwards.
+        """
+        with self._lock:
+            self._switch(tab.handle)
+            self.bind(None)
+            try:
+                self.driver.get(url)
+            finally:
+                try:
+                    handle = self._raw_execute(Command.W3C_GET_CURRENT_WINDOW_HANDLE)["value"]
+                except Exception:
+                    handle = tab.handle
+                self._current = handle
+                if handle != tab.handle:
+                    self.tabs.discard(tab.handle)
+                    self._perf.pop(tab.handle, None)
+                    self.tabs.add(handle)
+                    tab.handle = handle
+
+    def performance_log(self, handle) -> list:
+        """
+        Performance-log entries of one tab. The log is shared by all tabs, so
+        it is drained once and entries are kept per tab ("webview" id, which is
+        the window handle) until that tab asks for them.
+        """
+        with self._lock:
+            self.bind(None)
+            entries = self._raw_execute(Command.GET_LOG, {"type": "performance"})["value"]
+            for entry in entries:
+                try:
+                    webview = json.loads(entry["message"]).get("webview")
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if webview in self.tabs:
+                    self._perf.setdefault(webview, []).append(entry)
+            return self._perf.pop(handle, [])
+
+    def close_tab(self, tab):
+        """Closes one tab; a crashed tab only loses itself. The last tab quits the browser."""
+        with self._lock:
+            self.tabs.discard(tab.handle)
+            self._perf.pop(tab.handle, None)
+            if not self.tabs:
+                self.closed = True
+                self.bind(None)
+                try:
+                    self.driver.quit()
+                except Exception as e:
+                    logger.warning(f"Error quitting shared browser: {e}")
+                return
+            try:
+                self._switch(tab.handle)
+                self._raw_execute(Command.CLOSE)
+            except Exception as e:
+                logger.warning(f"Could not close tab {tab.handle[-8:]}: {e}")
+            self._current = None
+        logger.info(f"Closed tab {tab.handle[-8:]} ({len(self.tabs)} left in browser)")
+
+
+class TabDriver:
+    """
+    WebDriver proxy for one tab of a SharedBrowser. Anything not overridden is
+    delegated to the real driver with this tab bound to the calling thread.
+    """
+
+    wait_slice_secs = TAB_WAIT_SLICE_SECS
+
+    def __init__(self, browser: SharedBrowser, handle: str):
+        self._browser = browser
+        self.handle = handle
+
+    def __getattr__(self, name):
+        self._browser.bind(self.handle)
+        return getattr(self._browser.driver, name)
+
+    @property
+    def root_driver(self):
+        """The real driver, shared with the other tabs of this browser."""
+        return self._browser.driver
+
+    def get(self, url: str):
+        self._browser.navigate(self, url)
+        self._browser.bind(self.handle)
+
+    def get_log(self, log_type: str):
+        if log_type == "performance":
+            return self._browser.performance_log(self.handle)
+        self._browser.bind(self.handle)
+        return self._browser.driver.get_log(log_type)
+
+    def quit(self):
+        self._browser.close_tab(self)
+
+
+class TabFactory:
+    """
+    DriverPool factory handing out tabs: a new tab goes into a running browser
+    with free capacity, and a new browser is started only when all are full.
+    """
+
+    def __init__(self, capacity: int = TABS_PER_BROWSER, browser_factory=get_basic_driver):
+        self.capacity = capacity
+        self.browser_factory = browser_factory
+        self._browsers = []
+        # Held while a browser starts, so concurrent creations fill it instead of starting more.
+        self._lock = threading.Lock()
+
+    def __call__(self) -> TabDriver:
+        with self._lock:
+            self._browsers = [b for b in self._browsers if not b.closed]
+            browser = next((b for b in self._browsers if len(b.tabs) < b.capacity), None)
+            if browser is None:
+                browser = SharedBrowser(self.browser_factory(), self.capacity)
+                self._browsers.append(browser)
+            return browser.open_tab()
+
+    def browsers(self) -> int:
+        with self._lock:
+            return sum(1 for b in self._browsers if not b.closed)
+
+
+_tab_factory = None
+_tab_factory_lock = threading.Lock()
+
+
+def get_tab_factory() -> TabFactory:
+    global _tab_factory
+    with _tab_factory_lock:
+        if _tab_factory is None:
+            _tab_factory = TabFactory()
+        return _tab_factory
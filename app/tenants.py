@@ -0,0 +1,152 @@
+# tenants.py
+"""
+API keys and their quotas.
+
+Keys come from API_KEYS (JSON) or API_KEYS_FILE (path to the same JSON), a
+mapping of key to settings:
+
+    {"k-acme": {"name": "acme", "max_concurrency": 2, "rate_per_min": 30,
+                "burst": 10, "weight": 2, "priority": "high"}}
+
+Every setting is optional. Without either variable the single API_KEY is
+accepted as tenant "default" with no limits of its own.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from app.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+API_KEY = os.getenv("API_KEY")
+API_KEYS = os.getenv("API_KEYS")
+API_KEYS_FILE = os.getenv("API_KEYS_FILE")
+
+# Served strictly in this order; keys within a class share capacity by weight.
+PRIORITY_CLASSES = ("high", "normal", "low")
+DEFAULT_TENANT = "default"
+
+
+class QuotaExceededError(Exception):
+    """A key is over its rate limit; `quota` describes the limit for the 429 body."""
+
+    def __init__(self, retry_after: int, quota: dict, message: str = "Rate limit exceeded"):
+        self.retry_after = retry_after
+        self.quota = quota
+        super().__init__(message)
+
+
+class Tenant:
+    """
+    One API key's identity and limits.
+
+    Args:
+        name: label used in logs, metrics and 429 bodies (never the key itself)
+        max_concurrency: browser runs this key may hold at once; None for no own limit
+        rate_per_min: requests admitted per minute (token bucket); None for no limit
+        burst: bucket size, defaults to rate_per_min
+        weight: share of contended capacity relative to other keys of its class
+        priority: one of PRIORITY_CLASSES
+        max_queue: requests this key may have waiting; None uses the global queue limit
+    """
+
+    def __init__(self, name: str, max_concurrency: int = None, rate_per_min: float = None, burst: float = None,
+                 weight: float = 1.0, priority: str = "normal", max_queue: int = None):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority {priority!r} for {name}; expected one of {PRIORITY_CLASSES}")
+        if weight <= 0:
+            raise ValueError(f"Weight for {name} must be positive")
+        if ":" in name:
+            # Names scope job idempotency keys as "<tenant>:<key>".
+            raise ValueError(f"Tenant name {name!r} must not contain ':'")
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_per_min = rate_per_min
+        self.burst = burst if burst is not None else rate_per_min
+        self.weight = float(weight)
+        self.priority = priority
+        self.max_queue = max_queue
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rank(self) -> int:
+        return PRIORITY_CLASSES.index(self.priority)
+
+    def take(self, cost: float = 1):
+        """
+        Spends `cost` tokens from the rate bucket.
+
+        Raises:
+            QuotaExceededError: if the bucket does not hold enough tokens
+        """
+        if not self.rate_per_min or cost <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_min / 60)
+            self._refilled_at = now
+            if cost <= self._tokens:
+                self._tokens -= cost
+                return
+            missing = min(cost, self.burst) - self._tokens
+            retry_after = max(1, math.ceil(missing * 60 / self.rate_per_min))
+            quota = {"tenant": self.name, "limit": "rate", "rate_per_min": self.rate_per_min,
+                     "burst": self.burst, "remaining": int(self._tokens), "cost": cost}
+        if cost > self.burst:
+            raise QuotaExceededError(retry_after, quota, "Request is larger than this key's burst allowance")
+        raise QuotaExceededError(retry_after, quota)
+
+
+def load_tenants() -> dict:
+    """Tenants by API key, from API_KEYS / API_KEYS_FILE, else the single API_KEY."""
+    raw = API_KEYS
+    if not raw and API_KEYS_FILE:
+        with open(API_KEYS_FILE) as f:
+            raw = f.read()
+    if not raw:
+        return {API_KEY: Tenant(DEFAULT_TENANT)} if API_KEY else {}
+    tenants = {}
+    for i, (key, settings) in enumerate(json.loads(raw).items()):
+        settings = dict(settings or {})
+        tenants[key] = Tenant(settings.pop("name", f"key-{i + 1}"), **settings)
+    names = [t.name for t in tenants.values()]
+    if len(set(names)) != len(names):
+        raise ValueError("Tenant names in API_KEYS must be unique")
+    logger.info(f"Loaded {len(tenants)} API keys: {', '.join(names)}")
+    return tenants
+
+
+_tenants = None
+_tenants_lock = threading.Lock()
+# Set by the request middleware so admission control can see who is asking.
+current_tenant_var = contextvars.ContextVar("tenant", default=None)
+
+
+def get_tenants() -> dict:
+    global _tenants
+    with _tenants_lock:
+        if _tenants is None:
+            _tenants = load_tenants()
+        return _tenants
+
+
+def resolve_tenant(api_key):
+    """The Tenant for `api_key`, or None if the key is unknown."""
+    if not api_key:
+        return None
+    return get_tenants().get(api_key)
+
+
+def current_tenant():
+    return current_tenant_var.get()
+
+
+def current_tenant_name() -> str:
+    """Name of the calling request's tenant, DEFAULT_TENANT outside a request."""
+    tenant = current_tenant_var.get()
+    return tenant.name if tenant else DEFAULT_TENANT
@@ -0,0 +1,212 @@
+# tracing.py
+"""
+Opt-in tracing of WebDriver commands.
+
+Every driver's command executor is wrapped once (`instrument_driver`). While
+a trace is active in the current context, each WebDriver HTTP round-trip is
+recorded with its duration and the phase it ran in (set by
+app.metrics.phase_timer). Finished traces are kept in memory for the debug
+endpoints, optionally written to TRACE_DIR, and export as Chrome trace-event
+JSON (open in https://ui.perfetto.dev or chrome://tracing).
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from app.logging_utils import get_logger, request_id_var
+
+logger = get_logger(__name__)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "50"))
+
+# Set per request (X-Trace header) to trace it even when TRACE_ENABLED is off.
+trace_requested_var = contextvars.ContextVar("trace_requested", default=False)
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_phase = contextvars.ContextVar("phase", default=None)
+_sequence = itertools.count(1)
+
+
+class Trace:
+    """WebDriver commands and phase spans of one browser run."""
+
+    def __init__(self, trace_id: str, name: str):
+        self.id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.duration = None
+        self.commands = []  # (command, phase, start, duration, thread id, error)
+        self.phases = []    # (phase, start, duration, thread id)
+        self._lock = threading.Lock()
+
+    def add_command(self, command: str, phase, started: float, duration: float, error=None):
+        with self._lock:
+            self.commands.append((command, phase, started - self._origin, duration,
+                                  threading.get_ident(), error))
+
+    def add_phase(self, phase: str, ended: float, duration: float):
+        with self._lock:
+            self.phases.append((phase, ended - duration - self._origin, duration, threading.get_ident()))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._origin
+
+    def summary(self) -> dict:
+        """Round-trips and time spent in them per phase, plus the most expensive commands."""
+        with self._lock:
+            commands, phases = list(self.commands), list(self.phases)
+        by_phase, by_command = {}, {}
+        for command, phase, _, duration, _, _ in commands:
+            entry = by_phase.setdefault(phase or "other", {"commands": 0, "command_secs": 0.0})
+            entry["commands"] += 1
+            entry["command_secs"] += duration
+            entry = by_command.setdefault(command, {"count": 0, "secs": 0.0})
+            entry["count"] += 1
+            entry["secs"] += duration
+        for phase, _, duration, _ in phases:
+            entry = by_phase.setdefault(phase, {"commands": 0, "command_secs": 0.0})
+            entry["wall_secs"] = round(entry.get("wall_secs", 0.0) + duration, 4)
+        for entry in list(by_phase.values()) + list(by_command.values()):
+            for key in ("command_secs", "secs"):
+                if key in entry:
+                    entry[key] = round(entry[key], 4)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_secs": round(self.duration, 4) if self.duration is not None else None,
+            "commands": len(commands),
+            "command_secs": round(sum(c[3] for c in commands), 4),
+            "phases": by_phase,
+            "top_commands": dict(sorted(by_command.items(), key=lambda kv: -kv[1]["secs"])[:10]),
+        }
+
+    def to_chrome(self) -> dict:
+        """Chrome trace-event format: one complete ("X") event per command and per phase."""
+        with self._lock:
+            commands, phases = list(self.commands), list(self.phases)
+        events = []
+        threads = set()
+        for phase, start, duration, tid in phases:
+            threads.add(tid)
+            events.append({"name": phase, "cat": "phase", "ph": "X", "pid": 1, "tid": tid,
+                           "ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1)})
+        for command, phase, start, duration, tid, error in commands:
+            threads.add(tid)
+            args = {"phase": phase}
+            if error:
+                args["error"] = error
+            events.append({"name": command, "cat": "webdriver", "ph": "X", "pid": 1, "tid": tid,
+                           "ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1), "args": args})
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}})
+        for tid in threads:
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                           "args": {"name": f"request thread {tid}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "metadata": {"trace_id": self.id, "started_at": self.started_at}}
+
+
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def _store(trace: Trace):
+    with _traces_lock:
+        _traces[trace.id] = trace
+        while len(_traces) > TRACE_BUFFER_SIZE:
+            _traces.popitem(last=False)
+    if TRACE_DIR:
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(os.path.join(TRACE_DIR, f"{trace.id}.json"), "w") as f:
+                json.dump(trace.to_chrome(), f)
+        except OSError as e:
+            logger.warning(f"Could not write trace {trace.id}: {e}")
+
+
+def tracing_active() -> bool:
+    return TRACE_ENABLED or trace_requested_var.get()
+
+
+@contextmanager
+def start_trace(name: str):
+    """
+    Records WebDriver commands made in this context until the block exits.
+    Does nothing unless tracing is enabled or was requested for this request.
+    """
+    if not tracing_active() or _current_trace.get() is not None:
+        yield _current_trace.get()
+        return
+    trace = Trace(f"{request_id_var.get() or 'trace'}-{next(_sequence)}", name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        _store(trace)
+        summary = trace.summary()
+        logger.info(f"Trace {trace.id}: {summary['commands']} WebDriver commands, "
+                    f"{summary['command_secs']:.2f}s of {summary['duration_secs']:.2f}s in round-trips")
+
+
+def set_phase(phase: str):
+    """Sets the phase recorded with following commands; returns a token for reset_phase."""
+    return _current_phase.set(phase)
+
+
+def reset_phase(token):
+    _current_phase.reset(token)
+
+
+def record_phase(phase: str, seconds: float):
+    """Adds a phase span that ended now to the active trace (called by app.metrics)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_phase(phase, time.perf_counter(), seconds)
+
+
+def instrument_driver(driver):
+    """Wraps the driver's command executor so commands are recorded while a trace is active."""
+    executor = getattr(driver, "command_executor", None)
+    if executor is None or getattr(executor, "_lumen_traced", False):
+        return driver
+    raw_execute = executor.execute
+
+    def execute(command, params):
+        trace = _current_trace.get()
+        if trace is None:
+            return raw_execute(command, params)
+        started = time.perf_counter()
+        error = None
+        try:
+            return raw_execute(command, params)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            trace.add_command(command, _current_phase.get(), started, time.perf_counter() - started, error)
+
+    executor.execute = execute
+    executor._lumen_traced = True
+    return driver
+
+
+def get_trace(trace_id: str):
+    with _traces_lock:
+        return _traces.get(trace_id)
+
+
+def list_traces(request_id: str = None) -> list:
+    """Summaries of the buffered traces, newest first."""
+    with _traces_lock:
+        traces = list(_traces.values())
+    if request_id:
+        traces = [t for t in traces if t.id.startswith(f"{request_id}-")]
+    return [t.summary() for t in reversed(traces)]
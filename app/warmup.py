@@ -0,0 +1,127 @@
+# warmup.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.logging_utils import get_logger
+from app.metrics import observe_phase, phase_timer
+from app.driver_pool import DRIVER_PREWARM
+
+logger = get_logger(__name__)
+
+PREWARM_LOAD_PAGE = os.getenv("PREWARM_LOAD_PAGE", "true").lower() != "false"
+
+DISABLED = "disabled"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class Warmup:
+    """
+    Background startup work: imports the browser stack, starts `count` pooled
+    browsers and loads the chat page in each, then hands them back to the pool
+    idle. The state is reported by /ready.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = DISABLED
+        self.requested = 0
+        self.browsers = 0
+        self.pages_loaded = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self, count: int = DRIVER_PREWARM, load_page: bool = PREWARM_LOAD_PAGE):
+        with self._lock:
+            if self._thread is not None or count <= 0:
+                return
+            self.state = WARMING
+            self.requested = count
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, args=(count, load_page),
+                                            name="warmup", daemon=True)
+        self._thread.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.finished_at or time.monotonic()
+            return {
+                "state": self.state,
+                "requested": self.requested,
+                "browsers": self.browsers,
+                "pages_loaded": self.pages_loaded,
+                "secs": round(finished - self.started_at, 3) if self.started_at else None,
+                "error": self.error,
+            }
+
+    def _run(self, count: int, load_page: bool):
+        try:
+            started = time.monotonic()
+            # The first import of seleniumbase/selenium costs about half a second;
+            # pay it here instead of on the first request.
+            from app.selenium_service import CHATGPT_URL, handle_cloudflare_challenge
+            from app.driver_pool import get_driver_pool
+            observe_phase("import", time.monotonic() - started)
+
+            pool = get_driver_pool()
+            count = min(count, pool.max_size)
+            # Leases are held while the pages load, so each worker gets its own browser.
+            with ThreadPoolExecutor(max_workers=count, thread_name_prefix="warmup") as executor:
+                results = list(executor.map(
+                    lambda _: self._warm_one(pool, CHATGPT_URL if load_page else None, handle_cloudflare_challenge),
+                    range(count)))
+            with self._lock:
+                self.state = READY if any(results) else FAILED
+        except Exception as e:
+            logger.exception("Warm-up failed")
+            with self._lock:
+                self.state = FAILED
+                self.error = str(e)
+        finally:
+            with self._lock:
+                self.finished_at = time.monotonic()
+            logger.info(f"Warm-up {self.state}: {self.browsers} browsers, {self.pages_loaded} pages loaded "
+                        f"in {self.finished_at - self.started_at:.1f}s")
+
+    def _warm_one(self, pool, url, wait_until_ready) -> bool:
+        try:
+            lease = pool.lease()
+        except Exception as e:
+            logger.warning(f"Warm-up could not start a browser: {e}")
+            with self._lock:
+                self.error = str(e)
+            return False
+        with self._lock:
+            self.browsers += 1
+        try:
+            if url:
+                with phase_timer("navigate"):
+                    lease.driver.get(url)
+                with phase_timer("cloudflare"):
+                    wait_until_ready(lease.driver)  # raises if the editor never appears
+                lease.page_loaded = True
+                with self._lock:
+                    self.pages_loaded += 1
+            return True
+        except Exception as e:
+            # The browser itself started; a later request navigates again anyway.
+            logger.warning(f"Warm-up page load failed: {e}")
+            return True
+        finally:
+            pool.release(lease)
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup()
+        return _warmup
@@ -0,0 +1,167 @@
+# worker.py
+"""
+Browser worker process for the shared work queue.
+
+With WORK_QUEUE_URL set, the API only enqueues prompts; one or more of these
+processes (on any host that reaches the queue) claim jobs, run them through
+WORKER_BACKEND (the Selenium flow by default) and write the results back.
+
+Each claim is a lease: a heartbeat extends it every third of
+JOB_VISIBILITY_TIMEOUT_SECS while the job runs, and completing or failing
+the job with the lease owner is the acknowledgement. If a worker dies, its
+leases run out and the jobs are delivered to another worker, up to
+JOB_MAX_DELIVERIES times.
+
+Usage:
+    WORK_QUEUE_URL=redis://queue:6379/0 python -m app.worker --concurrency 4
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from app.logging_utils import get_logger, request_id_var
+from app.driver_pool import DRIVER_POOL_MAX, shutdown_driver_pool
+from app.job_store import WORK_QUEUE_URL, JOB_VISIBILITY_TIMEOUT_SECS, JOB_MAX_DELIVERIES, open_job_store
+from app.backends import BACKENDS, answer_error
+from app.deadline import deadline_scope, REQUEST_DEADLINE_SECS
+
+logger = get_logger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(DRIVER_POOL_MAX)))
+WORKER_BACKEND = os.getenv("WORKER_BACKEND", "selenium").lower()
+WORKER_POLL_SECS = float(os.getenv("WORKER_POLL_SECS", "0.5"))
+# On SIGTERM running jobs get this long to finish; unfinished ones are redelivered elsewhere.
+WORKER_SHUTDOWN_GRACE_SECS = float(os.getenv("WORKER_SHUTDOWN_GRACE_SECS", "60"))
+
+
+class Worker:
+    """
+    Args:
+        store: JobStore or RedisJobStore shared with the API
+        backend: AnswerBackend that runs the prompts
+        concurrency: jobs run at once (one consumer thread each)
+        visibility_timeout: lease length; extended while a job runs
+    """
+
+    def __init__(self, store, backend, concurrency: int = WORKER_CONCURRENCY,
+                 visibility_timeout: float = JOB_VISIBILITY_TIMEOUT_SECS, max_deliveries: int = JOB_MAX_DELIVERIES):
+        self.store = store
+        self.backend = backend
+        self.concurrency = max(1, concurrency)
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = {}  # job id -> lease owner
+        self._counters = {"completed": 0, "failed": 0, "lease_lost": 0}
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, grace: float = WORKER_SHUTDOWN_GRACE_SECS):
+        """Consumes jobs until stop() is called, then waits up to `grace` seconds for running ones."""
+        logger.info(f"Worker {self.id} consuming with {self.concurrency} slots ({self.backend.name} backend)")
+        threads = [threading.Thread(target=self._consume, args=(f"{self.id}/{n}",), name=f"worker-{n}", daemon=True)
+                   for n in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        while not self._stop.wait(self.visibility_timeout / 3):
+            self._heartbeat()
+
+        logger.info(f"Worker {self.id} stopping; waiting up to {grace:.0f}s for {len(self._running)} running jobs")
+        finish_by = time.monotonic() + grace
+        while any(thread.is_alive() for thread in threads) and time.monotonic() < finish_by:
+            self._heartbeat()
+            for thread in threads:
+                thread.join(timeout=min(self.visibility_timeout / 3, max(0.0, finish_by - time.monotonic())))
+        logger.info(f"Worker {self.id} stopped: {self._counters}")
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, owner in running:
+            try:
+                if not self.store.extend(job_id, owner, self.visibility_timeout):
+                    logger.warning(f"Lease on job {job_id} was lost; it may run elsewhere")
+            except Exception as e:
+                logger.error(f"Could not extend lease on job {job_id}: {e}")
+
+    def _consume(self, owner: str):
+        while not self._stop.is_set():
+            try:
+                claim = self.store.claim(owner, self.visibility_timeout, self.max_deliveries)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {e}")
+                claim = None
+            if claim is None:
+                self._stop.wait(WORKER_POLL_SECS)
+                continue
+            try:
+                self._process(claim, owner)
+            except Exception as e:
+                # Could not record the result; the lease runs out and the job is redelivered.
+                logger.error(f"Acknowledging job {claim.job_id} failed: {e}")
+
+    def _process(self, claim, owner: str):
+        token = request_id_var.set(claim.job_id)
+        with self._lock:
+            self._running[claim.job_id] = owner
+        logger.info(f"Job {claim.job_id} claimed (delivery {claim.attempts})")
+        # The API is waiting only until the request's deadline; plain jobs get the default budget.
+        seconds = claim.deadline_at - time.time() if claim.deadline_at else REQUEST_DEADLINE_SECS
+        try:
+            with deadline_scope(seconds):
+                answer = self.backend.answer(claim.prompt)
+            error = answer_error(answer)
+            if error:
+                acked = self.store.fail(claim.job_id, *error, owner=owner)
+            else:
+                acked = self.store.complete(claim.job_id, answer, owner=owner)
+        except Exception as e:
+            logger.exception(f"Job {claim.job_id} crashed")
+            error = (str(e), getattr(e, "status", 500))
+            acked = self.store.fail(claim.job_id, *error, owner=owner)
+        finally:
+            with self._lock:
+                self._running.pop(claim.job_id, None)
+            request_id_var.reset(token)
+        with self._lock:
+            self._counters["lease_lost" if not acked else "failed" if error else "completed"] += 1
+        if not acked:
+            logger.warning(f"Result of job {claim.job_id} discarded: the lease had been handed to another worker")
+        else:
+            logger.info(f"Job {claim.job_id} {'failed: ' + error[0] if error else 'finished'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run browser jobs from the shared work queue.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--backend", default=WORKER_BACKEND, choices=sorted(set(BACKENDS) - {"queue"}))
+    args = parser.parse_args()
+    if not WORK_QUEUE_URL:
+        parser.error("WORK_QUEUE_URL must point at the queue the API uses (sqlite:///path or redis://...)")
+
+    backend = BACKENDS[args.backend]()
+    worker = Worker(open_job_store(), backend, args.concurrency)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+
+    if backend.uses_browsers:
+        from app.browser_governor import get_browser_governor, shutdown_browser_governor
+        from app.warmup import get_warmup
+        get_browser_governor().start()
+        get_warmup().start()
+    try:
+        worker.run()
+    finally:
+        if backend.uses_browsers:
+            shutdown_browser_governor()
+            shutdown_driver_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# conftest.py
+import os
+import tempfile
+
+# Settings are read at import time, so they are fixed before any app module loads.
+os.environ.setdefault("API_KEY", "test-key")
+os.environ.setdefault("DRIVER_PREWARM", "0")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="lumen-tests-"), "jobs.sqlite3"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
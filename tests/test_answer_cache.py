@@ -0,0 +1,83 @@
+# test_answer_cache.py
+import threading
+
+import pytest
+
+from app.admission import QueueFullError
+from app.answer_cache import AnswerCache, MISS, SHARED
+
+
+def _call_in_thread(cache, prompt, compute, results):
+    def follow():
+        try:
+            results.append(cache.get_or_compute(prompt, compute))
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=follow)
+    thread.start()
+    return thread
+
+
+def _lead_until_follower_waits(cache, prompt, error):
+    started, release = threading.Event(), threading.Event()
+
+    def leader_compute(p):
+        started.set()
+        release.wait(5)
+        raise error
+
+    results = []
+    leader = _call_in_thread(cache, prompt, leader_compute, results)
+    started.wait(5)
+    return leader, release, results
+
+
+def test_follower_retries_when_leader_is_shed():
+    cache = AnswerCache(db_path=None)
+    leader, release, leader_results = _lead_until_follower_waits(cache, "hello", QueueFullError(1))
+    follower_results = []
+    follower = _call_in_thread(cache, "hello", lambda p: "answer", follower_results)
+    while cache.stats().get(SHARED, 0) == 0:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(leader_results[0], QueueFullError)
+    assert follower_results == [("answer", MISS)]
+
+
+def test_follower_shares_upstream_errors():
+    cache = AnswerCache(db_path=None)
+    leader, release, _ = _lead_until_follower_waits(cache, "hello", RuntimeError("upstream"))
+    follower_results = []
+    follower = _call_in_thread(cache, "hello", lambda p: pytest.fail("follower should not compute"), follower_results)
+    while cache.stats().get(SHARED, 0) == 0:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(follower_results[0], RuntimeError)
+
+
+def test_answers_are_kept_per_tenant(tmp_path):
+    cache = AnswerCache(db_path=str(tmp_path / "answers.sqlite3"))
+    cache.set("hello", "acme's answer", tenant="acme")
+
+    assert cache.get("hello", tenant="acme") == "acme's answer"
+    assert cache.get("hello", tenant="globex") is None
+    answer, status = cache.get_or_compute("hello", lambda p: "globex's answer", tenant="globex")
+    assert (answer, status) == ("globex's answer", MISS)
+
+
+def test_invalidate_drops_a_prompt_for_every_tenant(tmp_path):
+    cache = AnswerCache(db_path=str(tmp_path / "answers.sqlite3"))
+    cache.set("hello", "a", tenant="acme")
+    cache.set("hello", "b", tenant="globex")
+    cache.set("other", "c", tenant="acme")
+
+    assert cache.invalidate("hello") == 2
+    assert cache.get("hello", tenant="acme") is None
+    assert cache.get("other", tenant="acme") == "c"
@@ -0,0 +1,167 @@
+# test_job_store.py
+import threading
+
+import pytest
+
+from app.job_store import JobStore, DONE, FAILED, QUEUED, RUNNING
+
+
+def test_idempotency_key_returns_the_first_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first, created = store.create("hello", "key-1", tenant="acme")
+    again, created_again = store.create("hello", "key-1", tenant="acme")
+
+    assert created and not created_again
+    assert again["id"] == first["id"]
+
+
+def test_idempotency_keys_are_per_tenant(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    acme, _ = store.create("hello", "key-1", tenant="acme")
+    globex, created = store.create("hello", "key-1", tenant="globex")
+
+    assert created and globex["id"] != acme["id"]
+    assert store.get(acme["id"], tenant="globex") is None
+    assert store.get(acme["id"], tenant="acme")["id"] == acme["id"]
+
+
+def test_concurrent_creates_with_one_key_make_one_job(tmp_path):
+    # Separate connections, as separate API processes sharing the file would have.
+    path = str(tmp_path / "jobs.sqlite3")
+    stores = [JobStore(path) for _ in range(8)]
+    for attempt in range(20):
+        start = threading.Barrier(len(stores))
+        results, errors = [], []
+
+        def create(store):
+            start.wait()
+            try:
+                results.append(store.create("hello", f"key-{attempt}", tenant="acme"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=create, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        assert errors == []
+        assert len({job["id"] for job, _ in results}) == 1
+        assert sum(created for _, created in results) == 1
+
+
+def test_claim_and_acknowledge(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job, _ = store.create("hello")
+    claim = store.claim("worker-1")
+
+    assert claim.job_id == job["id"] and claim.attempts == 1
+    assert store.get(job["id"])["status"] == RUNNING
+    assert store.claim("worker-2") is None
+    assert not store.complete(job["id"], "answer", owner="worker-2")
+    assert store.complete(job["id"], "answer", owner="worker-1")
+    assert store.get(job["id"])["status"] == DONE
+
+
+def test_expired_lease_is_redelivered_then_abandoned(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job, _ = store.create("hello")
+
+    assert store.claim("worker-1", visibility_timeout=-1).attempts == 1
+    assert store.claim("worker-2", visibility_timeout=-1, max_deliveries=2).attempts == 2
+    assert store.claim("worker-3", max_deliveries=2) is None
+    assert store.get(job["id"])["status"] == FAILED
+
+
+def test_queued_job_past_its_deadline_is_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job, _ = store.create("hello", deadline_at=1.0)
+
+    assert store.get(job["id"])["status"] == QUEUED
+    assert store.claim("worker-1") is None
+    failed = store.get(job["id"])
+    assert failed["status"] == FAILED and failed["code"] == 504
+
+
+# ---------------------------------------------------------------- redis
+
+
+@pytest.fixture
+def redis_stores(monkeypatch):
+    """Makes RedisJobStores that talk to one in-process fake Redis server."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # the store's Lua scripts
+    import redis
+    from app.redis_job_store import RedisJobStore
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url",
+                        lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    return lambda: RedisJobStore("redis://fake")
+
+
+def test_redis_idempotency_keys_are_per_tenant(redis_stores):
+    store = redis_stores()
+    first, created = store.create("hello", "key-1", tenant="acme")
+    again, created_again = store.create("hello", "key-1", tenant="acme")
+    other, created_other = store.create("hello", "key-1", tenant="globex")
+
+    assert created and not created_again and created_other
+    assert again["id"] == first["id"] != other["id"]
+    assert store.get(first["id"], tenant="globex") is None
+
+
+def test_redis_concurrent_creates_with_one_key_make_one_job(redis_stores):
+    stores = [redis_stores() for _ in range(8)]
+    start = threading.Barrier(len(stores))
+    results = []
+
+    def create(store):
+        start.wait()
+        results.append(store.create("hello", "key-1", tenant="acme"))
+
+    threads = [threading.Thread(target=create, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len({job["id"] for job, _ in results}) == 1
+    assert sum(created for _, created in results) == 1
+
+
+def test_redis_claim_and_acknowledge(redis_stores):
+    store = redis_stores()
+    job, _ = store.create("hello")
+    claim = store.claim("worker-1")
+
+    assert claim.job_id == job["id"] and claim.prompt == "hello" and claim.attempts == 1
+    assert store.get(job["id"])["status"] == RUNNING
+    assert store.claim("worker-2") is None
+    assert not store.extend(job["id"], "worker-2")
+    assert store.extend(job["id"], "worker-1")
+    assert not store.complete(job["id"], "answer", owner="worker-2")
+    assert store.complete(job["id"], "answer", owner="worker-1")
+    assert store.get(job["id"])["answer"] == "answer"
+
+
+def test_redis_expired_lease_is_redelivered_then_abandoned(redis_stores):
+    store = redis_stores()
+    job, _ = store.create("hello")
+
+    assert store.claim("worker-1", visibility_timeout=-1).attempts == 1
+    assert store.claim("worker-2", visibility_timeout=-1, max_deliveries=2).attempts == 2
+    assert store.claim("worker-3", max_deliveries=2) is None
+    assert store.get(job["id"])["status"] == FAILED
+    # Failed claims expire like acknowledged jobs instead of staying forever.
+    assert store._redis.ttl(store._job_prefix + job["id"]) > 0
+
+
+def test_redis_queued_job_past_its_deadline_is_failed(redis_stores):
+    store = redis_stores()
+    job, _ = store.create("hello", deadline_at=1.0)
+
+    assert store.claim("worker-1") is None
+    failed = store.get(job["id"])
+    assert failed["status"] == FAILED and failed["code"] == 504
+    assert store._redis.ttl(store._job_prefix + job["id"]) > 0
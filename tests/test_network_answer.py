@@ -0,0 +1,105 @@
+# test_network_answer.py
+"""
+The network answer path (_read_response_from_network) against a scripted
+driver: every in-page wait advances one step, adding that step's events to
+the performance log and returning that step's page state.
+"""
+import base64
+import json
+
+from app.network_monitor import NetworkMonitor
+from app.selenium_service import _read_response_from_network
+
+
+def event(method, params):
+    return {"message": json.dumps({"message": {"method": method, "params": params}})}
+
+
+def data(text):
+    return event("Network.dataReceived", {"requestId": "1", "data": base64.b64encode(text.encode()).decode()})
+
+
+REQUEST = event("Network.requestWillBeSent", {"requestId": "1", "request": {
+    "method": "POST", "url": "https://chatgpt.com/backend-api/f/conversation"}})
+LOADED = event("Network.loadingFinished", {"requestId": "1"})
+ADD = 'data: {"p": "", "o": "add", "v": {"message": {"author": {"role": "assistant"}, "content": {"parts": [""]}}}}\n\n'
+
+
+def append(text):
+    return data(f'data: {json.dumps({"p": "/message/content/parts/0", "o": "append", "v": text})}\n\n')
+
+
+class ScriptedDriver:
+    def __init__(self, steps, can_stream=True, body=None):
+        self.steps = list(steps)
+        self.can_stream = can_stream
+        self.body = body
+        self.log = []
+        self.waits = []
+
+    def get_log(self, kind):
+        entries, self.log = self.log, []
+        return entries
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == "Network.streamResourceContent":
+            if not self.can_stream:
+                raise Exception("'Network.streamResourceContent' wasn't found")
+            return {}
+        if cmd == "Network.getResponseBody":
+            if self.body is None:
+                raise Exception("No resource with given identifier found")
+            return {"body": self.body, "base64Encoded": False}
+
+    def execute_async_script(self, script, selector, busy, known_text, *args):
+        assert self.steps, "waited after the answer was complete"
+        events, page = self.steps.pop(0)
+        self.waits.append(known_text)
+        self.log += events
+        return {"present": bool(page.get("text")), "text": page.get("text", ""), "done": page.get("done", False),
+                "timed_out": False, "failed_status": None, "stream_ended": page.get("stream_ended", False)}
+
+
+def read(driver, on_progress=None):
+    return _read_response_from_network(driver, NetworkMonitor(driver), on_progress)
+
+
+def test_end_of_stream_ends_the_wait_before_the_page_finishes():
+    driver = ScriptedDriver([
+        ([REQUEST, data(ADD), append("Line one")], {"text": "Line one"}),
+        ([append("\nLine two"), data("data: [DONE]\n\n"), LOADED], {"text": "Line one Line two", "stream_ended": True}),
+    ])
+    assert read(driver) == "Line one\nLine two"
+    # After the first text, a plain caller waits for the end only.
+    assert driver.waits == ["", None]
+
+
+def test_streaming_callers_get_every_streamed_change():
+    driver = ScriptedDriver([
+        ([REQUEST, data(ADD), append("One")], {"text": "One"}),
+        ([append(" two")], {"text": "One two"}),
+        ([data("data: [DONE]\n\n")], {"text": "One two", "stream_ended": True}),
+    ])
+    progress = []
+    assert read(driver, progress.append) == "One two"
+    assert progress == ["One", "One two"]
+
+
+def test_full_body_is_read_when_chrome_cannot_stream():
+    body = ADD + 'data: {"p": "/message/content/parts/0", "o": "append", "v": "A\\nB"}\n\ndata: [DONE]\n\n'
+    driver = ScriptedDriver([
+        ([REQUEST], {"text": "A"}),
+        ([LOADED], {"text": "A B", "stream_ended": True}),
+    ], can_stream=False, body=body)
+    progress = []
+    assert read(driver, progress.append) == "A\nB"
+    # Until the body arrives, progress follows the page.
+    assert progress == ["A", "A B", "A\nB"]
+
+
+def test_page_is_read_when_neither_stream_nor_body_is_available():
+    driver = ScriptedDriver([
+        ([REQUEST], {"text": "A"}),
+        ([LOADED], {"text": "A B", "stream_ended": True}),
+    ], can_stream=False)
+    assert read(driver) is None
@@ -0,0 +1,73 @@
+# test_stream_capture.py
+import json
+
+from app.stream_capture import SSEParser, ConversationState
+
+
+def replay(*payloads) -> ConversationState:
+    """Feeds `payloads` as one SSE body, split at awkward points like real network chunks."""
+    body = "".join(f"data: {p if isinstance(p, str) else json.dumps(p)}\n\n" for p in payloads)
+    parser, state = SSEParser(), ConversationState()
+    for start in range(0, len(body), 7):
+        for event, data in parser.feed(body[start:start + 7]):
+            state.apply(event, data)
+    return state
+
+
+def message(role, parts, status="in_progress", content_type="text"):
+    return {"message": {"author": {"role": role}, "status": status,
+                        "content": {"content_type": content_type, "parts": parts}}}
+
+
+def test_parser_joins_frames_split_across_feeds():
+    parser = SSEParser()
+    assert parser.feed("event: delta\r\ndata: {\"a\"") == []
+    assert parser.feed(": 1}\r\n\r\ndata: x\ndata: y\n\n") == [("delta", '{"a": 1}'), ("message", "x\ny")]
+
+
+def test_whole_message_events():
+    state = replay(
+        message("user", ["the question"]),
+        message("assistant", ["Hel"]),
+        message("assistant", ["Hello", " there"]),
+        message("assistant", ["Hello there"], status="finished_successfully"),
+        "[DONE]",
+    )
+    assert state.text == "Hello there"
+    assert state.message_done and state.done
+
+
+def test_whole_message_ignores_tool_output():
+    state = replay(
+        message("assistant", ["Answer"]),
+        message("tool", ["search results"]),
+        message("assistant", ["thinking"], content_type="thoughts"),
+    )
+    assert state.text == "Answer"
+
+
+def test_json_patch_deltas():
+    state = replay(
+        {"p": "", "o": "add", "v": message("user", ["the question"])},
+        {"p": "", "o": "add", "v": message("assistant", [""])},
+        {"p": "/message/content/parts/0", "o": "append", "v": "Hel"},
+        {"v": "lo"},
+        {"o": "patch", "v": [
+            {"p": "/message/content/parts/0", "o": "append", "v": " the"},
+            {"p": "/message/metadata", "o": "add", "v": {}},
+        ]},
+        {"v": "re"},
+        {"p": "/message/status", "o": "replace", "v": "finished_successfully"},
+        {"type": "message_stream_complete"},
+    )
+    assert state.text == "Hello there"
+    assert state.message_done and state.done
+
+
+def test_json_patch_ignores_deltas_of_other_messages():
+    state = replay(
+        {"p": "", "o": "add", "v": message("assistant", ["Answer"])},
+        {"p": "", "o": "add", "v": message("tool", [""])},
+        {"p": "/message/content/parts/0", "o": "append", "v": "tool text"},
+    )
+    assert state.text == "Answer"
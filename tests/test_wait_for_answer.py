@@ -0,0 +1,235 @@
+# test_wait_for_answer.py
+"""
+The in-page answer wait (_WAIT_FOR_ANSWER_JS) must call back by maxWaitMs
+even while the answer keeps streaming; the SharedBrowser tab slicing and
+every WebDriver script timeout depend on it.
+
+The script runs in Node against a minimal DOM stand-in. The same checks run
+in Chrome against the mock chat server when a browser can be started.
+"""
+import json
+import shutil
+import subprocess
+import threading
+import time
+import pytest
+from selenium.webdriver.remote.command import Command
+from app.selenium_service import _WAIT_FOR_ANSWER_JS, ANSWER_SELECTOR, ANSWER_BUSY_SELECTOR, wait_for_answer_event
+from app.stream_capture import ANSWER_STREAM_URL_PATTERN
+
+# Renders `text N` into the answer every `mutate_every_ms` for `mutate_for_ms`,
+# with the busy indicator shown until then, and prints the script's result.
+# With `stream_ends_at_ms`, the conversation response finishes loading then.
+_NODE_HARNESS = """
+const [script, args, plan] = JSON.parse(require("fs").readFileSync(0, "utf8"));
+let text = "";
+let busy = true;
+const observers = [];
+global.MutationObserver = class {
+    constructor(callback) { this.callback = callback; observers.push(this); }
+    observe() {}
+    disconnect() { this.off = true; }
+};
+global.document = {
+    body: {},
+    querySelectorAll: () => text ? [{innerText: text}] : [],
+    querySelector: () => busy ? {} : null,
+};
+global.window = {};
+if (plan.stream_ends_at_ms !== null) {
+    window.PerformanceObserver = global.PerformanceObserver = class {
+        constructor(callback) { this.callback = callback; }
+        observe() {
+            setTimeout(() => this.callback({getEntries: () => [
+                {name: "https://chatgpt.com/backend-api/conversation", responseStatus: 200},
+            ]}), plan.stream_ends_at_ms);
+        }
+        disconnect() {}
+    };
+}
+const started = Date.now();
+let n = 0;
+const mutations = setInterval(() => {
+    if (Date.now() - started >= plan.mutate_for_ms) {
+        busy = false;
+        clearInterval(mutations);
+        return;
+    }
+    text = "token " + (++n);
+    observers.filter(o => !o.off).forEach(o => o.callback([]));
+}, plan.mutate_every_ms);
+new Function(script).apply(null, [...args, (result) => {
+    console.log(JSON.stringify({elapsed_ms: Date.now() - started, result: result}));
+    process.exit(0);
+}]);
+"""
+
+
+def run_in_node(known_text, quiet_ms, max_wait_ms, mutate_every_ms, mutate_for_ms, stream_ends_at_ms=None):
+    if shutil.which("node") is None:
+        pytest.skip("node is not installed")
+    stream_pattern = ANSWER_STREAM_URL_PATTERN if stream_ends_at_ms is not None else None
+    args = [ANSWER_SELECTOR, ANSWER_BUSY_SELECTOR, known_text, quiet_ms, max_wait_ms, None, stream_pattern]
+    plan = {"mutate_every_ms": mutate_every_ms, "mutate_for_ms": mutate_for_ms, "stream_ends_at_ms": stream_ends_at_ms}
+    completed = subprocess.run(["node", "-e", _NODE_HARNESS], input=json.dumps([_WAIT_FOR_ANSWER_JS, args, plan]),
+                               capture_output=True, text=True, timeout=30)
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout)
+
+
+def test_max_wait_holds_while_answer_keeps_streaming():
+    # Tokens every 100 ms never leave a 750 ms quiet window.
+    outcome = run_in_node(None, 750, 1000, mutate_every_ms=100, mutate_for_ms=5000)
+    assert outcome["elapsed_ms"] < 1400
+    assert outcome["result"]["timed_out"] is True
+    assert outcome["result"]["done"] is False
+    assert outcome["result"]["text"].startswith("token")
+
+
+def test_max_wait_holds_for_change_waits_too():
+    # Changes are debounced for 150 ms, so tokens every 100 ms only release the wait at maxWaitMs
+    # (reporting the changed text).
+    outcome = run_in_node("", 750, 1000, mutate_every_ms=100, mutate_for_ms=5000)
+    assert outcome["elapsed_ms"] < 1400
+    assert outcome["result"]["text"].startswith("token")
+
+
+def test_change_wait_returns_on_new_text():
+    outcome = run_in_node("", 750, 5000, mutate_every_ms=250, mutate_for_ms=5000)
+    assert outcome["elapsed_ms"] < 1000
+    assert outcome["result"]["timed_out"] is False
+    assert outcome["result"]["text"] == "token 1"
+
+
+def test_finishes_after_quiet_window():
+    outcome = run_in_node(None, 300, 5000, mutate_every_ms=50, mutate_for_ms=500)
+    assert outcome["result"]["done"] is True
+    assert 500 <= outcome["elapsed_ms"] < 2000
+
+
+def test_end_of_the_response_ends_the_wait():
+    # The page would only call the answer finished after its quiet window; the response ending does it now.
+    outcome = run_in_node(None, 750, 5000, mutate_every_ms=50, mutate_for_ms=500, stream_ends_at_ms=520)
+    assert outcome["elapsed_ms"] < 700
+    assert outcome["result"]["stream_ended"] is True
+    assert outcome["result"]["done"] is False
+
+
+# ---------------------------------------------------------------- shared browser
+
+
+class _SliceDriver:
+    """Stands in for Chrome: every in-page wait holds the session for its full max wait."""
+
+    current_window_handle = "tab-0"
+
+    def __init__(self):
+        self.opened = 0
+
+    def execute(self, command, params=None):
+        if command == Command.NEW_WINDOW:
+            self.opened += 1
+            return {"value": {"handle": f"tab-{self.opened}"}}
+        if command == Command.W3C_EXECUTE_SCRIPT_ASYNC:
+            time.sleep(params["args"][4] / 1000)
+            return {"value": {"present": True, "text": "streaming", "done": False, "timed_out": True}}
+        return {"value": None}
+
+    def execute_async_script(self, script, *args):
+        return self.execute(Command.W3C_EXECUTE_SCRIPT_ASYNC, {"script": script, "args": list(args)})["value"]
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+
+def follow_tabs(tabs, seconds):
+    """Runs answer waits on every tab at once; returns the return times per tab."""
+    returns = {i: [] for i in range(len(tabs))}
+    stop = time.monotonic() + seconds
+
+    def follow(i):
+        while time.monotonic() < stop:
+            result = wait_for_answer_event(tabs[i], timeout=30)
+            returns[i].append(time.monotonic())
+            if result["done"]:
+                return
+
+    threads = [threading.Thread(target=follow, args=(i,)) for i in range(len(tabs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(seconds + 10)
+    return returns
+
+
+def test_tabs_take_turns_on_a_shared_browser():
+    from app.tab_driver import SharedBrowser
+    browser = SharedBrowser(_SliceDriver(), capacity=2)
+    tabs = [browser.open_tab(), browser.open_tab()]
+    for tab in tabs:
+        tab.wait_slice_secs = 0.1
+    returns = follow_tabs(tabs, 1.5)
+    # Each wait gives the session up after one slice, so the tabs alternate.
+    for times in returns.values():
+        assert len(times) >= 5
+        assert max(b - a for a, b in zip(times, times[1:])) < 0.5
+
+
+# ---------------------------------------------------------------- real browser
+
+
+@pytest.fixture(scope="module")
+def slow_stream_page():
+    """Mock chat server streaming 60 tokens at 8/s (about 7.5 s per answer)."""
+    from app.mock_chat_server import start_mock_server
+    server, base_url = start_mock_server(token_rate=8, answer_tokens=60, first_token_delay=0.2)
+    yield base_url
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def chrome():
+    try:
+        from selenium import webdriver
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless=new")
+        driver = webdriver.Chrome(options=options)
+    except Exception as e:
+        pytest.skip(f"Chrome is not available: {e}")
+    yield driver
+    driver.quit()
+
+
+def start_answer(driver, url):
+    driver.get(url)
+    driver.execute_script("send(arguments[0]); return null;", "slow stream")
+
+
+def test_browser_wait_returns_each_slice_during_long_stream(chrome, slow_stream_page):
+    start_answer(chrome, slow_stream_page)
+    returns = []
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        result = wait_for_answer_event(chrome, timeout=1.0)
+        returns.append(time.monotonic() - started)
+        if result["done"]:
+            break
+    assert result["done"] is True
+    # Several slices passed while the answer was still streaming, none much longer than the slice.
+    assert len(returns) >= 4
+    assert max(returns[:-1]) < 2.0
+
+
+def test_browser_tabs_streaming_at_once_both_make_progress(chrome, slow_stream_page):
+    from app.tab_driver import SharedBrowser
+    browser = SharedBrowser(chrome, capacity=2)
+    tabs = [browser.open_tab(), browser.open_tab()]
+    for tab in tabs:
+        tab.wait_slice_secs = 1.0
+        start_answer(tab, slow_stream_page)
+    returns = follow_tabs(tabs, 30)
+    # Each tab got the browser back several times while both answers were streaming.
+    first_done = min(times[-1] for times in returns.values())
+    for times in returns.values():
+        assert sum(1 for at in times if at < first_done) >= 3